@@ -0,0 +1,180 @@
+import os
+import json
+import hashlib
+
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+from annotation_store import (AnnotationStore, camera_digest, camera_from_dict, index_json_objects,
+                              load_annotations, read_json_span, source_signature)
+
+# 本模块的作用：
+# 1. 监视 Old/New JSON 文件：QFileSystemWatcher 同时监视文件和所在目录，原地写入和“写临时文件再改名”都能发现；
+#    事件后每隔 RELOAD_DEBOUNCE_MS 检查一次 size/mtime，连续两次相同（写入已结束）才触发重新加载
+# 2. reload_json 在后台线程中运行：重新建立字节索引，按相机对原始字节求哈希并与上次比较；
+#    只解析哈希变化且已在内存中的相机，再用内容哈希（camera_digest）排除只改了格式的相机，
+#    未解析的相机只记为变化，之后按需从新文件懒加载
+# 3. 结果由界面线程通过 source.apply_reload 一次性换入（见 annotation_store），未变化的相机对象保持不变，
+#    它们的统计/对比缓存继续有效
+
+RELOAD_DEBOUNCE_MS = 500
+# 重新加载失败（例如写坏或截断的 JSON）后，隔这么久再检查并重试
+RELOAD_RETRY_MS = 5000
+# 检查文件是否写完整时读取的结尾字节数
+TAIL_BYTES = 64
+
+
+class ReloadError(RuntimeError):
+    pass
+
+
+class ReloadResult:
+    def __init__(self, index, parsed, changed, raw_digests, signature, replacement=None):
+        # 新的字节索引（相机 -> 字节范围）
+        self.index = index
+        # 新解析的相机 -> CameraAnnotations（只包含内容变化且原来已在内存中的相机）
+        self.parsed = parsed
+        # 内容变化、新增或删除的相机名
+        self.changed = changed
+        # 相机 -> 原始字节哈希，供下次比较
+        self.raw_digests = raw_digests
+        self.signature = signature
+        # 原来没有数据时直接整体替换的新标注源
+        self.replacement = replacement
+
+
+def _signature(path):
+    try:
+        return source_signature(path)
+    except OSError:
+        return None
+
+
+def _check_complete(path):
+    # 顶层对象必须以 } 结尾，否则文件还没写完
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - TAIL_BYTES))
+        tail = f.read().rstrip()
+    if not tail.endswith(b"}"):
+        raise ReloadError(f"{path} is incomplete")
+
+
+def reload_json(path, source, raw_digests=None):
+    # 在后台线程中运行；文件与 source 已对应时返回 None
+    signature = _signature(path)
+    if signature is None:
+        raise ReloadError(f"{path} not found")
+    if signature == getattr(source, "signature", None):
+        return None
+    _check_complete(path)
+
+    if not source:
+        # 原来没有数据（文件缺失或加载失败）：按首次加载处理
+        replacement = load_annotations(path)
+        return ReloadResult(None, {}, set(replacement), None, signature, replacement=replacement)
+
+    index = index_json_objects(path)
+    # 内存映射的 .store 源包含所有相机，变化的相机必须解析后换入
+    eager = isinstance(source, AnnotationStore)
+    digests = {}
+    parsed = {}
+    changed = set()
+    for name, (start, end) in index.items():
+        raw = read_json_span(path, start, end)
+        digest = hashlib.sha1(raw).hexdigest()
+        digests[name] = digest
+        if raw_digests is not None and raw_digests.get(name) == digest:
+            continue
+
+        old_cam = source.cached(name) if name in source else None
+        if old_cam is None and not eager:
+            changed.add(name)
+            continue
+        cam = camera_from_dict(json.loads(raw) or {})
+        if old_cam is not None and camera_digest(cam) == camera_digest(old_cam):
+            continue
+        parsed[name] = cam
+        changed.add(name)
+    changed.update(name for name in source if name not in index)
+
+    if _signature(path) != signature:
+        raise ReloadError(f"{path} changed during reload")
+    return ReloadResult(index, parsed, changed, digests, signature)
+
+
+class AnnotationFileWatcher(QObject):
+    # 文件变化且写入结束后发出 (标签, 路径)
+    changed = pyqtSignal(str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self._on_path_event)
+        self.watcher.directoryChanged.connect(self._on_path_event)
+        # 标签 -> 路径 / 已加载数据对应的签名
+        self.paths = {}
+        self.signatures = {}
+        # 标签 -> 上次检查时看到的新签名（尚未稳定）
+        self._pending = {}
+        # 标签 -> 已发出 changed、正在重新加载的签名；重新加载成功后才记入 signatures
+        self._in_flight = {}
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._check)
+
+    def watch(self, label, path, signature):
+        self.paths[label] = os.path.abspath(path)
+        self.signatures[label] = signature
+        self._pending.pop(label, None)
+        self._in_flight.pop(label, None)
+        self._add_paths()
+        # 建立索引期间文件已被改写（此前可能还没有监视）：按正常流程等写入稳定后发出 changed
+        if signature is not None and _signature(path) not in (None, signature):
+            self.timer.start(RELOAD_DEBOUNCE_MS)
+
+    def set_signature(self, label, signature):
+        # 重新加载成功后调用
+        self.signatures[label] = signature
+        self._in_flight.pop(label, None)
+
+    def reload_failed(self, label):
+        # 签名保持为已加载数据的值，稍后再检查：文件仍与已加载数据不同就重试
+        self._in_flight.pop(label, None)
+        if not self.timer.isActive():
+            self.timer.start(RELOAD_RETRY_MS)
+
+    def _add_paths(self):
+        wanted = set()
+        for path in self.paths.values():
+            directory = os.path.dirname(path)
+            if os.path.isdir(directory):
+                wanted.add(directory)
+            if os.path.exists(path):
+                wanted.add(path)
+        current = set(self.watcher.files()) | set(self.watcher.directories())
+        missing = [path for path in wanted if path not in current]
+        if missing:
+            self.watcher.addPaths(missing)
+
+    def _on_path_event(self, path):
+        # 改名替换后原文件的监视会失效，重新添加
+        self._add_paths()
+        self.timer.start(RELOAD_DEBOUNCE_MS)
+
+    def _check(self):
+        unstable = False
+        for label, path in self.paths.items():
+            signature = _signature(path)
+            if signature is None or signature in (self.signatures.get(label), self._in_flight.get(label)):
+                self._pending.pop(label, None)
+                continue
+            if self._pending.get(label) != signature:
+                # 与上次检查不同：可能仍在写入，稍后再看
+                self._pending[label] = signature
+                unstable = True
+                continue
+            del self._pending[label]
+            self._in_flight[label] = signature
+            self.changed.emit(label, path)
+        if unstable:
+            self.timer.start(RELOAD_DEBOUNCE_MS)
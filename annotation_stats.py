@@ -0,0 +1,100 @@
+import numpy as np
+
+# 本模块的作用：
+# 1. 基于 CameraAnnotations 的 offsets/boxes 数组，一次性向量化计算每帧统计：
+#    框数量、框总面积、最小/最大框面积
+# 2. 计算每个相机的汇总统计（总框数、有框帧数、单帧最大框数等）
+# 3. StatsCache 按（标注源, 相机）缓存结果，标注源对象被替换时自动失效，
+#    也可以按标注源/相机手动失效
+# 直方图（labeling_app / batch_generate_histograms）直接使用这些数组，切换视频时不再逐帧查询 dict
+
+
+class CameraStats:
+    # 每帧数组下标 i 对应第 i+1 帧（1-based 帧号）
+    PER_FRAME = ("counts", "total_area", "min_area", "max_area")
+
+    def __init__(self, counts, total_area, min_area, max_area):
+        self.counts = counts
+        self.total_area = total_area
+        self.min_area = min_area
+        self.max_area = max_area
+        self.n_frames = len(counts)
+
+        nonempty = counts > 0
+        self.total_boxes = int(counts.sum())
+        self.frames_with_boxes = int(nonempty.sum())
+        self.max_count = int(counts.max()) if self.n_frames else 0
+        self.mean_count = self.total_boxes / self.frames_with_boxes if self.frames_with_boxes else 0.0
+        self.mean_area = float(total_area.sum()) / self.total_boxes if self.total_boxes else 0.0
+        self.min_box_area = int(min_area[nonempty].min()) if self.frames_with_boxes else 0
+        self.max_box_area = int(max_area[nonempty].max()) if self.frames_with_boxes else 0
+
+    def padded(self, name, total_frames):
+        # 取某个每帧数组，补零/截断到视频的 total_frames
+        values = getattr(self, name)
+        result = np.zeros(total_frames, dtype=values.dtype)
+        n = min(total_frames, self.n_frames)
+        result[:n] = values[:n]
+        return result
+
+    def summary(self):
+        return {
+            "total_boxes": self.total_boxes,
+            "frames_with_boxes": self.frames_with_boxes,
+            "max_count": self.max_count,
+            "mean_count": self.mean_count,
+            "mean_area": self.mean_area,
+            "min_box_area": self.min_box_area,
+            "max_box_area": self.max_box_area,
+        }
+
+
+def compute_camera_stats(cam):
+    offsets = np.asarray(cam.offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    n_frames = len(counts)
+    total_area = np.zeros(n_frames, dtype=np.int64)
+    min_area = np.zeros(n_frames, dtype=np.int64)
+    max_area = np.zeros(n_frames, dtype=np.int64)
+
+    boxes = np.asarray(cam.all_boxes(), dtype=np.int64)
+    if len(boxes):
+        areas = np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+        # 只对有框的帧做分段归约，空帧之间不含任何框，分段不会串帧
+        nonempty = counts > 0
+        starts = (offsets[:-1] - offsets[0])[nonempty]
+        total_area[nonempty] = np.add.reduceat(areas, starts)
+        min_area[nonempty] = np.minimum.reduceat(areas, starts)
+        max_area[nonempty] = np.maximum.reduceat(areas, starts)
+
+    return CameraStats(counts, total_area, min_area, max_area)
+
+
+class StatsCache:
+    def __init__(self):
+        # (id(source), camera_name) -> (source, CameraStats)
+        self._entries = {}
+
+    def get(self, source, camera_name, load=True):
+        # load=False 时只使用已解析的相机（UI 线程中不触发 JSON 解析），未就绪返回 None
+        if not source or not camera_name:
+            return None
+        key = (id(source), camera_name)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is source:
+            return entry[1]
+
+        cam = source.load_camera(camera_name) if load else source.cached(camera_name)
+        if cam is None:
+            return None
+        stats = compute_camera_stats(cam)
+        self._entries[key] = (source, stats)
+        return stats
+
+    def invalidate(self, source=None, camera_name=None):
+        for key, (entry_source, _) in list(self._entries.items()):
+            if source is not None and entry_source is not source:
+                continue
+            if camera_name is not None and key[1] != camera_name:
+                continue
+            del self._entries[key]
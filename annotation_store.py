@@ -0,0 +1,504 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import numpy as np
+
+from perf_trace import span, traced
+
+# 本模块的作用：
+# 1. 将 {视频: {帧号: [[x1,y1,x2,y2], ...]}} 格式的 JSON 标注转换为紧凑的列式存储
+# 2. 存储为 JSON 旁边的 `<name>.store/` 目录：
+#    - offsets.npy：int64，所有相机的帧偏移拼接在一起（每个相机 n_frames + 1 项）
+#    - boxes.npy：int32，形状 (N, 4)，所有检测框连续存放
+#    - meta.json：版本、源 JSON 的 size/mtime、相机名 -> (offsets 起点, 帧数)
+# 3. 通过 np.load(mmap_mode='r') 加载，按帧查询为 O(1) 的数组切片
+# 4. load_annotations 在存在“新鲜”的转换文件时自动使用，否则回退到按相机懒加载 JSON：
+#    单次流式扫描记录每个顶层相机 key 的字节范围，只在需要时解析该相机的子树，
+#    解析结果保存在有上限的 LRU 中
+# 5. 源 JSON 在磁盘上变化后（见 annotation_reload），apply_reload 原地替换变化的相机，
+#    未变化的相机对象保持不变；懒加载源在新索引换入前拒绝从已变化的文件中读取
+#
+# 用法：python annotation_store.py [json/annotations_old.json json/annotations_new.json]
+
+STORE_VERSION = 1
+STORE_SUFFIX = ".store"
+
+# 懒加载 JSON 时最多缓存的相机数量
+DEFAULT_MAX_CAMERAS = 8
+INDEX_CHUNK_SIZE = 1 << 20
+# 每个块末尾保留的余量，保证块内处理的字符串 token 完整（key 长度远小于该值）
+INDEX_TAIL = 1 << 16
+
+# 完整的 JSON 字符串或花括号；数字、方括号等由正则引擎直接跳过
+_TOKEN_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}]')
+_WS_RE = re.compile(rb'\s*')
+
+EMPTY_BOXES = np.zeros((0, 4), dtype=np.int32)
+EMPTY_BOXES.setflags(write=False)
+
+
+class StaleIndexError(RuntimeError):
+    # 懒加载源的字节索引与磁盘上的 JSON 不再对应（文件已变化，等待重新加载）
+    pass
+
+
+class CameraAnnotations(Mapping):
+    # 单个相机的标注：offsets[i-1]:offsets[i] 是第 i 帧（1-based）的框在 boxes 中的范围
+    # 同时实现 Mapping 接口（key 为帧号字符串），兼容原先按 dict 访问的代码
+
+    def __init__(self, offsets, boxes):
+        self.offsets = offsets
+        self.boxes = boxes
+        self.n_frames = max(len(offsets) - 1, 0)
+
+    def frame(self, frame_no):
+        if frame_no < 1 or frame_no > self.n_frames:
+            return EMPTY_BOXES
+        return self.boxes[self.offsets[frame_no - 1]:self.offsets[frame_no]]
+
+    def counts(self, total_frames=None):
+        # 每帧框数量，长度补齐/截断到 total_frames
+        counts = np.diff(np.asarray(self.offsets, dtype=np.int64))
+        if total_frames is None:
+            return counts
+        result = np.zeros(total_frames, dtype=np.int64)
+        n = min(total_frames, len(counts))
+        result[:n] = counts[:n]
+        return result
+
+    def all_boxes(self):
+        if self.n_frames == 0:
+            return EMPTY_BOXES
+        return self.boxes[self.offsets[0]:self.offsets[-1]]
+
+    def frame_numbers(self):
+        # 有标注的帧号（1-based）
+        return np.flatnonzero(self.counts()) + 1
+
+    def __getitem__(self, key):
+        try:
+            frame_no = int(key)
+        except (TypeError, ValueError):
+            raise KeyError(key)
+        if frame_no < 1 or frame_no > self.n_frames:
+            raise KeyError(key)
+        start, end = self.offsets[frame_no - 1], self.offsets[frame_no]
+        if start == end:
+            raise KeyError(key)
+        return self.boxes[start:end]
+
+    def __iter__(self):
+        for frame_no in self.frame_numbers():
+            yield str(frame_no)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.counts()))
+
+
+class AnnotationStore(Mapping):
+    # 相机名 -> CameraAnnotations
+
+    def __init__(self, cameras=None, path=None, signature=None):
+        self.cameras = dict(cameras or {})
+        self.path = path
+        # 数据对应的源 JSON 签名（size/mtime），未知时为 None
+        self.signature = signature
+
+    def __getitem__(self, camera_name):
+        return self.cameras[camera_name]
+
+    def __iter__(self):
+        return iter(self.cameras)
+
+    def __len__(self):
+        return len(self.cameras)
+
+    # 与 LazyJsonAnnotations 相同的接口：数据已全部可用
+    def cached(self, camera_name):
+        return self.cameras.get(camera_name)
+
+    def load_camera(self, camera_name):
+        return self.cameras.get(camera_name)
+
+    def peek_camera(self, camera_name):
+        return self.cameras.get(camera_name)
+
+    def apply_reload(self, index, parsed, changed, signature):
+        # 按新文件的相机顺序组装，变化的相机用新解析的数据，其余沿用原对象；整体替换字典
+        cameras = {}
+        for name in index:
+            cam = parsed.get(name)
+            if cam is None and name not in changed:
+                cam = self.cameras.get(name)
+            if cam is not None:
+                cameras[name] = cam
+        self.cameras = cameras
+        self.signature = signature
+
+    @classmethod
+    def from_dict(cls, data, path=None):
+        return cls({name: camera_from_dict(frames) for name, frames in data.items()}, path=path)
+
+    @classmethod
+    @traced("open_store")
+    def open(cls, store_dir):
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        offsets = _load_array(os.path.join(store_dir, "offsets.npy"))
+        boxes = _load_array(os.path.join(store_dir, "boxes.npy"))
+        cameras = {}
+        for name, base, n_frames in meta["cameras"]:
+            cameras[name] = CameraAnnotations(offsets[base:base + n_frames + 1], boxes)
+        return cls(cameras, path=store_dir, signature=meta.get("source"))
+
+
+class LazyJsonAnnotations(Mapping):
+    # 按相机懒加载的 JSON 标注：构造时只建立字节偏移索引，load_camera 时才解析对应子树
+
+    def __init__(self, path, max_cameras=DEFAULT_MAX_CAMERAS, progress=None):
+        self.path = path
+        self.max_cameras = max_cameras
+        # 在建立索引之前记录签名：索引期间文件被改写时，签名不再匹配，等待重新加载
+        self.signature = source_signature(path)
+        self.index = index_json_objects(path, progress)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次 apply_reload 递增，换入新索引之前开始的解析结果不进入缓存
+        self._generation = 0
+
+    def cached(self, camera_name):
+        # 只返回已解析的相机，不触发解析（供 UI 线程使用）
+        with self._lock:
+            cam = self._cache.get(camera_name)
+            if cam is not None:
+                self._cache.move_to_end(camera_name)
+            return cam
+
+    def is_loaded(self, camera_name):
+        with self._lock:
+            return camera_name in self._cache
+
+    def load_camera(self, camera_name):
+        cam = self.cached(camera_name)
+        if cam is not None:
+            return cam
+        parsed = self._parse(camera_name)
+        if parsed is None:
+            return None
+        cam, generation = parsed
+        with self._lock:
+            if generation != self._generation:
+                return self._cache.get(camera_name)
+            self._cache[camera_name] = cam
+            self._cache.move_to_end(camera_name)
+            while len(self._cache) > self.max_cameras:
+                self._cache.popitem(last=False)
+        return cam
+
+    def peek_camera(self, camera_name):
+        # 返回相机数据但不放入 LRU，批量统计时不会挤掉界面正在使用的相机
+        with self._lock:
+            cam = self._cache.get(camera_name)
+        if cam is not None:
+            return cam
+        parsed = self._parse(camera_name)
+        return parsed[0] if parsed is not None else None
+
+    def _parse(self, camera_name):
+        # 返回 (CameraAnnotations, 解析开始时的代号)，相机不存在时返回 None
+        with self._lock:
+            byte_range = self.index.get(camera_name)
+            signature = self.signature
+            generation = self._generation
+        if byte_range is None:
+            return None
+
+        with span("parse_camera", camera=camera_name):
+            raw = read_json_span(self.path, *byte_range)
+            # 读取后再检查签名：文件已变化时旧索引的字节范围可能落在其他相机的数据上
+            if _current_signature(self.path) != signature:
+                raise StaleIndexError(f"{self.path} changed on disk, waiting for reload")
+            frames = json.loads(raw) or {}
+            return camera_from_dict(frames), generation
+
+    def apply_reload(self, index, parsed, changed, signature):
+        # 换入新索引；未变化且已解析的相机保留在 LRU 中，变化的相机换成新解析的数据（未解析的按需懒加载）
+        with self._lock:
+            cache = OrderedDict()
+            for name, cam in self._cache.items():
+                if name in index and name not in changed:
+                    cache[name] = cam
+            for name, cam in parsed.items():
+                cache[name] = cam
+            while len(cache) > self.max_cameras:
+                cache.popitem(last=False)
+            self.index = index
+            self.signature = signature
+            self._cache = cache
+            self._generation += 1
+
+    def __getitem__(self, camera_name):
+        if camera_name not in self.index:
+            raise KeyError(camera_name)
+        return self.load_camera(camera_name)
+
+    def __contains__(self, camera_name):
+        # Mapping 默认通过 __getitem__ 判断，会触发解析
+        return camera_name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+
+@traced("index_json")
+def index_json_objects(path, progress=None):
+    # 单次流式扫描 JSON 顶层对象，返回 OrderedDict: key -> (value 起始字节, value 结束字节)
+    # value 范围可能带有结尾的逗号和空白，解析前需去掉
+    index = OrderedDict()
+    size = os.path.getsize(path)
+    depth = 0
+    current = None
+    base = 0
+    buf = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(INDEX_CHUNK_SIZE)
+            eof = not chunk
+            data = buf + chunk
+            limit = len(data) if eof else len(data) - INDEX_TAIL
+
+            last_end = 0
+            for m in _TOKEN_RE.finditer(data):
+                if m.start() >= limit:
+                    break
+                last_end = m.end()
+                tok = m.group()
+                if tok == b"{":
+                    depth += 1
+                elif tok == b"}":
+                    depth -= 1
+                    if depth == 0 and current is not None:
+                        index[current[0]] = (current[1], base + m.start())
+                        current = None
+                elif depth == 1:
+                    # 顶层对象中后面紧跟冒号的字符串才是 key
+                    j = _WS_RE.match(data, m.end()).end()
+                    if data[j:j + 1] == b":":
+                        if current is not None:
+                            index[current[0]] = (current[1], base + m.start())
+                        current = (json.loads(tok), base + j + 1)
+
+            if eof:
+                break
+            cut = max(last_end, limit, 0)
+            buf = data[cut:]
+            base += cut
+            if progress is not None and size:
+                progress(min(base / size, 1.0))
+
+    if progress is not None:
+        progress(1.0)
+    return index
+
+
+def read_json_span(path, start, end):
+    # 读取 index_json_objects 记录的 value 字节范围，去掉结尾的逗号和空白
+    with open(path, "rb") as f:
+        f.seek(start)
+        raw = f.read(end - start)
+    raw = raw.rstrip()
+    if raw.endswith(b","):
+        raw = raw[:-1]
+    return raw
+
+
+def _load_array(path):
+    # 空数组无法 mmap，直接读入
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        return np.load(path)
+
+
+def camera_from_dict(frames):
+    # {帧号字符串: [[x1,y1,x2,y2], ...]} -> CameraAnnotations
+    items = []
+    for key, boxes in frames.items():
+        try:
+            frame_no = int(key)
+        except (TypeError, ValueError):
+            continue
+        if frame_no >= 1:
+            items.append((frame_no, boxes or []))
+    if not items:
+        return CameraAnnotations(np.zeros(1, dtype=np.int64), EMPTY_BOXES)
+
+    items.sort(key=lambda item: item[0])
+    max_frame = items[-1][0]
+    counts = np.zeros(max_frame, dtype=np.int64)
+    flat = []
+    for frame_no, boxes in items:
+        valid = [b[:4] for b in boxes if len(b) >= 4]
+        counts[frame_no - 1] += len(valid)
+        flat.extend(valid)
+
+    offsets = np.zeros(max_frame + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    if flat:
+        boxes = np.asarray(flat, dtype=np.int32).reshape(-1, 4)
+    else:
+        boxes = EMPTY_BOXES
+    return CameraAnnotations(offsets, boxes)
+
+
+def camera_digest(cam):
+    # 单个相机标注内容的哈希（与偏移基址无关），用于判断相机数据是否变化
+    if cam is None:
+        return None
+    offsets = np.asarray(cam.offsets, dtype=np.int64)
+    h = hashlib.sha1()
+    h.update((offsets - offsets[0]).tobytes() if len(offsets) else b"")
+    h.update(np.ascontiguousarray(cam.all_boxes(), dtype=np.int32).tobytes())
+    return h.hexdigest()
+
+
+def store_path_for(json_path):
+    return os.path.splitext(json_path)[0] + STORE_SUFFIX
+
+
+def source_signature(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _current_signature(path):
+    try:
+        return source_signature(path)
+    except OSError:
+        return None
+
+
+def store_matches(store_dir, source):
+    # 转换文件完整、版本一致且记录的源签名与 source 相同
+    meta_path = os.path.join(store_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get("version") == STORE_VERSION and meta.get("source") == source
+
+
+def is_store_fresh(json_path, store_dir=None):
+    store_dir = store_dir or store_path_for(json_path)
+    if not os.path.exists(json_path):
+        return False
+    return store_matches(store_dir, source_signature(json_path))
+
+
+def write_store(store, store_dir, source=None):
+    # 先写数组，最后写 meta.json：meta 存在即表示转换完整
+    os.makedirs(store_dir, exist_ok=True)
+    meta_path = os.path.join(store_dir, "meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    offsets_parts = []
+    boxes_parts = []
+    cameras_meta = []
+    base = 0
+    box_base = 0
+    for name, cam in store.items():
+        cam_offsets = np.asarray(cam.offsets, dtype=np.int64)
+        cam_boxes = np.asarray(cam.all_boxes(), dtype=np.int32)
+        # 偏移改写为全局 boxes 数组中的绝对位置
+        offsets_parts.append(cam_offsets - cam_offsets[0] + box_base)
+        boxes_parts.append(cam_boxes)
+        cameras_meta.append([name, base, cam.n_frames])
+        base += len(cam_offsets)
+        box_base += len(cam_boxes)
+
+    offsets = np.concatenate(offsets_parts) if offsets_parts else np.zeros(0, dtype=np.int64)
+    boxes = np.concatenate(boxes_parts) if boxes_parts else EMPTY_BOXES
+    for file_name, array in (("offsets.npy", offsets), ("boxes.npy", boxes)):
+        tmp_path = os.path.join(store_dir, file_name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(store_dir, file_name))
+
+    meta = {"version": STORE_VERSION, "source": source, "cameras": cameras_meta}
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def convert_json(json_path, store_dir=None):
+    store_dir = store_dir or store_path_for(json_path)
+    source = source_signature(json_path)
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    write_store(AnnotationStore.from_dict(data), store_dir, source=source)
+    return store_dir
+
+
+def load_annotations(json_path, max_cameras=DEFAULT_MAX_CAMERAS, progress=None):
+    # 优先使用新鲜的转换文件，否则按相机懒加载 JSON
+    # progress(fraction) 在建立索引期间被调用
+    if not os.path.exists(json_path):
+        print(f"Warning: {json_path} not found.")
+        return AnnotationStore()
+
+    store_dir = store_path_for(json_path)
+    if is_store_fresh(json_path, store_dir):
+        return AnnotationStore.open(store_dir)
+
+    return LazyJsonAnnotations(json_path, max_cameras=max_cameras, progress=progress)
+
+
+def prepare_store(json_path, label, temp_dir):
+    # 确保 JSON 有新鲜的 .store（供工作进程内存映射），JSON 目录不可写时转换到临时目录
+    if not os.path.exists(json_path):
+        print(f"Warning: {label} JSON not found at {json_path}")
+        return None
+    store_dir = store_path_for(json_path)
+    if is_store_fresh(json_path, store_dir):
+        return store_dir
+    print(f"Converting {label} JSON {json_path} ...")
+    try:
+        return convert_json(json_path, store_dir)
+    except OSError:
+        return convert_json(json_path, os.path.join(temp_dir, label + ".store"))
+
+
+def open_store(store_dir):
+    return AnnotationStore.open(store_dir) if store_dir else AnnotationStore()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        base_dir = os.getcwd()
+        argv = [os.path.join(base_dir, "json", "annotations_old.json"),
+                os.path.join(base_dir, "json", "annotations_new.json")]
+
+    for json_path in argv:
+        if not os.path.exists(json_path):
+            print(f"Warning: {json_path} not found, skipped.")
+            continue
+        store_dir = convert_json(json_path)
+        print(f"Converted {json_path} -> {store_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,147 +1,322 @@
 import os
+import sys
 import json
-import cv2
-import matplotlib.pyplot as plt
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.colors import LogNorm
+from matplotlib.ticker import MaxNLocator
+
+from annotation_store import camera_digest, open_store, prepare_store
+from annotation_stats import compute_camera_stats
+from perf_trace import TRACER, span, traced
+from spatial_heatmap import HEATMAP_CELL, compute_heatmap, heatmap_shape, survival_ratio
+from video_metadata import scan_metadata, verify_frame_count
 
 # 本脚本的作用：
 # 1. 批量生成视频的直方图，展示不同数据在每帧中的框数量
-# 2. 生成的直方图将保存为 PNG 格式，文件名与视频文件相同
+# 2. 生成的直方图文件名与视频文件相同（加 _histogram 后缀），格式与 DPI 可配置
+# 3. 多进程并行渲染（Agg 后端，不使用 pyplot 全局状态）；标注数据先转换为 .store，
+#    各进程以只读内存映射方式共享，而不是为每个任务 pickle 一份
+# 4. 视频帧数来自元数据缓存（见 video_metadata），不再逐个打开视频；帧数可疑时用标注最大帧号校验
+# 5. 输出目录中的 manifest 记录每个输出对应的输入（相机标注内容哈希、视频 size/mtime、DPI），
+#    输入未变化的视频直接跳过
+# 6. --trace 时记录各阶段耗时（见 perf_trace），工作进程的记录随结果交回，合并导出为 Chrome trace JSON
+# 7. --heatmaps 时同时导出每个视频的空间热力图（Old 密度 / New 密度 / New 保留比例，见 spatial_heatmap），
+#    文件名加 _heatmap 后缀，与直方图共用 manifest 跳过逻辑
+#
+# 用法：python batch_generate_histograms.py <视频文件夹> [--old-json ...] [--new-json ...]
+#       [--output histograms_output] [--workers N] [--format png] [--dpi 100] [--force] [--heatmaps]
+#       [--trace trace.json]
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_NAME = ".histograms_manifest.json"
+MAIN_PID = os.getpid()
+
+# 工作进程中的只读标注源（由 _init_worker 打开）
+_worker_sources = {}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批量生成视频的检测框数量直方图 (Old vs New)")
+    parser.add_argument("video_folder", help="包含 .avi 视频的文件夹")
+    parser.add_argument("--old-json", default=os.path.join(PROJECT_ROOT, "json", "annotations_old.json"),
+                        help="Old 标注 JSON 路径")
+    parser.add_argument("--new-json", default=os.path.join(PROJECT_ROOT, "json", "annotations_new.json"),
+                        help="New 标注 JSON 路径")
+    parser.add_argument("-o", "--output", default=os.path.join(PROJECT_ROOT, "histograms_output"),
+                        help="输出目录")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    parser.add_argument("--format", default="png", choices=["png", "jpg", "svg", "pdf"], help="输出格式")
+    parser.add_argument("--dpi", type=int, default=100, help="输出 DPI")
+    parser.add_argument("--force", action="store_true", help="忽略 manifest，全部重新生成")
+    parser.add_argument("--heatmaps", action="store_true", help="同时导出每个视频的空间热力图")
+    parser.add_argument("--trace", help="把各阶段耗时导出为 Chrome trace JSON")
+    return parser.parse_args(argv)
+
+
+def _init_worker(old_store_dir, new_store_dir, trace=False):
+    # fork 出的工作进程带有主进程已记录的事件，先清空
+    if os.getpid() != MAIN_PID:
+        TRACER.reset()
+    TRACER.enable(trace)
+    _worker_sources["old"] = open_store(old_store_dir)
+    _worker_sources["new"] = open_store(new_store_dir)
+
+
+def _camera_counts(source, video_file, total_frames):
+    cam = source.cached(video_file)
+    if cam is None:
+        return np.zeros(total_frames, dtype=np.int64)
+    return compute_camera_stats(cam).padded("counts", total_frames)
+
+
+@traced("render_histogram")
+def render_histogram(task):
+    video_file, total_frames, output_path, dpi = task[1:]
+
+    # 准备数据：每帧框数量来自预计算的统计数组
+    with span("histogram_counts", video=video_file):
+        counts_old = _camera_counts(_worker_sources["old"], video_file, total_frames)
+        counts_new = _camera_counts(_worker_sources["new"], video_file, total_frames)
+
+    # 纵轴最小值固定为5，当框数量有更大的就固定为最大值
+    max_count = int(max(counts_old.max(), counts_new.max()))
+    y_limit = max(5, max_count)
+
+    # 绘图（Old 柱宽 1 帧，用单个 stairs 艺术家代替逐帧的 bar）
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+    edges = np.arange(total_frames + 1) + 0.5
+    ax.stairs(counts_old, edges, fill=True, color='skyblue', label='Old', alpha=0.6)
+    ax.plot(np.arange(1, total_frames + 1), counts_new, color='orange', label='New', linewidth=1.5)
+
+    ax.set_title(f"Detection Boxes Histogram - {video_file}")
+    ax.set_xlabel("Frame Number")
+    ax.set_ylabel("Box Count")
+    ax.set_xlim(0, total_frames + 1)
+
+    # 稍微加一点点防止压线；强制 Y 轴只显示整数刻度
+    ax.set_ylim(0, y_limit + (0.1 if y_limit > 5 else 0))
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True))
+
+    ax.legend(loc='upper right')
+    ax.grid(axis='y', linestyle='--', alpha=0.3)
+
+    # 渲染和编码图片都在 savefig 中
+    with span("histogram_save", video=video_file):
+        fig.savefig(output_path, dpi=dpi)
+    return video_file, "rendered", output_path
+
+
+def _camera_heatmap(source, video_file, width, height):
+    cam = source.cached(video_file)
+    if cam is None:
+        return np.zeros(heatmap_shape(width, height), dtype=np.int64)
+    return compute_heatmap(cam, width, height)
+
+
+@traced("render_heatmap")
+def render_heatmap(task):
+    video_file, (width, height), output_path, dpi = task[1:]
 
-def main():
-    # 配置路径
-    video_folder = r"E:\data\12-29_avi"
-    project_root = r"e:\pproject\QuickCheck"
-    old_json_path = os.path.join(project_root, "json", "annotations_old.json")
-    new_json_path = os.path.join(project_root, "json", "annotations_new.json")
-    output_folder = os.path.join(project_root, "histograms_output")
+    with span("heatmap_accumulate", video=video_file):
+        heat_old = _camera_heatmap(_worker_sources["old"], video_file, width, height)
+        heat_new = _camera_heatmap(_worker_sources["new"], video_file, width, height)
+        ratio = survival_ratio(heat_new, heat_old)
+
+    # Old/New 共用对数色标，第三幅为 New/Old 覆盖次数之比（Old 没有框的区域留白）
+    fig = Figure(figsize=(16, 4.8), layout="constrained")
+    vmax = max(int(heat_old.max()), int(heat_new.max()), 1)
+    norm = LogNorm(vmin=1, vmax=max(vmax, 2))
+    extent = (0, heat_old.shape[1] * HEATMAP_CELL, heat_old.shape[0] * HEATMAP_CELL, 0)
+    panels = (("Old (motion)", np.ma.masked_equal(heat_old, 0), "jet", norm),
+              ("New (YOLO & motion)", np.ma.masked_equal(heat_new, 0), "jet", norm),
+              ("New / Old survival", np.ma.masked_invalid(ratio), "coolwarm", None))
+    for i, (title, values, cmap, panel_norm) in enumerate(panels):
+        ax = fig.add_subplot(1, 3, i + 1)
+        image = ax.imshow(values, cmap=cmap, norm=panel_norm, vmin=None if panel_norm else 0,
+                          vmax=None if panel_norm else 1, extent=extent, interpolation="nearest")
+        ax.set_xlim(0, width)
+        ax.set_ylim(height, 0)
+        ax.set_title(title)
+        fig.colorbar(image, ax=ax, shrink=0.8,
+                     label="Box coverage (frames)" if panel_norm else "Ratio")
+    fig.suptitle(f"Detection Heatmap - {video_file}")
+
+    with span("heatmap_save", video=video_file):
+        fig.savefig(output_path, dpi=dpi)
+    return video_file, "rendered", output_path
+
+
+RENDERERS = {"histogram": render_histogram, "heatmap": render_heatmap}
+
+
+def _render_task(task):
+    # task[0] 为输出类型，task[1] 为视频；工作进程的 trace 记录随结果交回主进程
+    # 单个视频出错时只记为失败，不中断其他视频
+    try:
+        result = RENDERERS[task[0]](task)
+    except Exception as e:
+        result = (task[1], "failed", str(e))
+    return result, TRACER.drain_events() if TRACER.enabled else None
+
+
+def input_signature(video_path, digests, dpi):
+    st = os.stat(video_path)
+    return {
+        "annotations": digests,
+        "video_size": st.st_size,
+        "video_mtime_ns": st.st_mtime_ns,
+        "dpi": dpi,
+    }
+
+
+def load_manifest(output_folder):
+    path = os.path.join(output_folder, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_folder, manifest):
+    path = os.path.join(output_folder, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    video_folder = args.video_folder
+    output_folder = args.output
 
     # 创建输出目录
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
         print(f"Created output directory: {output_folder}")
 
-    # 加载 JSON 数据
-    print("Loading JSON files...")
-    annotations_old = {}
-    annotations_new = {}
-
-    if os.path.exists(old_json_path):
-        with open(old_json_path, "r", encoding="utf-8") as f:
-            annotations_old = json.load(f)
-        print(f"Loaded Old JSON from {old_json_path}")
-    else:
-        print(f"Warning: Old JSON not found at {old_json_path}")
-
-    if os.path.exists(new_json_path):
-        with open(new_json_path, "r", encoding="utf-8") as f:
-            annotations_new = json.load(f)
-        print(f"Loaded New JSON from {new_json_path}")
-    else:
-        print(f"Warning: New JSON not found at {new_json_path}")
-
     # 扫描视频文件
     if not os.path.exists(video_folder):
         print(f"Error: Video folder not found: {video_folder}")
-        return
+        return 1
 
     video_files = [f for f in os.listdir(video_folder) if f.lower().endswith('.avi')]
     video_files.sort()
 
     if not video_files:
         print("No .avi files found in the video folder.")
-        return
-
-    print(f"Found {len(video_files)} video files. Starting processing...")
-
-    for i, video_file in enumerate(video_files):
-        print(f"[{i+1}/{len(video_files)}] Processing {video_file}...")
-        video_path = os.path.join(video_folder, video_file)
-        
-        # 获取视频信息
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            print(f"  Error: Could not open video {video_path}")
-            continue
-        
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        cap.release()
-        
-        if total_frames <= 0:
-            print("  Warning: Invalid frame count (0). Skipping.")
-            continue
-
-        # 准备数据
-        frames = list(range(1, total_frames + 1))
-        counts_old = [0] * total_frames
-        counts_new = [0] * total_frames
-
-        # 填充 Old 数据
-        if annotations_old:
-            cam_data = annotations_old.get(video_file, {})
-            for f_idx in range(total_frames):
-                key = str(f_idx + 1)
-                if key in cam_data:
-                    counts_old[f_idx] = len(cam_data[key])
-
-        # 填充 New 数据
-        if annotations_new:
-            cam_data = annotations_new.get(video_file, {})
-            for f_idx in range(total_frames):
-                key = str(f_idx + 1)
-                if key in cam_data:
-                    counts_new[f_idx] = len(cam_data[key])
-
-        # 确定 Y 轴范围
-        max_count = 0
-        if counts_old:
-            max_count = max(max_count, max(counts_old))
-        if counts_new:
-            max_count = max(max_count, max(counts_new))
-        
-        # 纵轴最小值固定为5，当框数量有更大的就固定为最大值
-        y_limit = max(5, max_count)
-        # 稍微加一点余量，如果是正好整数，可以考虑 +1 让图好看点，但用户说“固定为最大值”，这里严格按照最大值来
-        # 如果 max_count > 5，y_limit = max_count
-        # 为了避免顶格不好看，通常 matplotlib 默认会自动调整，但如果要强制：
-        # plt.ylim(0, y_limit) 
-        # 这里如果 max_count 是 5，ylim 是 5。如果 max_count 是 10，ylim 是 10。
-        
-        # 绘图
-        plt.figure(figsize=(10, 6))
-        plt.bar(frames, counts_old, width=1.0, color='skyblue', label='Old', alpha=0.6)
-        plt.plot(frames, counts_new, color='orange', label='New', linewidth=1.5)
-        
-        plt.title(f"Detection Boxes Histogram - {video_file}")
-        plt.xlabel("Frame Number")
-        plt.ylabel("Box Count")
-        plt.xlim(0, total_frames + 1)
-        
-        # 设置 Y 轴范围
-        # 注意：matplotlib 的 ylim 如果设为 (0, 5)，那么 5 就在最顶端。
-        # 如果要让最大值能显示出来，通常建议稍微多一点点，或者就正好。
-        # 这里按照用户“固定为最大值”的字面意思，设为 y_limit。
-        # 但是为了防止顶部的线被遮挡，如果是 plot 的线，可能刚好压线。
-        # 不过既然用户这么要求，先尝试精确设置。
-        # 为了保证刻度整数显示，可以使用 MaxNLocator
-        plt.ylim(0, y_limit + (0.1 if y_limit > 5 else 0)) # 稍微加一点点防止压线，或者就直接 y_limit
-        
-        # 强制 Y 轴只显示整数刻度
-        from matplotlib.ticker import MaxNLocator
-        plt.gca().yaxis.set_major_locator(MaxNLocator(integer=True))
-
-        plt.legend(loc='upper right')
-        plt.grid(axis='y', linestyle='--', alpha=0.3)
-        
-        output_filename = os.path.splitext(video_file)[0] + "_histogram.png"
-        output_path = os.path.join(output_folder, output_filename)
-        plt.savefig(output_path)
-        plt.close() # 关闭图形释放内存
-        
-        print(f"  Saved histogram to {output_path}")
+        return 1
+
+    if args.trace:
+        TRACER.enable()
+    start_time = time.perf_counter()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 加载 JSON 数据（转换为 .store 后各进程内存映射共享）
+        print("Loading JSON files...")
+        with span("prepare_stores"):
+            old_store_dir = prepare_store(args.old_json, "old", temp_dir)
+            new_store_dir = prepare_store(args.new_json, "new", temp_dir)
+            annotations_old = open_store(old_store_dir)
+            annotations_new = open_store(new_store_dir)
+
+        # 视频帧数等元数据：缓存命中时无需打开视频，缺失的并行补齐
+        with span("scan_metadata"):
+            metadata = scan_metadata(video_folder, video_files, workers=max(args.workers, 1) * 2)
+
+        # 跳过输入未变化的视频
+        manifest = load_manifest(output_folder)
+        new_manifest = dict(manifest)
+        tasks = []
+        skipped = 0
+        failed = 0
+        for video_file in video_files:
+            video_path = os.path.join(video_folder, video_file)
+            meta = metadata.get(video_file)
+            if meta is None:
+                print(f"  Error: Could not open video {video_path}")
+                failed += 1
+                continue
+            # 标注中的最大帧号超过视频帧数（或帧数无效）时校验帧数
+            max_frame = max(getattr(source.cached(video_file), "n_frames", 0)
+                            for source in (annotations_old, annotations_new))
+            meta = verify_frame_count(video_folder, video_file, meta, max_frame)
+            if meta["frame_count"] <= 0:
+                print(f"  Warning: Invalid frame count (0) for {video_file}. Skipping.")
+                failed += 1
+                continue
 
+            digests = [camera_digest(annotations_old.cached(video_file)),
+                       camera_digest(annotations_new.cached(video_file))]
+            signature = input_signature(video_path, digests, args.dpi)
+            outputs = [("histogram", meta["frame_count"])]
+            if args.heatmaps:
+                outputs.append(("heatmap", (meta["width"], meta["height"])))
+            for kind, param in outputs:
+                output_filename = os.path.splitext(video_file)[0] + f"_{kind}." + args.format
+                output_path = os.path.join(output_folder, output_filename)
+                if not args.force and manifest.get(output_filename) == signature and os.path.exists(output_path):
+                    skipped += 1
+                    continue
+                tasks.append(((kind, video_file, param, output_path, args.dpi), output_filename, signature))
+
+        print(f"Found {len(video_files)} video files, {skipped} outputs unchanged. "
+              f"Processing {len(tasks)} with {args.workers} worker(s)...")
+
+        rendered = 0
+        # 至少渲染了一个输出的视频（启用热力图时每个视频有两个输出）
+        rendered_videos = set()
+        task_args = [task for task, _, _ in tasks]
+        if args.workers > 1 and len(tasks) > 1:
+            executor = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                           initargs=(old_store_dir, new_store_dir, TRACER.enabled))
+            results = executor.map(_render_task, task_args)
+        else:
+            executor = None
+            _init_worker(old_store_dir, new_store_dir, TRACER.enabled)
+            results = map(_render_task, task_args)
+
+        try:
+            for i, ((_, output_filename, signature), (result, events)) in enumerate(zip(tasks, results)):
+                video_file, status, message = result
+                if events is not None:
+                    TRACER.add_events(events)
+                if status == "rendered":
+                    rendered += 1
+                    rendered_videos.add(video_file)
+                    new_manifest[output_filename] = signature
+                    print(f"[{i+1}/{len(tasks)}] {video_file}: saved {task_args[i][0]} to {message}")
+                else:
+                    failed += 1
+                    new_manifest.pop(output_filename, None)
+                    print(f"[{i+1}/{len(tasks)}] {video_file}: Error: {message}")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            save_manifest(output_folder, new_manifest)
+            # 释放内存映射，临时目录才能被删除（Windows）
+            annotations_old = annotations_new = None
+            _worker_sources.clear()
+
+    elapsed = time.perf_counter() - start_time
     print("\nBatch processing complete!")
-    print(f"All histograms saved to: {output_folder}")
+    print(f"Rendered {rendered} outputs for {len(rendered_videos)} videos, skipped {skipped} (unchanged), "
+          f"failed {failed} in {elapsed:.2f}s "
+          f"({len(rendered_videos) / elapsed if elapsed > 0 else 0:.2f} videos/s)")
+    print(f"All outputs saved to: {output_folder}")
+    if args.trace:
+        count = TRACER.export_chrome_trace(args.trace)
+        print(f"Trace with {count} events saved to {args.trace}")
+    return 0 if failed == 0 else 2
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,513 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import contextlib
+import platform
+import tempfile
+
+import cv2
+import numpy as np
+
+from annotation_store import convert_json, load_annotations, store_path_for
+
+# 本脚本的作用：
+# 1. 按规模参数（相机数 × 帧数 × 每帧框数 × 分辨率）生成合成数据集：Camera{r}-{c}.avi（MJPG）
+#    和 md/annotations_structure.md 格式的 annotations_old/new.json；同一参数的数据集只生成一次
+# 2. 对真实代码路径计时：
+#    - load_json：与 load_default_annotations 相同的 load_annotations（按相机字节索引）+ 解析所有相机
+#    - convert_store / load_store：转换为 .store 以及内存映射加载
+#    - show_frame_sequential / show_frame_random：VideoLabeler.show_frame（含事件循环中的重绘），offscreen Qt
+#    - update_histogram：VideoLabeler.update_histogram
+#    - paint_overlay / paint_cached / paint_crosshair：AnnotatedImageLabel.paintEvent（重建叠加层 / 命中缓存 / 十字条带）
+#    - paint_zoom_pan：放大 4 倍后每次平移的重绘（可见小块 + 可见框），用 --width 3840 --height 2160 测 4K
+#    - batch_histograms：batch_generate_histograms 的完整运行（--force）
+#    - build_tracks：track_index 为 Old/New 建立跨帧轨迹索引（含保存）
+#    - build_thumbnails / load_thumbnails：filmstrip 顺序解码一遍生成胶片条缩略图（含保存） / 从缓存读取
+#    - filter_sweep：filter_detections 以 New 作检测结果、Old 作运动结果，按 IoU 0.1/0.3/0.5 扫描（不写文件）
+# 3. 结果写为 JSON（每项的中位数/最小/平均/p95，单位毫秒，以及规模参数和环境信息）
+# 4. compare 模式把当前结果与保存的基线逐项比较，中位数变慢超过阈值的项记为回归，退出码为 1
+#
+# 用法：python benchmark.py run [--cameras 4] [--frames 600] [--boxes 8] [--width 640] [--height 480]
+#                               [--repeat 5] [--only 名称 ...] [--workdir 目录] [-o results.json] [--baseline 基线.json]
+#       python benchmark.py compare <基线.json> <结果.json> [--threshold 0.2]
+
+RESULTS_VERSION = 1
+DATASET_FILE = "dataset.json"
+GRID_COLUMNS = 5
+DEFAULT_THRESHOLD = 0.2
+# 单项计时少于该毫秒数时不判定回归（噪声大于差异）
+MIN_COMPARE_MS = 0.1
+
+BENCHMARKS = (
+    "load_json",
+    "convert_store",
+    "load_store",
+    "show_frame_sequential",
+    "show_frame_random",
+    "update_histogram",
+    "paint_overlay",
+    "paint_cached",
+    "paint_crosshair",
+    "paint_zoom_pan",
+    "batch_histograms",
+    "build_tracks",
+    "build_thumbnails",
+    "load_thumbnails",
+    "filter_sweep",
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="QuickCheck 性能基准（合成数据）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="生成数据集并运行基准")
+    run.add_argument("--cameras", type=int, default=4, help="相机数量")
+    run.add_argument("--frames", type=int, default=600, help="每个视频的帧数")
+    run.add_argument("--boxes", type=int, default=8, help="每个视频的目标数（每帧约 85%% 可见）")
+    run.add_argument("--width", type=int, default=640, help="视频宽度")
+    run.add_argument("--height", type=int, default=480, help="视频高度")
+    run.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    run.add_argument("--steps", type=int, default=200, help="show_frame/paint 每次重复的调用次数")
+    run.add_argument("--workers", type=int, default=2, help="batch_histograms 的进程数")
+    run.add_argument("--only", nargs="*", choices=BENCHMARKS, help="只运行这些基准")
+    run.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "quickcheck_bench"),
+                     help="数据集目录（按规模参数分子目录缓存）")
+    run.add_argument("--regenerate", action="store_true", help="重新生成数据集")
+    run.add_argument("-o", "--output", default="benchmark_results.json", help="结果 JSON 路径")
+    run.add_argument("--baseline", help="运行后与该基线比较")
+    run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="回归阈值（相对变慢比例）")
+
+    compare = sub.add_parser("compare", help="比较两份结果")
+    compare.add_argument("baseline", help="基线结果 JSON")
+    compare.add_argument("current", help="当前结果 JSON")
+    compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="回归阈值（相对变慢比例）")
+    return parser.parse_args(argv)
+
+
+# ---------- 合成数据集 ----------
+
+def camera_names(n_cameras):
+    return [f"Camera{i // GRID_COLUMNS + 1}-{i % GRID_COLUMNS + 1}.avi" for i in range(n_cameras)]
+
+
+def dataset_params(args):
+    return {"cameras": args.cameras, "frames": args.frames, "boxes": args.boxes,
+            "width": args.width, "height": args.height}
+
+
+def dataset_dir(workdir, params):
+    key = "c{cameras}_f{frames}_b{boxes}_{width}x{height}".format(**params)
+    return os.path.join(workdir, key)
+
+
+def synthetic_tracks(rng, n_frames, n_boxes, width, height):
+    # 每个目标沿直线运动，返回 (n_frames, n_boxes, 4) 的框和 (n_frames, n_boxes) 的可见性
+    size = rng.integers(16, max(17, min(width, height) // 6), (n_boxes, 2))
+    limit = np.array([width, height]) - size
+    start = rng.uniform(0, 1, (n_boxes, 2)) * limit
+    velocity = rng.uniform(-3, 3, (n_boxes, 2))
+    t = np.arange(n_frames)[:, None, None]
+    # 碰到边界反弹：对 2*limit 取模后折叠
+    pos = limit - np.abs((start + velocity * t) % (2 * limit) - limit)
+    boxes = np.concatenate([pos, pos + size], axis=2).astype(np.int32)
+    visible = rng.random((n_frames, n_boxes)) < 0.85
+    return boxes, visible
+
+
+def synthetic_annotations(rng, n_frames, n_boxes, width, height):
+    # Old：可见的目标；New：Old 加抖动、随机丢失和少量额外框。只写有框的帧
+    boxes, visible = synthetic_tracks(rng, n_frames, max(n_boxes, 1), width, height)
+    old, new = {}, {}
+    for i in range(n_frames):
+        frame_boxes = boxes[i][visible[i]]
+        if len(frame_boxes):
+            old[str(i + 1)] = frame_boxes.tolist()
+        keep = rng.random(len(frame_boxes)) < 0.9
+        jitter = rng.integers(-3, 4, (int(keep.sum()), 4))
+        new_boxes = (frame_boxes[keep] + jitter).tolist()
+        if rng.random() < 0.1:
+            x, y = int(rng.integers(0, width - 32)), int(rng.integers(0, height - 32))
+            new_boxes.append([x, y, x + 32, y + 32])
+        if new_boxes:
+            new[str(i + 1)] = new_boxes
+    return old, new, boxes
+
+
+def write_synthetic_video(path, n_frames, width, height, boxes):
+    # 有纹理的背景 + 运动的目标 + 帧号，保证解码开销接近真实视频
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25.0, (width, height))
+    if not writer.isOpened():
+        raise OSError(f"could not write {path}")
+    rng = np.random.default_rng(len(path))
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    frame = np.empty_like(background)
+    for i in range(n_frames):
+        frame[:] = background
+        for x1, y1, x2, y2 in boxes[i]:
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (40, 40, 200), -1)
+        cv2.putText(frame, str(i + 1), (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+        writer.write(frame)
+    writer.release()
+
+
+def prepare_dataset(workdir, params, regenerate=False):
+    # 返回数据集目录；dataset.json 最后写入，存在即表示数据完整
+    root = dataset_dir(workdir, params)
+    marker = os.path.join(root, DATASET_FILE)
+    if not regenerate and os.path.exists(marker):
+        return root
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    os.makedirs(os.path.join(root, "videos"))
+    os.makedirs(os.path.join(root, "json"))
+
+    print(f"Generating dataset {os.path.basename(root)} ...")
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(0)
+    all_old, all_new = {}, {}
+    for name in camera_names(params["cameras"]):
+        old, new, boxes = synthetic_annotations(rng, params["frames"], params["boxes"],
+                                                params["width"], params["height"])
+        all_old[name] = old
+        all_new[name] = new
+        write_synthetic_video(os.path.join(root, "videos", name), params["frames"],
+                              params["width"], params["height"], boxes)
+    for label, data in (("old", all_old), ("new", all_new)):
+        with open(os.path.join(root, "json", f"annotations_{label}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    print(f"Dataset ready in {time.perf_counter() - t0:.1f}s: {root}")
+    return root
+
+
+# ---------- 计时 ----------
+
+def summarize(samples_ms):
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "median": float(np.median(samples)),
+        "min": float(samples.min()),
+        "mean": float(samples.mean()),
+        "p95": float(np.percentile(samples, 95)),
+        "n": int(len(samples)),
+    }
+
+
+def measure(fn, repeat, setup=None):
+    # 返回每次调用的毫秒数；setup 不计时
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def json_paths(root):
+    return [os.path.join(root, "json", f"annotations_{label}.json") for label in ("old", "new")]
+
+
+def remove_stores(root):
+    for path in json_paths(root):
+        store_dir = store_path_for(path)
+        if os.path.exists(store_dir):
+            shutil.rmtree(store_dir)
+
+
+def bench_load_json(root, args):
+    # 没有 .store 时的启动路径：字节索引 + 逐相机解析
+    def load():
+        for path in json_paths(root):
+            source = load_annotations(path, max_cameras=args.cameras)
+            for name in source:
+                source.load_camera(name)
+    remove_stores(root)
+    return {"load_json": summarize(measure(load, args.repeat))}
+
+
+def bench_store(root, args):
+    def convert():
+        for path in json_paths(root):
+            convert_json(path)
+
+    def load():
+        for path in json_paths(root):
+            source = load_annotations(path)
+            for name in source:
+                source.load_camera(name).counts()
+    results = {"convert_store": summarize(measure(convert, args.repeat, setup=lambda: remove_stores(root)))}
+    results["load_store"] = summarize(measure(load, args.repeat))
+    return results
+
+
+def bench_gui(root, args, names):
+    # offscreen Qt 下构造主窗口，加载第一个视频后对 show_frame / update_histogram / paintEvent 计时
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import QPoint
+    from PyQt5.QtWidgets import QApplication
+    import labeling_app
+
+    app = QApplication.instance() or QApplication([])
+
+    def wait(condition, timeout=30.0):
+        end = time.perf_counter() + timeout
+        while not condition() and time.perf_counter() < end:
+            app.processEvents()
+            time.sleep(0.001)
+
+    # load_default_annotations 从工作目录下的 json/ 加载
+    cwd = os.getcwd()
+    os.chdir(root)
+    window = None
+    try:
+        window = labeling_app.VideoLabeler()
+        window.resize(1600, 1200)
+        window.show()
+        wait(lambda: window.annotation_thread is None)
+
+        videos = sorted(names)
+        window.video_folder = os.path.join(root, "videos")
+        window.load_video_file(os.path.join(window.video_folder, videos[0]))
+        wait(lambda: not window.camera_threads and window.annotations_old.cached(window.camera_name) is not None)
+        app.processEvents()
+
+        total = window.total_frames
+        steps = min(args.steps, total)
+        rng = random.Random(0)
+        results = {}
+        wanted = set(args.only or BENCHMARKS)
+
+        def show(indices):
+            def run():
+                for idx in indices:
+                    window.show_frame(idx)
+                    app.processEvents()
+            return run
+
+        def per_step(samples, n):
+            return [s / n for s in samples]
+
+        if "show_frame_sequential" in wanted:
+            results["show_frame_sequential"] = summarize(per_step(
+                measure(show(range(steps)), args.repeat, setup=lambda: window.show_frame(0)), steps))
+        if "show_frame_random" in wanted:
+            indices = [rng.randrange(total) for _ in range(steps)]
+            results["show_frame_random"] = summarize(per_step(measure(show(indices), args.repeat), steps))
+        if "update_histogram" in wanted:
+            results["update_histogram"] = summarize(measure(window.update_histogram, args.repeat * 10))
+
+        label = window.image_label
+        window.show_frame(total // 2)
+        app.processEvents()
+        if "paint_overlay" in wanted:
+            results["paint_overlay"] = summarize(measure(
+                label.repaint, args.repeat * 10,
+                setup=lambda: label.set_annotations(label.old_annotations, label.new_annotations,
+                                                    label.det_annotations)))
+        if "paint_cached" in wanted:
+            label.repaint()
+            results["paint_cached"] = summarize(measure(label.repaint, args.repeat * 10))
+        if "paint_crosshair" in wanted:
+            points = [QPoint(rng.randrange(label.width()), rng.randrange(label.height())) for _ in range(steps)]
+
+            def crosshair():
+                for pos in points:
+                    label.mouse_pos = pos
+                    label.repaint(label._crosshair_region(pos))
+            results["paint_crosshair"] = summarize(per_step(measure(crosshair, args.repeat), steps))
+        if "paint_zoom_pan" in wanted:
+            center = QPoint(label.width() // 2, label.height() // 2)
+
+            def zoom_pan():
+                label.reset_zoom()
+                label.zoom_at(4.0, center)
+                for i in range(steps):
+                    cx, cy = label.view_center
+                    label.view_center = (cx + 3, cy + 2)
+                    label._clamp_view()
+                    label._overlay = None
+                    label.repaint()
+            results["paint_zoom_pan"] = summarize(per_step(measure(zoom_pan, args.repeat), steps))
+            label.reset_zoom()
+        return results
+    finally:
+        if window is not None:
+            window.close()
+            app.processEvents()
+        os.chdir(cwd)
+
+
+def bench_batch(root, args):
+    import batch_generate_histograms
+    output = os.path.join(root, "histograms_output")
+    old_json, new_json = json_paths(root)
+    argv = [os.path.join(root, "videos"), "--old-json", old_json, "--new-json", new_json,
+            "-o", output, "-j", str(args.workers), "--force"]
+
+    def batch():
+        # 批处理脚本的逐视频输出不计入结果
+        with contextlib.redirect_stdout(io.StringIO()):
+            batch_generate_histograms.main(argv)
+    return {"batch_histograms": summarize(measure(batch, args.repeat))}
+
+
+def bench_tracks(root, args):
+    import track_index
+
+    def build():
+        for path in json_paths(root):
+            track_index.build_track_index(path, workers=args.workers)
+    return {"build_tracks": summarize(measure(build, args.repeat))}
+
+
+def bench_thumbnails(root, args, names):
+    import filmstrip
+    video = os.path.join(root, "videos", names[0])
+
+    def build():
+        frames, thumbs = filmstrip.generate_thumbnails(video, args.frames)
+        filmstrip.save_thumbnails(video, frames, thumbs)
+
+    def load():
+        if filmstrip.load_thumbnails(video) is None:
+            raise RuntimeError(f"no cached thumbnails for {video}")
+    # 读取前先生成一次缓存
+    return {"build_thumbnails": summarize(measure(build, args.repeat)),
+            "load_thumbnails": summarize(measure(load, args.repeat))}
+
+
+def bench_filter(root, args):
+    import filter_detections
+    old_json, new_json = json_paths(root)
+
+    def sweep():
+        detections, scores = filter_detections.score_detections(new_json, old_json, "iou", workers=args.workers)
+        for threshold in (0.1, 0.3, 0.5):
+            filter_detections.regenerate(detections, scores, "iou", threshold)
+    return {"filter_sweep": summarize(measure(sweep, args.repeat))}
+
+
+def environment():
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+    try:
+        from PyQt5.QtCore import QT_VERSION_STR, PYQT_VERSION_STR
+        env["qt"] = QT_VERSION_STR
+        env["pyqt"] = PYQT_VERSION_STR
+    except ImportError:
+        pass
+    return env
+
+
+def run(args):
+    params = dataset_params(args)
+    root = prepare_dataset(args.workdir, params, args.regenerate)
+    names = camera_names(args.cameras)
+    wanted = set(args.only or BENCHMARKS)
+
+    results = {}
+    start_time = time.perf_counter()
+    if "load_json" in wanted:
+        results.update(bench_load_json(root, args))
+    if wanted & {"convert_store", "load_store"}:
+        results.update({k: v for k, v in bench_store(root, args).items() if k in wanted})
+    # 界面与批处理基准使用转换后的 .store（正常使用时的启动路径）
+    if not os.path.exists(os.path.join(store_path_for(json_paths(root)[0]), "meta.json")):
+        for path in json_paths(root):
+            convert_json(path)
+    if wanted & {"show_frame_sequential", "show_frame_random", "update_histogram",
+                 "paint_overlay", "paint_cached", "paint_crosshair", "paint_zoom_pan"}:
+        results.update(bench_gui(root, args, names))
+    if "batch_histograms" in wanted:
+        results.update(bench_batch(root, args))
+    if "build_tracks" in wanted:
+        results.update(bench_tracks(root, args))
+    if wanted & {"build_thumbnails", "load_thumbnails"}:
+        results.update({k: v for k, v in bench_thumbnails(root, args, names).items() if k in wanted})
+    if "filter_sweep" in wanted:
+        results.update(bench_filter(root, args))
+
+    report = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": dict(params, repeat=args.repeat, steps=args.steps, workers=args.workers),
+        "environment": environment(),
+        "unit": "ms",
+        "results": {name: results[name] for name in BENCHMARKS if name in results},
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+
+    print(f"\n{'benchmark':<24}{'median':>12}{'min':>12}{'p95':>12}")
+    for name, r in report["results"].items():
+        print(f"{name:<24}{r['median']:>10.3f}ms{r['min']:>10.3f}ms{r['p95']:>10.3f}ms")
+    print(f"\nCompleted in {time.perf_counter() - start_time:.1f}s, results saved to {args.output}")
+
+    if args.baseline:
+        return compare_reports(load_report(args.baseline), report, args.threshold)
+    return 0
+
+
+# ---------- 比较 ----------
+
+def load_report(path):
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    if report.get("version") != RESULTS_VERSION:
+        raise ValueError(f"{path}: unsupported results version {report.get('version')}")
+    return report
+
+
+def compare_reports(baseline, current, threshold=DEFAULT_THRESHOLD):
+    # 按中位数比较，返回退出码（有回归为 1）
+    if baseline["params"] != current["params"]:
+        print(f"Warning: parameters differ: baseline {baseline['params']}, current {current['params']}")
+    if baseline["environment"] != current["environment"]:
+        print("Warning: environments differ, timings may not be comparable")
+
+    regressions = []
+    print(f"\n{'benchmark':<24}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name in BENCHMARKS:
+        base = baseline["results"].get(name)
+        cur = current["results"].get(name)
+        if base is None or cur is None:
+            continue
+        change = cur["median"] / base["median"] - 1 if base["median"] > 0 else 0.0
+        status = ""
+        if change > threshold and cur["median"] - base["median"] > MIN_COMPARE_MS:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            status = "faster"
+        print(f"{name:<24}{base['median']:>10.3f}ms{cur['median']:>10.3f}ms{change:>+9.1%}  {status}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"\nNo regressions over {threshold:.0%}")
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "compare":
+        return compare_reports(load_report(args.baseline), load_report(args.current), args.threshold)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import os
+import re
+import math
+import fnmatch
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from PyQt5.QtWidgets import QWidget, QGridLayout, QSizePolicy
+from PyQt5.QtCore import Qt, QTimer, QRect, pyqtSignal
+from PyQt5.QtGui import QPixmap, QPainter, QColor
+
+from frame_convert import DisplayConverter
+from overlay_render import draw_annotations
+from perf_trace import traced
+from seek_index import load_seek_index, seek_capture
+
+# 本模块的作用：
+# 1. 网格视图：同时显示多个相机（默认文件夹中全部，或按名称模式选择的子集）在同一帧号的画面，
+#    每个小图叠加各自的 Old/New（以及 NPY 检测）标注
+# 2. Camera{r}-{c} 命名的相机按 5x5 机位排列（只保留用到的行/列），其他名称按名称顺序排成近似正方形
+# 3. 每个相机一个 VideoCapture，解码分摊到线程池（OpenCV 解码/缩放时释放 GIL）；
+#    在工作线程中直接缩小到小图的显示尺寸，界面线程只把小图转成 QPixmap
+# 4. 每次换帧递增代号，已过期的任务在开始解码前直接丢弃，快速连按 A/D 时不会积压
+
+DEFAULT_GRID_WORKERS = max(2, min(os.cpu_count() or 4, 16))
+GRID_NAME_PATTERN = re.compile(r"camera(\d+)-(\d+)", re.IGNORECASE)
+# 窗口尺寸变化后延迟重新解码（毫秒）
+RESIZE_DEBOUNCE_MS = 150
+
+
+def grid_position(camera_name):
+    # "Camera3-2.avi" -> (3, 2)，不符合命名时返回 None；子文件夹中的视频只看文件名
+    match = GRID_NAME_PATTERN.search(os.path.basename(camera_name))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def layout_cameras(camera_names):
+    # 返回 {相机: (行, 列)}（0-based）
+    positions = {name: grid_position(name) for name in camera_names}
+    if camera_names and all(positions.values()):
+        rows = sorted({r for r, _ in positions.values()})
+        cols = sorted({c for _, c in positions.values()})
+        return {name: (rows.index(r), cols.index(c)) for name, (r, c) in positions.items()}
+    n_cols = max(1, math.ceil(math.sqrt(len(camera_names))))
+    return {name: divmod(i, n_cols) for i, name in enumerate(sorted(camera_names))}
+
+
+def select_cameras(camera_names, patterns):
+    # patterns：逗号/空格分隔的通配符，可省略扩展名，如 "Camera1-*, Camera2-3"；为空时返回全部
+    patterns = [p for p in re.split(r"[,\s]+", patterns or "") if p]
+    if not patterns:
+        return list(camera_names)
+    selected = []
+    for name in camera_names:
+        # 子文件夹中的视频也可以只按文件名匹配
+        base = os.path.basename(name)
+        candidates = (name.lower(), base.lower(), os.path.splitext(base)[0].lower())
+        if any(fnmatch.fnmatch(c, p.lower()) for p in patterns for c in candidates):
+            selected.append(name)
+    return selected
+
+
+class TileDecoder:
+    # 单个相机的解码器；同一时间只被一个工作线程使用
+    def __init__(self, video_path):
+        self.video_path = video_path
+        self.cap = None
+        self.seek_index = None
+        self.pos = -1
+        self.lock = threading.Lock()
+        self.converter = DisplayConverter()
+
+    @traced("grid_decode")
+    def decode(self, frame_idx, width, height, is_stale):
+        # 返回（小图 QImage, 原始尺寸 (w, h)），失败返回 (None, None)，过期返回 None
+        with self.lock:
+            if is_stale():
+                return None
+            if self.cap is None:
+                self.cap = cv2.VideoCapture(self.video_path)
+                # 只使用已缓存的 seek 索引，不在网格视图中扫描视频
+                self.seek_index = load_seek_index(self.video_path, build=False)
+            if not self.cap.isOpened():
+                return None, None
+            if frame_idx != self.pos:
+                self.pos = seek_capture(self.cap, frame_idx, self.seek_index, self.pos)
+            ret, frame = self.cap.read() if self.pos == frame_idx else (False, None)
+            if not ret:
+                self.pos = -1
+                return None, None
+            self.pos = frame_idx + 1
+            # QImage 引用转换器的缓冲区，复制一份再交给界面线程
+            image = self.converter.convert(frame, width, height).copy()
+            return image, (frame.shape[1], frame.shape[0])
+
+    def close(self):
+        with self.lock:
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
+
+
+class GridTile(QWidget):
+    def __init__(self, camera_name, parent=None):
+        super().__init__(parent)
+        self.camera_name = camera_name
+        self.pixmap = None
+        self.image_size = None
+        self.old_boxes = []
+        self.new_boxes = []
+        self.det_boxes = []
+        self.message = "加载中..."
+        # 已显示结果的代号，只接受更新的结果
+        self.generation = -1
+        self.setMinimumSize(80, 60)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+    def target_size(self):
+        dpr = self.devicePixelRatioF()
+        return int(self.width() * dpr), int(self.height() * dpr)
+
+    def set_tile(self, image, image_size, old_boxes, new_boxes, det_boxes):
+        self.pixmap = QPixmap.fromImage(image)
+        self.image_size = image_size
+        self.old_boxes = old_boxes
+        self.new_boxes = new_boxes
+        self.det_boxes = det_boxes
+        self.message = ""
+        self.update()
+
+    def set_message(self, text):
+        self.pixmap = None
+        self.message = text
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(30, 30, 30))
+
+        if self.pixmap is not None and self.image_size is not None:
+            w_img, h_img = self.image_size
+            scale = min(self.width() / w_img, self.height() / h_img)
+            w_dest = int(w_img * scale)
+            h_dest = int(h_img * scale)
+            dx = int((self.width() - w_dest) / 2)
+            dy = int((self.height() - h_dest) / 2)
+            painter.drawPixmap(QRect(dx, dy, w_dest, h_dest), self.pixmap)
+            draw_annotations(painter, self.old_boxes, self.new_boxes, scale, dx, dy, pen_width=1,
+                             det_boxes=self.det_boxes)
+
+        # 相机名与提示
+        painter.setPen(QColor(255, 255, 255))
+        label = os.path.splitext(self.camera_name)[0]
+        if self.message:
+            label += f"  {self.message}"
+        painter.fillRect(QRect(0, 0, painter.fontMetrics().horizontalAdvance(label) + 8, 18), QColor(0, 0, 0, 160))
+        painter.drawText(QRect(4, 0, self.width() - 4, 18), Qt.AlignLeft | Qt.AlignVCenter, label)
+        painter.end()
+
+    def mouseDoubleClickEvent(self, event):
+        grid = self.parent()
+        if isinstance(grid, CameraGridView):
+            grid.camera_activated.emit(self.camera_name)
+
+
+class CameraGridView(QWidget):
+    # (代号, 帧下标, 相机, QImage 或 None, 原始尺寸, [Old 框, New 框, NPY 框])，由工作线程发出
+    tile_ready = pyqtSignal(int, int, str, object, object, object)
+    # 双击小图
+    camera_activated = pyqtSignal(str)
+
+    def __init__(self, parent=None, workers=DEFAULT_GRID_WORKERS):
+        super().__init__(parent)
+        self.grid_layout = QGridLayout(self)
+        self.grid_layout.setSpacing(2)
+        self.grid_layout.setContentsMargins(0, 0, 0, 0)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="GridDecode")
+        self.folder = None
+        self.tiles = {}
+        self.decoders = {}
+        self.sources = (None, None, None)
+        self.frame_idx = 0
+        self.generation = 0
+
+        self.tile_ready.connect(self._on_tile_ready)
+        self._resize_timer = QTimer(self)
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.timeout.connect(lambda: self.show_frame(self.frame_idx))
+
+    def set_sources(self, annotations_old, annotations_new, annotations_det=None):
+        self.sources = (annotations_old, annotations_new, annotations_det)
+        # 按相机懒加载的 JSON 源至少要能同时保留网格中的所有相机，否则每一步都会重新解析
+        for source in self.sources:
+            if hasattr(source, "max_cameras"):
+                source.max_cameras = max(source.max_cameras, len(self.tiles))
+
+    def set_cameras(self, folder, camera_names):
+        if folder != self.folder:
+            self._close_decoders(self.decoders)
+            self.decoders = {}
+            self.folder = folder
+
+        for tile in self.tiles.values():
+            self.grid_layout.removeWidget(tile)
+            tile.deleteLater()
+        self.tiles = {}
+        stale = {name: d for name, d in self.decoders.items() if name not in camera_names}
+        self._close_decoders(stale)
+        # 关闭的解码器不再复用：该相机之后再次被选中时新建
+        for name in stale:
+            del self.decoders[name]
+
+        for name, (row, col) in layout_cameras(camera_names).items():
+            tile = GridTile(name, self)
+            self.grid_layout.addWidget(tile, row, col)
+            self.tiles[name] = tile
+            if name not in self.decoders:
+                self.decoders[name] = TileDecoder(os.path.join(folder, name))
+        self.set_sources(*self.sources)
+
+    def show_frame(self, frame_idx):
+        # 所有小图一起切换到 frame_idx（0-based）
+        self.frame_idx = frame_idx
+        self.generation += 1
+        generation = self.generation
+        for name, tile in self.tiles.items():
+            width, height = tile.target_size()
+            self.executor.submit(self._decode_tile, generation, name, frame_idx, width, height)
+
+    def _decode_tile(self, generation, camera_name, frame_idx, width, height):
+        decoder = self.decoders.get(camera_name)
+        if decoder is None:
+            return
+        try:
+            result = decoder.decode(frame_idx, width, height, lambda: generation != self.generation)
+            if result is None:
+                return
+            image, image_size = result
+            boxes = [self._frame_boxes(source, camera_name, frame_idx) for source in self.sources]
+            self.tile_ready.emit(generation, frame_idx, camera_name, image, image_size, boxes)
+        except Exception as e:
+            print(f"Error decoding {camera_name} frame {frame_idx + 1}: {e}")
+
+    def _frame_boxes(self, source, camera_name, frame_idx):
+        # 标注按视频文件名查找（视频可能在子文件夹中）
+        camera_name = os.path.basename(camera_name)
+        if not source or camera_name not in source:
+            return []
+        cam = source.load_camera(camera_name)
+        return cam.frame(frame_idx + 1) if cam is not None else []
+
+    def _on_tile_ready(self, generation, frame_idx, camera_name, image, image_size, boxes):
+        tile = self.tiles.get(camera_name)
+        if tile is None or generation < tile.generation:
+            return
+        tile.generation = generation
+        if image is None:
+            tile.set_message(f"无第 {frame_idx + 1} 帧")
+        else:
+            tile.set_tile(image, image_size, *boxes)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.tiles:
+            self._resize_timer.start(RESIZE_DEBOUNCE_MS)
+
+    def _close_decoders(self, decoders):
+        for decoder in decoders.values():
+            self.executor.submit(decoder.close)
+
+    def close_all(self):
+        self.generation += 1
+        self._close_decoders(self.decoders)
+        self.decoders = {}
+        self.executor.shutdown(wait=True)
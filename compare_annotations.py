@@ -0,0 +1,254 @@
+import os
+import sys
+import csv
+import json
+import argparse
+
+import numpy as np
+
+from annotation_store import load_annotations
+
+# 本模块的作用：
+# 1. 对每个相机的每一帧，计算 Old（运动检测）与 New（YOLO ∩ 运动）框之间的 IoU 矩阵：
+#    按 (Old 框数, New 框数) 把帧分组，同组的帧组成 (帧数, M, 4) / (帧数, N, 4) 数组批量计算，不逐框循环，
+#    也不把所有帧补齐到整个相机的最大框数（个别拥挤的帧只影响它所在的组）
+# 2. 在各帧内按 IoU 从大到小贪心匹配（阈值可配置），同样对同组的帧批量进行
+# 3. 输出每帧的匹配数、未匹配数、IoU 之和，以及每个相机的汇总（匹配数、平均 IoU、不一致帧）
+# 4. 可在命令行对整个数据集生成 CSV/JSON 报告，也供 VideoLabeler 的对比面板使用
+#
+# 用法：python compare_annotations.py [--old json/annotations_old.json] [--new json/annotations_new.json]
+#       [--iou 0.5] [--csv report.csv] [--json report.json]
+
+DEFAULT_IOU_THRESHOLD = 0.5
+# 每块 IoU 矩阵的元素数上限（帧数 * M * N），限制内存占用
+CHUNK_ELEMENTS = 1 << 22
+
+
+class CameraComparison:
+    # 每帧数组下标 i 对应第 i+1 帧（1-based 帧号）
+    def __init__(self, old_counts, new_counts, matched, iou_sum):
+        self.old_counts = old_counts
+        self.new_counts = new_counts
+        self.matched = matched
+        self.iou_sum = iou_sum
+        self.old_unmatched = old_counts - matched
+        self.new_unmatched = new_counts - matched
+        self.n_frames = len(matched)
+
+        self.total_old = int(old_counts.sum())
+        self.total_new = int(new_counts.sum())
+        self.total_matched = int(matched.sum())
+        self.mean_iou = float(iou_sum.sum()) / self.total_matched if self.total_matched else 0.0
+        # 不一致帧：存在任一方未匹配的框（1-based 帧号）
+        self.disagreement_frames = np.flatnonzero((self.old_unmatched > 0) | (self.new_unmatched > 0)) + 1
+
+    def frame_summary(self, frame_no):
+        i = frame_no - 1
+        if i < 0 or i >= self.n_frames:
+            return {"matched": 0, "old_unmatched": 0, "new_unmatched": 0, "mean_iou": 0.0}
+        matched = int(self.matched[i])
+        return {
+            "matched": matched,
+            "old_unmatched": int(self.old_unmatched[i]),
+            "new_unmatched": int(self.new_unmatched[i]),
+            "mean_iou": float(self.iou_sum[i]) / matched if matched else 0.0,
+        }
+
+    def summary(self):
+        return {
+            "old_boxes": self.total_old,
+            "new_boxes": self.total_new,
+            "matched": self.total_matched,
+            "old_unmatched": self.total_old - self.total_matched,
+            "new_unmatched": self.total_new - self.total_matched,
+            "mean_iou": self.mean_iou,
+            "disagreement_frames": len(self.disagreement_frames),
+        }
+
+
+def frame_boxes(cam, n_frames):
+    # CameraAnnotations -> 所有框 (总框数, 4) float64 + 每帧框数 + 每帧第一个框的下标
+    if cam is None:
+        counts = np.zeros(n_frames, dtype=np.int64)
+        return np.zeros((0, 4)), counts, counts
+    counts = cam.counts(n_frames)
+    total = int(counts.sum())
+    boxes = np.asarray(cam.all_boxes()[:total], dtype=np.float64).reshape(-1, 4)
+    return boxes, counts, np.cumsum(counts) - counts
+
+
+def frame_groups(old_counts, new_counts):
+    # 按 (M, N) 分组的帧块 -> [(帧下标数组, M, N)]，每块 帧数 * M * N 不超过 CHUNK_ELEMENTS
+    # （单帧超过时独占一块）；任一方没有框的帧没有匹配，不参与
+    frames = np.flatnonzero((old_counts > 0) & (new_counts > 0))
+    if not len(frames):
+        return []
+    order = np.lexsort((new_counts[frames], old_counts[frames]))
+    frames = frames[order]
+    keys = np.stack([old_counts[frames], new_counts[frames]], axis=1)
+    bounds = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+    chunks = []
+    for group in np.split(frames, bounds):
+        m, n = int(old_counts[group[0]]), int(new_counts[group[0]])
+        step = max(1, CHUNK_ELEMENTS // (m * n))
+        for start in range(0, len(group), step):
+            chunks.append((group[start:start + step], m, n))
+    return chunks
+
+
+def batched_iou(a, b):
+    # a: (F, M, 4), b: (F, N, 4) -> (F, M, N)
+    ax1, ay1, ax2, ay2 = (a[..., k][:, :, None] for k in range(4))
+    bx1, by1, bx2, by2 = (b[..., k][:, None, :] for k in range(4))
+    iw = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    ih = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = iw * ih
+    area_a = np.clip(ax2 - ax1, 0, None) * np.clip(ay2 - ay1, 0, None)
+    area_b = np.clip(bx2 - bx1, 0, None) * np.clip(by2 - by1, 0, None)
+    union = area_a + area_b - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def greedy_match(iou, threshold):
+    # 对所有帧同时做贪心匹配，返回每帧的匹配数与匹配 IoU 之和
+    n_frames, m, n = iou.shape
+    matched = np.zeros(n_frames, dtype=np.int64)
+    iou_sum = np.zeros(n_frames)
+    if m == 0 or n == 0:
+        return matched, iou_sum
+
+    iou = iou.copy()
+    frames = np.arange(n_frames)
+    for _ in range(min(m, n)):
+        flat = iou.reshape(n_frames, -1).argmax(axis=1)
+        best = iou.reshape(n_frames, -1)[frames, flat]
+        accept = best >= threshold
+        if not accept.any():
+            break
+        rows, cols = np.divmod(flat, n)
+        matched += accept
+        iou_sum += np.where(accept, best, 0.0)
+        # 已匹配的行/列不再参与
+        hit = frames[accept]
+        iou[hit, rows[accept], :] = -1.0
+        iou[hit, :, cols[accept]] = -1.0
+    return matched, iou_sum
+
+
+def compare_camera(cam_old, cam_new, iou_threshold=DEFAULT_IOU_THRESHOLD):
+    n_frames = max(cam_old.n_frames if cam_old is not None else 0,
+                   cam_new.n_frames if cam_new is not None else 0)
+    old_boxes, old_counts, old_starts = frame_boxes(cam_old, n_frames)
+    new_boxes, new_counts, new_starts = frame_boxes(cam_new, n_frames)
+
+    matched = np.zeros(n_frames, dtype=np.int64)
+    iou_sum = np.zeros(n_frames)
+    for frames, m, n in frame_groups(old_counts, new_counts):
+        # 同块各帧框数相同，直接按下标取出 (帧数, M, 4) / (帧数, N, 4)，无需补齐和掩码
+        a = old_boxes[old_starts[frames][:, None] + np.arange(m)]
+        b = new_boxes[new_starts[frames][:, None] + np.arange(n)]
+        matched[frames], iou_sum[frames] = greedy_match(batched_iou(a, b), iou_threshold)
+
+    return CameraComparison(old_counts, new_counts, matched, iou_sum)
+
+
+class ComparisonCache:
+    def __init__(self, iou_threshold=DEFAULT_IOU_THRESHOLD):
+        self.iou_threshold = iou_threshold
+        # (id(old), id(new), camera_name) -> (old, new, CameraComparison)
+        self._entries = {}
+
+    def get(self, old_source, new_source, camera_name, load=True):
+        # load=False 时只使用已解析的相机，未就绪返回 None
+        if not camera_name or not (old_source or new_source):
+            return None
+        key = (id(old_source), id(new_source), camera_name)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is old_source and entry[1] is new_source:
+            return entry[2]
+
+        cams = []
+        for source in (old_source, new_source):
+            if not source or camera_name not in source:
+                cams.append(None)
+                continue
+            cam = source.load_camera(camera_name) if load else source.cached(camera_name)
+            if cam is None:
+                return None
+            cams.append(cam)
+        result = compare_camera(cams[0], cams[1], self.iou_threshold)
+        self._entries[key] = (old_source, new_source, result)
+        return result
+
+    def invalidate(self, source=None, camera_name=None):
+        for key, (old_source, new_source, _) in list(self._entries.items()):
+            if source is not None and source is not old_source and source is not new_source:
+                continue
+            if camera_name is not None and key[2] != camera_name:
+                continue
+            del self._entries[key]
+
+
+def compare_sources(old_source, new_source, iou_threshold=DEFAULT_IOU_THRESHOLD):
+    cameras = sorted(set(old_source) | set(new_source))
+    results = {}
+    for camera_name in cameras:
+        cam_old = old_source.load_camera(camera_name) if camera_name in old_source else None
+        cam_new = new_source.load_camera(camera_name) if camera_name in new_source else None
+        results[camera_name] = compare_camera(cam_old, cam_new, iou_threshold)
+    return results
+
+
+def write_csv(path, results):
+    fields = ["camera", "old_boxes", "new_boxes", "matched", "old_unmatched", "new_unmatched",
+              "mean_iou", "disagreement_frames"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for camera_name, result in results.items():
+            writer.writerow(dict(camera=camera_name, **result.summary()))
+
+
+def write_json(path, results, iou_threshold):
+    report = {
+        "iou_threshold": iou_threshold,
+        "cameras": {
+            camera_name: dict(result.summary(), disagreement_frame_list=result.disagreement_frames.tolist())
+            for camera_name, result in results.items()
+        },
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+
+
+def main(argv=None):
+    base_dir = os.getcwd()
+    parser = argparse.ArgumentParser(description="Old vs New 标注逐帧 IoU 对比报告")
+    parser.add_argument("--old", default=os.path.join(base_dir, "json", "annotations_old.json"))
+    parser.add_argument("--new", default=os.path.join(base_dir, "json", "annotations_new.json"))
+    parser.add_argument("--iou", type=float, default=DEFAULT_IOU_THRESHOLD, help="匹配 IoU 阈值")
+    parser.add_argument("--csv", help="输出每个相机汇总的 CSV 路径")
+    parser.add_argument("--json", help="输出包含不一致帧列表的 JSON 路径")
+    args = parser.parse_args(argv)
+
+    old_source = load_annotations(args.old)
+    new_source = load_annotations(args.new)
+    results = compare_sources(old_source, new_source, args.iou)
+
+    print(f"{'camera':<20}{'old':>8}{'new':>8}{'matched':>9}{'old_un':>8}{'new_un':>8}{'mIoU':>7}{'diff_fr':>9}")
+    for camera_name, result in results.items():
+        s = result.summary()
+        print(f"{camera_name:<20}{s['old_boxes']:>8}{s['new_boxes']:>8}{s['matched']:>9}{s['old_unmatched']:>8}"
+              f"{s['new_unmatched']:>8}{s['mean_iou']:>7.3f}{s['disagreement_frames']:>9}")
+
+    if args.csv:
+        write_csv(args.csv, results)
+        print(f"CSV report saved to {args.csv}")
+    if args.json:
+        write_json(args.json, results, args.iou)
+        print(f"JSON report saved to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
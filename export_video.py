@@ -0,0 +1,460 @@
+import os
+import sys
+import time
+import queue
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from annotation_store import open_store, prepare_store
+from npy_annotations import load_npy_annotations
+from seek_index import load_seek_index, seek_capture
+
+# 本脚本的作用：
+# 1. 不启动界面，把视频连同标注叠加层导出为新的 MP4/AVI，样式与界面一致：
+#    Old 为绿色半透明蒙版，New 为黑色矩形框，可选的 NPY 检测结果为品红色虚线框
+# 2. 每个视频是一条三段流水线：解码线程 -> 绘制线程 -> 编码线程，之间用有界队列连接，
+#    某一段变慢时上游自然阻塞，内存占用有上限
+# 3. 叠加层一次画完一帧的所有框，不逐框循环：各框的矩形写入差分数组，二维前缀和得到每个像素的覆盖次数，
+#    蒙版按覆盖次数整块混合（与逐个半透明填充叠加的效果相同），边框为“外矩形 - 内矩形”的覆盖；
+#    只处理所有框的外接区域
+# 4. 多个视频在多个进程中并行导出，标注以 .store 内存映射方式在进程间共享（同 batch_generate_histograms）
+# 5. 每段统计处理帧数和实际工作时间（不含排队等待），输出各段的 帧/秒，最慢的一段即瓶颈
+#
+# 用法：python export_video.py <视频或文件夹> [...] [--old-json ...] [--new-json ...] [--npy npy 文件夹]
+#       [-o exported_videos] [-j 进程数] [--format mp4|avi] [--fourcc mp4v] [--scale 1.0]
+#       [--start 帧号] [--end 帧号] [--queue-size 16]
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FPS = 25.0
+QUEUE_SIZE = 16
+DEFAULT_FOURCC = {"mp4": "mp4v", "avi": "MJPG"}
+STAGES = ("decode", "draw", "encode")
+
+# 与 overlay_render 中的样式一致（BGR）
+OLD_FILL_COLOR = (0, 255, 0)
+OLD_FILL_ALPHA = 80 / 255
+NEW_PEN_COLOR = (0, 0, 0)
+DET_PEN_COLOR = (255, 0, 255)
+PEN_WIDTH = 2
+# Qt.DashLine：4 倍线宽的实线 + 2 倍线宽的间隔
+DASH_ON = 4
+DASH_PERIOD = 6
+
+# 工作进程中的只读标注源（由 _init_worker 打开）
+_worker_sources = {}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="导出叠加了 Old/New 标注的视频（无界面）")
+    parser.add_argument("inputs", nargs="+", help="视频文件或包含 .avi 视频的文件夹")
+    parser.add_argument("--old-json", default=os.path.join(PROJECT_ROOT, "json", "annotations_old.json"),
+                        help="Old 标注 JSON 路径")
+    parser.add_argument("--new-json", default=os.path.join(PROJECT_ROOT, "json", "annotations_new.json"),
+                        help="New 标注 JSON 路径")
+    parser.add_argument("--npy", help="可选：按相机 .npy 检测结果所在文件夹，绘制为品红色虚线框")
+    parser.add_argument("-o", "--output", default=os.path.join(PROJECT_ROOT, "exported_videos"), help="输出目录")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    parser.add_argument("--format", default="mp4", choices=sorted(DEFAULT_FOURCC), help="输出容器格式")
+    parser.add_argument("--fourcc", help="编码器 FourCC（默认 mp4: mp4v, avi: MJPG）")
+    parser.add_argument("--scale", type=float, default=1.0, help="输出分辨率相对原视频的缩放比例")
+    parser.add_argument("--start", type=int, default=1, help="起始帧号（1-based）")
+    parser.add_argument("--end", type=int, default=0, help="结束帧号（含），0 表示到视频末尾")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="流水线各段之间的队列长度")
+    return parser.parse_args(argv)
+
+
+def collect_videos(inputs):
+    # 返回 [(视频路径, 相机名)]；文件夹展开为其中的 .avi
+    videos = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(".avi"):
+                    videos.append((os.path.join(path, name), name))
+        elif os.path.isfile(path):
+            videos.append((path, os.path.basename(path)))
+        else:
+            print(f"Warning: {path} not found, skipped.")
+    return videos
+
+
+def _coverage(rects, weights, height, width):
+    # rects 为 (k, 4) 的 [x1, y1, x2, y2)（已裁剪到区域内），返回每个像素被覆盖的加权次数 (float32)
+    # 差分数组的二维前缀和用 cv2.integral 计算（比两次 np.cumsum 快一个数量级）
+    diff = np.zeros((height + 1, width + 1), dtype=np.float32)
+    x1, y1, x2, y2 = rects.T
+    np.add.at(diff, (y1, x1), weights)
+    np.add.at(diff, (y1, x2), -weights)
+    np.add.at(diff, (y2, x1), -weights)
+    np.add.at(diff, (y2, x2), weights)
+    return cv2.integral(diff[:height, :width], sdepth=cv2.CV_32F)[1:, 1:]
+
+
+class OverlayRenderer:
+    # 在 BGR 帧上原地绘制一帧的所有标注；纯色图和虚线图样按帧尺寸缓存，跨帧复用
+    def __init__(self, pen_width=PEN_WIDTH):
+        self.pen_width = pen_width
+        self._solid = {}
+        self._dash = None
+
+    def _solid_color(self, color, frame):
+        # 与帧同尺寸的纯色图，调用方按区域切片
+        image = self._solid.get(color)
+        if image is None or image.shape != frame.shape:
+            image = np.empty_like(frame)
+            image[:] = color
+            self._solid[color] = image
+        return image
+
+    def _dash_pattern(self, frame):
+        # 横边沿 x、竖边沿 y 分段，用 (x + y) 的周期近似 Qt 的虚线
+        h, w = frame.shape[:2]
+        if self._dash is None or self._dash.shape != (h, w):
+            phase = (np.arange(h)[:, None] + np.arange(w)[None, :]) % (DASH_PERIOD * self.pen_width)
+            self._dash = np.where(phase < DASH_ON * self.pen_width, 255, 0).astype(np.uint8)
+        return self._dash
+
+    def _rects(self, boxes, scale):
+        # 原始坐标 -> 输出坐标，丢弃退化的框
+        rects = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if len(rects) == 0:
+            return np.zeros((0, 4), dtype=np.int64)
+        rects = (rects * scale).astype(np.int64)
+        return rects[(rects[:, 2] > rects[:, 0]) & (rects[:, 3] > rects[:, 1])]
+
+    def _clip(self, rects, x0, y0, width, height):
+        # 平移到区域坐标并裁剪，去掉裁剪后为空的矩形
+        rects = rects - (x0, y0, x0, y0)
+        np.clip(rects[:, 0::2], 0, width, out=rects[:, 0::2])
+        np.clip(rects[:, 1::2], 0, height, out=rects[:, 1::2])
+        return rects[(rects[:, 2] > rects[:, 0]) & (rects[:, 3] > rects[:, 1])]
+
+    def _region(self, rects, frame):
+        # 所有矩形的外接区域，返回 (x0, y0, x1, y1)，完全在画面外时返回 None
+        h, w = frame.shape[:2]
+        x0 = max(int(rects[:, 0].min()), 0)
+        y0 = max(int(rects[:, 1].min()), 0)
+        x1 = min(int(rects[:, 2].max()), w)
+        y1 = min(int(rects[:, 3].max()), h)
+        return (x0, y0, x1, y1) if x1 > x0 and y1 > y0 else None
+
+    def fill(self, frame, rects):
+        # 覆盖 n 次的像素保留原图 (1 - alpha)^n，与逐个半透明填充叠加相同
+        region = self._region(rects, frame)
+        if region is None:
+            return
+        x0, y0, x1, y1 = region
+        w, h = x1 - x0, y1 - y0
+        rects = self._clip(rects, x0, y0, w, h)
+        if not len(rects):
+            return
+        count = _coverage(rects, np.ones(len(rects), dtype=np.float32), h, w)
+        keep = cv2.exp(count * np.float32(np.log(1 - OLD_FILL_ALPHA)))
+        patch = frame[y0:y1, x0:x1]
+        cv2.blendLinear(patch, self._solid_color(OLD_FILL_COLOR, frame)[y0:y1, x0:x1], keep, 1 - keep, dst=patch)
+
+    def outline(self, frame, rects, color, dashed=False):
+        # 线宽以框边为中心（与 QPainter.drawRect 相同），内矩形为空时只保留外矩形
+        pw = self.pen_width
+        o = pw // 2
+        outer = rects + (-o, -o, pw - o, pw - o)
+        inner = rects + (pw - o, pw - o, -o, -o)
+        region = self._region(outer, frame)
+        if region is None:
+            return
+        x0, y0, x1, y1 = region
+        w, h = x1 - x0, y1 - y0
+        outer = self._clip(outer, x0, y0, w, h)
+        inner = self._clip(inner, x0, y0, w, h)
+        if not len(outer):
+            return
+        weights = np.concatenate([np.ones(len(outer), dtype=np.float32), -np.ones(len(inner), dtype=np.float32)])
+        mask = cv2.compare(_coverage(np.concatenate([outer, inner]), weights, h, w), 0, cv2.CMP_GT)
+        if dashed:
+            mask = cv2.bitwise_and(mask, self._dash_pattern(frame)[y0:y1, x0:x1])
+        patch = frame[y0:y1, x0:x1]
+        cv2.copyTo(self._solid_color(color, frame)[y0:y1, x0:x1], mask, dst=patch)
+
+    def draw(self, frame, old_boxes, new_boxes, det_boxes=(), scale=1.0):
+        old = self._rects(old_boxes, scale)
+        if len(old):
+            self.fill(frame, old)
+        new = self._rects(new_boxes, scale)
+        if len(new):
+            self.outline(frame, new, NEW_PEN_COLOR)
+        det = self._rects(det_boxes, scale)
+        if len(det):
+            self.outline(frame, det, DET_PEN_COLOR, dashed=True)
+        return frame
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        # 实际工作时间（不含队列等待）
+        self.busy = 0.0
+
+
+class ExportPipeline:
+    # 单个视频的 解码 -> 绘制 -> 编码 流水线
+    def __init__(self, video_path, camera_name, output_path, sources, fourcc, scale=1.0,
+                 start=1, end=0, queue_size=QUEUE_SIZE):
+        self.video_path = video_path
+        self.camera_name = camera_name
+        self.output_path = output_path
+        self.sources = sources
+        self.fourcc = fourcc
+        self.scale = scale
+        self.start_idx = max(start, 1) - 1
+        self.end_idx = end if end > 0 else None
+        self.decoded = queue.Queue(maxsize=queue_size)
+        self.drawn = queue.Queue(maxsize=queue_size)
+        self.stats = {name: StageStats(name) for name in STAGES}
+        self.renderer = OverlayRenderer()
+        self.error = None
+        self._stop_event = threading.Event()
+        self.fps = DEFAULT_FPS
+
+    def _put(self, q, item):
+        while not self._stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _fail(self, stage, e):
+        if self.error is None:
+            self.error = f"{stage}: {e}"
+        self._stop_event.set()
+
+    def _decode(self, cap):
+        stats = self.stats["decode"]
+        try:
+            idx = self.start_idx
+            if idx > 0 and seek_capture(cap, idx, load_seek_index(self.video_path, build=False)) < 0:
+                raise ValueError(f"could not seek to frame {idx + 1}")
+            while not self._stop_event.is_set() and (self.end_idx is None or idx < self.end_idx):
+                t0 = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if self.scale != 1.0:
+                    frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+                stats.busy += time.perf_counter() - t0
+                stats.frames += 1
+                if not self._put(self.decoded, (idx, frame)):
+                    return
+                idx += 1
+        except Exception as e:
+            self._fail("decode", e)
+        finally:
+            cap.release()
+            # 结束标记
+            self._put(self.decoded, None)
+
+    def _camera(self, key):
+        source = self.sources.get(key)
+        if not source or self.camera_name not in source:
+            return None
+        return source.load_camera(self.camera_name)
+
+    def _draw(self):
+        stats = self.stats["draw"]
+        try:
+            # 懒加载相机可能出错，放在 try 中保证总是发出结束标记，编码阶段不会一直等待
+            cams = [self._camera(key) for key in ("old", "new", "det")]
+            while True:
+                item = self._get(self.decoded)
+                if item is None:
+                    break
+                t0 = time.perf_counter()
+                idx, frame = item
+                boxes = [cam.frame(idx + 1) if cam is not None else () for cam in cams]
+                self.renderer.draw(frame, *boxes, scale=self.scale)
+                label = f"{os.path.splitext(self.camera_name)[0]}  #{idx + 1}"
+                cv2.putText(frame, label, (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 4, cv2.LINE_AA)
+                cv2.putText(frame, label, (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 1, cv2.LINE_AA)
+                stats.busy += time.perf_counter() - t0
+                stats.frames += 1
+                if not self._put(self.drawn, frame):
+                    return
+        except Exception as e:
+            self._fail("draw", e)
+        finally:
+            self._put(self.drawn, None)
+
+    def _encode(self):
+        stats = self.stats["encode"]
+        writer = None
+        try:
+            while True:
+                frame = self._get(self.drawn)
+                if frame is None:
+                    break
+                t0 = time.perf_counter()
+                if writer is None:
+                    # 尺寸以第一帧为准（含缩放）
+                    h, w = frame.shape[:2]
+                    writer = cv2.VideoWriter(self.output_path, cv2.VideoWriter_fourcc(*self.fourcc),
+                                             self.fps, (w, h))
+                    if not writer.isOpened():
+                        raise ValueError(f"could not open writer ({self.fourcc}) for {self.output_path}")
+                writer.write(frame)
+                stats.busy += time.perf_counter() - t0
+                stats.frames += 1
+        except Exception as e:
+            self._fail("encode", e)
+        finally:
+            if writer is not None:
+                writer.release()
+
+    def run(self):
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            raise ValueError(f"could not open video {self.video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else DEFAULT_FPS
+
+        start_time = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._decode, args=(cap,), name="ExportDecode", daemon=True),
+            threading.Thread(target=self._draw, name="ExportDraw", daemon=True),
+            threading.Thread(target=self._encode, name="ExportEncode", daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+
+        if self.error is not None:
+            if os.path.exists(self.output_path):
+                os.remove(self.output_path)
+            raise ValueError(self.error)
+        if self.stats["encode"].frames == 0:
+            raise ValueError("no frames decoded")
+        return {
+            "frames": self.stats["encode"].frames,
+            "elapsed": elapsed,
+            "stages": {name: (s.frames, s.busy) for name, s in self.stats.items()},
+        }
+
+
+def format_stages(stages):
+    # "decode 310 fps, draw 820 fps, encode 150 fps (bottleneck: encode)"
+    parts = []
+    for name in STAGES:
+        frames, busy = stages[name]
+        parts.append(f"{name} {frames / busy if busy > 0 else 0:.0f} fps")
+    bottleneck = max(STAGES, key=lambda name: stages[name][1])
+    return ", ".join(parts) + f" (bottleneck: {bottleneck})"
+
+
+def _init_worker(store_dirs, single_process):
+    for key, store_dir in store_dirs.items():
+        _worker_sources[key] = open_store(store_dir)
+    if not single_process:
+        # 多进程时每个进程已有三个流水线线程，避免 OpenCV 内部线程池互相抢占
+        cv2.setNumThreads(1)
+
+
+def export_video(task):
+    video_path, camera_name, output_path, options = task
+    try:
+        pipeline = ExportPipeline(video_path, camera_name, output_path, _worker_sources, **options)
+        return camera_name, "exported", pipeline.run()
+    except Exception as e:
+        return camera_name, "failed", str(e)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    videos = collect_videos(args.inputs)
+    if not videos:
+        print("No videos to export.")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    options = {
+        "fourcc": args.fourcc or DEFAULT_FOURCC[args.format],
+        "scale": args.scale,
+        "start": args.start,
+        "end": args.end,
+        "queue_size": max(args.queue_size, 1),
+    }
+    tasks = []
+    for video_path, camera_name in videos:
+        output_name = f"{os.path.splitext(camera_name)[0]}_annotated.{args.format}"
+        tasks.append((video_path, camera_name, os.path.join(args.output, output_name), options))
+
+    start_time = time.perf_counter()
+    workers = max(1, min(args.workers, len(tasks)))
+    totals = {name: [0, 0.0] for name in STAGES}
+    exported = 0
+    failed = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 标注转换为 .store 后各进程内存映射共享
+        store_dirs = {
+            "old": prepare_store(args.old_json, "old", temp_dir),
+            "new": prepare_store(args.new_json, "new", temp_dir),
+        }
+        if args.npy:
+            store_dirs["det"] = load_npy_annotations(args.npy).path
+
+        print(f"Exporting {len(tasks)} video(s) with {workers} worker(s)...")
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(store_dirs, False))
+            results = executor.map(export_video, tasks)
+        else:
+            executor = None
+            _init_worker(store_dirs, True)
+            results = map(export_video, tasks)
+
+        try:
+            for i, (task, (camera_name, status, result)) in enumerate(zip(tasks, results)):
+                if status != "exported":
+                    failed += 1
+                    print(f"[{i+1}/{len(tasks)}] {camera_name}: Error: {result}")
+                    continue
+                exported += 1
+                for name, (frames, busy) in result["stages"].items():
+                    totals[name][0] += frames
+                    totals[name][1] += busy
+                print(f"[{i+1}/{len(tasks)}] {camera_name}: {result['frames']} frames in {result['elapsed']:.2f}s "
+                      f"({result['frames'] / result['elapsed']:.0f} fps) | {format_stages(result['stages'])} "
+                      f"-> {task[2]}")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            # 释放内存映射，临时目录才能被删除（Windows）
+            _worker_sources.clear()
+
+    elapsed = time.perf_counter() - start_time
+    total_frames = totals["encode"][0]
+    print("\nExport complete!")
+    print(f"Exported {exported}, failed {failed}: {total_frames} frames in {elapsed:.2f}s "
+          f"({total_frames / elapsed if elapsed > 0 else 0:.0f} fps overall)")
+    if exported:
+        print(f"Per stage (busy time, summed over videos): {format_stages(totals)}")
+    return 0 if failed == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+import os
+import json
+
+import cv2
+import numpy as np
+
+from PyQt5.QtWidgets import QWidget, QLabel, QSizePolicy
+from PyQt5.QtCore import Qt, QThread, QPoint, QRect, QRectF, pyqtSignal
+from PyQt5.QtGui import QPixmap, QPainter, QColor, QPen
+
+from frame_convert import DisplayConverter
+from perf_trace import span, traced
+from sidecar_cache import file_signature, sidecar_paths
+
+# 本模块的作用：
+# 1. 胶片条：直方图下方一排在时间上均匀分布的缩略图，每张标出该帧的 Old/New 框数量，
+#    红框标出当前帧所在的缩略图；鼠标悬停时在上方弹出大图预览，点击跳到该缩略图的帧
+# 2. 缩略图在后台线程中顺序解码一遍生成：每帧只 grab，采样帧才 retrieve 并缩小，不逐张 seek；
+#    每完成一张就交给界面（界面线程只把小图转成 QPixmap），胶片条从左到右逐渐填满
+# 3. 结果保存在 sidecar 缓存中（.quickcheck/<视频>.thumbs.npz：所有缩略图拼成一张 JPEG + 帧号），
+#    与视频的 path/size/mtime 绑定，重新打开视频时直接读取，不再解码
+# 4. 控件宽度不够放下全部缩略图时，均匀挑选其中一部分显示
+
+THUMBS_VERSION = 1
+THUMBS_SUFFIX = ".thumbs.npz"
+# 生成的缩略图数量与高度（像素），宽度按视频宽高比
+THUMB_COUNT = 64
+THUMB_HEIGHT = 120
+THUMB_JPEG_QUALITY = 85
+# 胶片条高度
+STRIP_HEIGHT = 72
+
+OLD_COUNT_COLOR = QColor(120, 230, 120)
+NEW_COUNT_COLOR = QColor(255, 170, 60)
+
+
+def sample_frames(total_frames, count=THUMB_COUNT):
+    # 每段的中间一帧（0-based），帧数少于 count 时每帧一张
+    if total_frames <= 0:
+        return []
+    count = min(count, total_frames)
+    return [int((i + 0.5) * total_frames / count) for i in range(count)]
+
+
+def _thumb_params(count, height):
+    return {"version": THUMBS_VERSION, "count": count, "height": height}
+
+
+def load_thumbnails(video_path, count=THUMB_COUNT, height=THUMB_HEIGHT):
+    # 返回（帧号列表, BGR 缩略图列表），缓存不存在或与视频/参数不匹配时返回 None
+    try:
+        signature = file_signature(video_path)
+    except OSError:
+        return None
+    for path in sidecar_paths(video_path, THUMBS_SUFFIX):
+        if not os.path.exists(path):
+            continue
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("signature") != signature or meta.get("params") != _thumb_params(count, height):
+                    continue
+                frames = [int(f) for f in data["frames"]]
+                atlas = cv2.imdecode(data["atlas"], cv2.IMREAD_COLOR)
+        except (OSError, ValueError, KeyError):
+            continue
+        if atlas is None or not frames:
+            continue
+        return frames, np.split(atlas, len(frames), axis=1)
+    return None
+
+
+def save_thumbnails(video_path, frames, thumbs, count=THUMB_COUNT, height=THUMB_HEIGHT):
+    # 所有缩略图横向拼成一张 JPEG，比逐张保存原始像素小一个数量级
+    ok, atlas = cv2.imencode(".jpg", np.hstack(thumbs), [cv2.IMWRITE_JPEG_QUALITY, THUMB_JPEG_QUALITY])
+    if not ok:
+        return None
+    meta = {"signature": file_signature(video_path), "params": _thumb_params(count, height)}
+    paths = sidecar_paths(video_path, THUMBS_SUFFIX)
+    for path in paths:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, meta=np.array(json.dumps(meta)), frames=np.asarray(frames, dtype=np.int64), atlas=atlas)
+            os.replace(tmp_path, path)
+            return path
+        except OSError:
+            continue
+    print(f"Warning: could not write cache {paths[0]}")
+    return None
+
+
+def _shrink(frame, size):
+    # 先逐级 2:1 INTER_AREA（整数倍有快速路径）到不小于目标尺寸，再一次缩放到目标尺寸；
+    # 4K 帧直接非整数倍 INTER_AREA 约慢 5 倍
+    h, w = frame.shape[:2]
+    while w // 2 >= size[0] and h // 2 >= size[1]:
+        frame = cv2.resize(frame[:h // 2 * 2, :w // 2 * 2], (w // 2, h // 2), interpolation=cv2.INTER_AREA)
+        h, w = frame.shape[:2]
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+def generate_thumbnails(video_path, total_frames, count=THUMB_COUNT, height=THUMB_HEIGHT,
+                        on_thumbnail=None, is_cancelled=lambda: False):
+    # 顺序解码一遍，on_thumbnail(序号, 帧号, BGR 缩略图)；返回（帧号列表, 缩略图列表），取消时返回 None
+    targets = sample_frames(total_frames, count)
+    frames, thumbs = [], []
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened() or not targets:
+        cap.release()
+        return frames, thumbs
+    try:
+        size = None
+        for frame_idx in range(targets[-1] + 1):
+            if is_cancelled():
+                return None
+            # 非采样帧只 grab，省去颜色转换和拷贝
+            if not cap.grab():
+                break
+            if frame_idx != targets[len(frames)]:
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            if size is None:
+                h, w = frame.shape[:2]
+                size = (max(1, round(w * height / h)), height)
+            thumb = _shrink(frame, size)
+            if on_thumbnail is not None:
+                on_thumbnail(len(frames), frame_idx, thumb)
+            frames.append(frame_idx)
+            thumbs.append(thumb)
+    finally:
+        cap.release()
+    return frames, thumbs
+
+
+class ThumbnailThread(QThread):
+    # (视频, 序号, 帧号, QImage) / (视频, 缩略图数量)
+    thumbnail_ready = pyqtSignal(str, int, int, object)
+    done = pyqtSignal(str, int)
+
+    def __init__(self, video_path, total_frames, parent=None):
+        super().__init__(parent)
+        self.video_path = video_path
+        self.total_frames = total_frames
+        self.converter = DisplayConverter()
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _emit(self, index, frame_idx, thumb):
+        h, w = thumb.shape[:2]
+        # QImage 引用转换器的缓冲区，复制一份再交给界面线程
+        self.thumbnail_ready.emit(self.video_path, index, frame_idx, self.converter.convert(thumb, w, h).copy())
+
+    def run(self):
+        try:
+            cached = load_thumbnails(self.video_path)
+            if cached is not None:
+                for index, (frame_idx, thumb) in enumerate(zip(*cached)):
+                    self._emit(index, frame_idx, thumb)
+                self.done.emit(self.video_path, len(cached[0]))
+                return
+
+            with span("thumbnails"):
+                result = generate_thumbnails(self.video_path, self.total_frames, on_thumbnail=self._emit,
+                                             is_cancelled=lambda: self._cancelled)
+            if result is None:
+                return
+            frames, thumbs = result
+            # 视频提前结束（容器头帧数偏大）时也保存已生成的部分
+            if thumbs:
+                save_thumbnails(self.video_path, frames, thumbs)
+            self.done.emit(self.video_path, len(frames))
+        except Exception as e:
+            print(f"Error generating thumbnails for {self.video_path}: {e}")
+
+
+class FilmstripView(QWidget):
+    # 点击缩略图时发出其帧号（0-based）
+    frame_selected = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.video_path = None
+        self.total_frames = 0
+        # 序号 -> (帧号, QPixmap)，按生成顺序陆续到达
+        self.thumbnails = {}
+        self.expected = 0
+        self.counts_old = None
+        self.counts_new = None
+        self.cursor_frame = 0
+        self.hover_slot = None
+        self.setFixedHeight(STRIP_HEIGHT)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.setMouseTracking(True)
+        self.setFocusPolicy(Qt.NoFocus)
+        # 悬停预览：无焦点的浮动窗口，不抢走主窗口的键盘焦点
+        self.preview = QLabel(self, Qt.ToolTip)
+        self.preview.setAlignment(Qt.AlignCenter)
+        self.preview.setStyleSheet("background: #202020; color: white; border: 1px solid #808080;")
+
+    def set_video(self, video_path, total_frames):
+        self.video_path = video_path
+        self.total_frames = total_frames
+        self.thumbnails = {}
+        self.expected = len(sample_frames(total_frames))
+        self.hover_slot = None
+        self.preview.hide()
+        self.update()
+
+    def add_thumbnail(self, video_path, index, frame_idx, image):
+        if video_path != self.video_path:
+            return
+        self.thumbnails[index] = (frame_idx, QPixmap.fromImage(image))
+        self.expected = max(self.expected, index + 1)
+        self.update()
+
+    def finish(self, video_path, count):
+        # 实际生成的数量可能少于预期（视频提前结束）
+        if video_path == self.video_path:
+            self.expected = count
+            self.update()
+
+    def set_counts(self, counts_old, counts_new):
+        self.counts_old = counts_old
+        self.counts_new = counts_new
+        self.update()
+
+    def set_cursor(self, frame_idx):
+        if frame_idx != self.cursor_frame:
+            self.cursor_frame = frame_idx
+            self.update()
+
+    def _shown(self):
+        # 宽度能放下的缩略图序号（均匀挑选）
+        if self.expected <= 0:
+            return []
+        first = next(iter(self.thumbnails.values()), None)
+        aspect = first[1].width() / first[1].height() if first else 16 / 9
+        fit = max(1, int(self.width() / (self.height() * aspect)))
+        if fit >= self.expected:
+            return list(range(self.expected))
+        return sorted(set(np.linspace(0, self.expected - 1, fit).round().astype(int).tolist()))
+
+    def _slot_at(self, x, shown):
+        if not shown:
+            return None
+        return min(max(int(x * len(shown) / max(self.width(), 1)), 0), len(shown) - 1)
+
+    def _count(self, counts, frame_idx):
+        if counts is None or not 0 <= frame_idx < len(counts):
+            return 0
+        return int(counts[frame_idx])
+
+    @traced("filmstrip_paint")
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(30, 30, 30))
+        shown = self._shown()
+        if not shown:
+            painter.end()
+            return
+
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        font = painter.font()
+        font.setPixelSize(11)
+        painter.setFont(font)
+        slot_w = self.width() / len(shown)
+        current = None
+        for slot, index in enumerate(shown):
+            rect = QRectF(slot * slot_w + 1, 1, slot_w - 2, self.height() - 2)
+            entry = self.thumbnails.get(index)
+            if entry is None:
+                painter.fillRect(rect, QColor(50, 50, 50))
+                continue
+            frame_idx, pixmap = entry
+            # 保持宽高比居中
+            scale = min(rect.width() / pixmap.width(), rect.height() / pixmap.height())
+            w, h = pixmap.width() * scale, pixmap.height() * scale
+            target = QRectF(rect.center().x() - w / 2, rect.center().y() - h / 2, w, h)
+            painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+
+            # Old / New 框数量
+            old = self._count(self.counts_old, frame_idx)
+            new = self._count(self.counts_new, frame_idx)
+            label_rect = QRect(int(target.left()), int(target.bottom()) - 14, int(target.width()), 14)
+            painter.fillRect(label_rect, QColor(0, 0, 0, 150))
+            painter.setPen(OLD_COUNT_COLOR)
+            painter.drawText(label_rect.adjusted(3, 0, 0, 0), Qt.AlignLeft | Qt.AlignVCenter, str(old))
+            painter.setPen(NEW_COUNT_COLOR)
+            painter.drawText(label_rect.adjusted(0, 0, -3, 0), Qt.AlignRight | Qt.AlignVCenter, str(new))
+            if frame_idx <= self.cursor_frame:
+                current = slot
+
+        # 当前帧所在的缩略图：该帧之前最近的一张
+        if current is not None:
+            painter.setPen(QPen(QColor(255, 0, 0), 2))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(QRectF(current * slot_w + 1, 1, slot_w - 2, self.height() - 2))
+        if self.hover_slot is not None and self.hover_slot < len(shown):
+            painter.setPen(QPen(QColor(255, 255, 255), 1))
+            painter.drawRect(QRectF(self.hover_slot * slot_w + 1, 1, slot_w - 2, self.height() - 2))
+        painter.end()
+
+    def mouseMoveEvent(self, event):
+        shown = self._shown()
+        slot = self._slot_at(event.x(), shown)
+        if slot != self.hover_slot:
+            self.hover_slot = slot
+            self.update()
+            self._show_preview(shown[slot] if slot is not None else None)
+        super().mouseMoveEvent(event)
+
+    def _show_preview(self, index):
+        entry = self.thumbnails.get(index) if index is not None else None
+        if entry is None:
+            self.preview.hide()
+            return
+        frame_idx, pixmap = entry
+        # 原尺寸缩略图下方加一行帧号和框数量，文字比缩略图宽时加宽预览
+        caption = (f"帧 {frame_idx + 1}   Old {self._count(self.counts_old, frame_idx)}"
+                   f" / New {self._count(self.counts_new, frame_idx)}")
+        width = max(pixmap.width(), self.fontMetrics().horizontalAdvance(caption) + 8)
+        preview = QPixmap(width, pixmap.height() + 18)
+        preview.fill(QColor(32, 32, 32))
+        painter = QPainter(preview)
+        painter.drawPixmap((width - pixmap.width()) // 2, 0, pixmap)
+        painter.setPen(QColor(255, 255, 255))
+        painter.drawText(QRect(4, pixmap.height(), width - 8, 18), Qt.AlignLeft | Qt.AlignVCenter, caption)
+        painter.end()
+        self.preview.setPixmap(preview)
+        self.preview.adjustSize()
+        # 以悬停的缩略图为中心，显示在胶片条上方
+        shown = self._shown()
+        slot_w = self.width() / max(len(shown), 1)
+        x = int((self.hover_slot + 0.5) * slot_w - self.preview.width() / 2)
+        x = min(max(x, 0), max(self.width() - self.preview.width(), 0))
+        self.preview.move(self.mapToGlobal(QPoint(x, -self.preview.height() - 4)))
+        self.preview.show()
+
+    def leaveEvent(self, event):
+        self.hover_slot = None
+        self.preview.hide()
+        self.update()
+        super().leaveEvent(event)
+
+    def mousePressEvent(self, event):
+        if event.button() != Qt.LeftButton:
+            return
+        shown = self._shown()
+        slot = self._slot_at(event.x(), shown)
+        entry = self.thumbnails.get(shown[slot]) if slot is not None else None
+        if entry is not None:
+            self.frame_selected.emit(entry[0])
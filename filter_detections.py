@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from annotation_store import (AnnotationStore, CameraAnnotations, open_store, prepare_store, source_signature,
+                              store_path_for, write_store)
+from perf_trace import span
+
+# 本模块的作用：
+# 1. 由原始检测结果（YOLO，与标注相同的 {视频: {帧号: [[x1,y1,x2,y2], ...]}} 格式）和运动检测结果
+#    （annotations_old.json）重新生成 New 标注：保留与同一帧某个运动框满足重叠条件的检测框
+# 2. 重叠条件可选：any（有任意面积重叠，即原先的规则）、iou（IoU >= 阈值）、coverage（检测框被运动框覆盖的比例 >= 阈值）
+# 3. 每个相机只枚举同一帧内的（检测框, 运动框）对，批量计算重叠，每个检测框取对所有运动框的最大得分；
+#    不同阈值只是对同一组得分做比较，扫描多个阈值不需要重新计算
+# 4. 相机分摊到进程池，工作进程内存映射两份标注的 .store（与 track_index 相同）
+# 5. 输出可被 VideoLabeler 直接加载的 JSON，并写好对应的 .store（打开时直接内存映射）；
+#    多个阈值时每个阈值一个文件，不指定输出时只打印各阈值保留的框数
+#
+# 用法：python filter_detections.py detections.json [--motion json/annotations_old.json]
+#       [--criterion any|iou|coverage] [--threshold 0.1 0.3 0.5] [-o json/annotations_new_regen.json] [-j 进程数]
+
+CRITERIA = ("any", "iou", "coverage")
+DEFAULT_CRITERION = "any"
+DEFAULT_THRESHOLD = 0.5
+# 每块同时计算的（检测框, 运动框）对数上限，限制内存占用
+CHUNK_PAIRS = 1 << 22
+
+# 工作进程中的只读标注源（由 _init_worker 打开）
+_worker_sources = None
+
+
+def _frame_chunks(pairs, limit=CHUNK_PAIRS):
+    # 按帧切块，每块的配对数不超过 limit（单帧超过时独占一块）
+    ends = np.cumsum(pairs)
+    chunks = []
+    start = 0
+    while start < len(pairs):
+        base = ends[start - 1] if start else 0
+        end = max(int(np.searchsorted(ends, base + limit, side="right")), start + 1)
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def overlap_scores(det, motion, criterion):
+    # det / motion: (K, 4) 一一对应的框对 -> (K,) 得分；any 与 coverage 相同（any 只要求 > 0）
+    det = det.astype(np.float64)
+    motion = motion.astype(np.float64)
+    iw = np.clip(np.minimum(det[:, 2], motion[:, 2]) - np.maximum(det[:, 0], motion[:, 0]), 0, None)
+    ih = np.clip(np.minimum(det[:, 3], motion[:, 3]) - np.maximum(det[:, 1], motion[:, 1]), 0, None)
+    inter = iw * ih
+    area_det = np.clip(det[:, 2] - det[:, 0], 0, None) * np.clip(det[:, 3] - det[:, 1], 0, None)
+    if criterion == "iou":
+        area_motion = np.clip(motion[:, 2] - motion[:, 0], 0, None) * np.clip(motion[:, 3] - motion[:, 1], 0, None)
+        denom = area_det + area_motion - inter
+    else:
+        denom = area_det
+    return np.divide(inter, denom, out=np.zeros_like(inter), where=denom > 0)
+
+
+def best_overlap(det_cam, motion_cam, criterion=DEFAULT_CRITERION):
+    # 每个检测框（按 det_cam.all_boxes() 的顺序）与同帧所有运动框的最大得分，没有运动框时为 0
+    det_offsets = np.asarray(det_cam.offsets, dtype=np.int64)
+    det_boxes = np.asarray(det_cam.all_boxes())
+    best = np.zeros(len(det_boxes), dtype=np.float32)
+    if motion_cam is None or not len(det_boxes):
+        return best
+    motion_offsets = np.asarray(motion_cam.offsets, dtype=np.int64)
+    motion_boxes = np.asarray(motion_cam.all_boxes())
+
+    n = min(det_cam.n_frames, motion_cam.n_frames)
+    det_counts = np.diff(det_offsets[:n + 1])
+    motion_counts = np.diff(motion_offsets[:n + 1])
+    det_starts = det_offsets[:n] - det_offsets[0]
+    motion_starts = motion_offsets[:n] - motion_offsets[0]
+    pairs = det_counts * motion_counts
+
+    for start, end in _frame_chunks(pairs):
+        chunk_pairs = pairs[start:end]
+        total = int(chunk_pairs.sum())
+        if not total:
+            continue
+        # 第 k 对：帧内第 k // m 个检测框与第 k % m 个运动框（m 为该帧运动框数），同一检测框的配对连续
+        frames = np.repeat(np.arange(start, end), chunk_pairs)
+        k = np.arange(total) - np.repeat(np.cumsum(chunk_pairs) - chunk_pairs, chunk_pairs)
+        m = motion_counts[frames]
+        det_idx = det_starts[frames] + k // m
+        motion_idx = motion_starts[frames] + k % m
+        with span("filter_overlap"):
+            scores = overlap_scores(det_boxes[det_idx], motion_boxes[motion_idx], criterion)
+        runs = np.flatnonzero(np.diff(det_idx, prepend=-1))
+        best[det_idx[runs]] = np.maximum.reduceat(scores, runs)
+    return best
+
+
+def keep_mask(best, criterion, threshold):
+    if criterion == "any":
+        return best > 0
+    return best >= threshold
+
+
+def filter_camera(det_cam, keep):
+    # 按保留掩码生成新的 CameraAnnotations（帧数与检测结果相同）
+    offsets = np.asarray(det_cam.offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    frame_of_box = np.repeat(np.arange(len(counts)), counts)
+    kept_counts = np.bincount(frame_of_box[keep], minlength=len(counts))
+    new_offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(kept_counts, out=new_offsets[1:])
+    boxes = np.ascontiguousarray(np.asarray(det_cam.all_boxes())[keep], dtype=np.int32)
+    return CameraAnnotations(new_offsets, boxes)
+
+
+def write_annotations_json(store, path):
+    # 只写有框的帧，帧号为 1-based 字符串（md/annotations_structure.md）
+    data = {}
+    for name, cam in store.items():
+        data[name] = {str(int(frame_no)): cam.frame(frame_no).tolist() for frame_no in cam.frame_numbers()}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def output_path_for(output, criterion, threshold, multiple):
+    # 多个阈值时在文件名后加上条件和阈值，如 annotations_new_iou0.3.json
+    if not multiple:
+        return output
+    root, ext = os.path.splitext(output)
+    return f"{root}_{criterion}{threshold:g}{ext or '.json'}"
+
+
+def _init_worker(det_store_dir, motion_store_dir):
+    global _worker_sources
+    _worker_sources = (open_store(det_store_dir), open_store(motion_store_dir))
+
+
+def _score_task(task):
+    camera_name, criterion = task
+    detections, motion = _worker_sources
+    motion_cam = motion[camera_name] if camera_name in motion else None
+    return camera_name, best_overlap(detections[camera_name], motion_cam, criterion)
+
+
+def score_detections(det_json, motion_json, criterion=DEFAULT_CRITERION, workers=1, temp_dir=None):
+    # 返回 (检测结果 AnnotationStore, {相机: 每个检测框的最大得分})
+    det_store_dir = prepare_store(det_json, "detections", temp_dir)
+    motion_store_dir = prepare_store(motion_json, "motion", temp_dir)
+    detections = open_store(det_store_dir)
+    tasks = [(name, criterion) for name in detections]
+    scores = {}
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(det_store_dir, motion_store_dir)) as executor:
+            for name, best in executor.map(_score_task, tasks):
+                scores[name] = best
+    else:
+        _init_worker(det_store_dir, motion_store_dir)
+        for task in tasks:
+            name, best = _score_task(task)
+            scores[name] = best
+    return detections, scores
+
+
+def regenerate(detections, scores, criterion, threshold, output=None):
+    # 按一个阈值生成新标注；给出 output 时写 JSON 和对应的 .store。返回 (保留框数, 有框帧数)
+    store = AnnotationStore({name: filter_camera(detections[name], keep_mask(best, criterion, threshold))
+                             for name, best in scores.items()})
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        write_annotations_json(store, output)
+        write_store(store, store_path_for(output), source=source_signature(output))
+    kept = sum(len(cam.all_boxes()) for cam in store.values())
+    frames = sum(len(cam) for cam in store.values())
+    return kept, frames
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="由原始检测结果和运动检测结果重新生成 New 标注")
+    parser.add_argument("detections", help="原始检测结果 JSON（与标注相同的嵌套格式）")
+    parser.add_argument("--motion", default=os.path.join("json", "annotations_old.json"),
+                        help="运动检测结果 JSON（默认 json/annotations_old.json）")
+    parser.add_argument("--criterion", choices=CRITERIA, default=DEFAULT_CRITERION,
+                        help="保留条件：any 任意重叠 / iou IoU >= 阈值 / coverage 检测框被覆盖比例 >= 阈值")
+    parser.add_argument("--threshold", type=float, nargs="+", default=[DEFAULT_THRESHOLD],
+                        help="iou / coverage 的阈值，可给出多个一次扫描")
+    parser.add_argument("-o", "--output", help="输出 JSON；多个阈值时文件名后加条件和阈值。不指定时只打印统计")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for path in (args.detections, args.motion):
+        if not os.path.exists(path):
+            print(f"Error: {path} not found.")
+            return 1
+    # any 不使用阈值
+    thresholds = [0.0] if args.criterion == "any" else args.threshold
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        detections, scores = score_detections(args.detections, args.motion, args.criterion, args.workers, temp_dir)
+        total = sum(len(best) for best in scores.values())
+        print(f"Scored {total} detections in {len(scores)} cameras ({time.perf_counter() - start:.2f}s)")
+
+        print(f"\n{'criterion':<12}{'threshold':>10}{'kept':>12}{'ratio':>9}{'frames':>10}  output")
+        for threshold in thresholds:
+            output = output_path_for(args.output, args.criterion, threshold, len(thresholds) > 1) \
+                if args.output else None
+            kept, frames = regenerate(detections, scores, args.criterion, threshold, output)
+            label = "-" if args.criterion == "any" else f"{threshold:g}"
+            ratio = kept / total if total else 0.0
+            print(f"{args.criterion:<12}{label:>10}{kept:>12}{ratio:>8.1%}{frames:>10}  {output or ''}")
+    print(f"\nCompleted in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import sys
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from PyQt5.QtCore import QRectF
+from PyQt5.QtGui import QImage, QPixmap
+
+from perf_trace import traced
+
+# 本模块的作用：
+# 1. 把解码得到的 BGR 帧转换为显示用的 QImage：用一次 cvtColor(BGR2BGRA) 写入 Qt 原生的 RGB32 布局
+#    （小端内存顺序即 B,G,R,A），QPixmap.fromImage 只需整块拷贝；实测 Qt 自带的 BGR888/RGB888
+#    到 pixmap 的转换都比这更慢。大端平台回退到 RGB888
+# 2. 显示区域不到原始分辨率一半时，先用 cv2.resize(INTER_AREA) 逐级 2:1 缩小到接近显示尺寸
+#    （不小于显示尺寸）再交给 Qt，剩余不足 2 倍的缩放由绘制时完成；OpenCV 对整数倍的 INTER_AREA
+#    有快速路径，非整数倍的 INTER_AREA 比整帧拷贝还慢。放大查看时的画面由 TileCache 提供
+# 3. 每一级的结果写入跨帧复用的预分配缓冲区，尺寸变化时才重新分配
+# 4. 统计转换次数、缓冲区分配次数和平均耗时
+# 5. TileCache：放大查看时把帧按缩放级别切成 TILE_SIZE 的小块（原始分辨率及逐级 2:1 缩小的金字塔，
+#    按需生成），只转换可见的小块并缓存为 QPixmap（LRU）；平移只补齐新露出的块，换帧时清空
+
+NATIVE_BGRA = sys.byteorder == "little"
+TILE_SIZE = 256
+MAX_TILES = 256
+# 金字塔最多缩小的级数
+MAX_TILE_LEVEL = 6
+
+
+def _to_qimage(src):
+    # BGR 数组 -> 持有自身数据的 QImage（与 DisplayConverter 相同的像素格式选择）
+    h, w = src.shape[:2]
+    if NATIVE_BGRA:
+        out = cv2.cvtColor(src, cv2.COLOR_BGR2BGRA)
+        return QImage(out.data, w, h, out.strides[0], QImage.Format_RGB32).copy()
+    out = cv2.cvtColor(src, cv2.COLOR_BGR2RGB)
+    return QImage(out.data, w, h, out.strides[0], QImage.Format_RGB888).copy()
+
+
+class DisplayConverter:
+    def __init__(self):
+        # 缓冲区按用途分开：0 为交给 Qt 的输出，1.. 为逐级缩小的结果
+        self._buffers = {}
+        self.conversions = 0
+        self.allocations = 0
+        self.total_time = 0.0
+
+    def _get_buffer(self, height, width, level=0, channels=3):
+        buffer = self._buffers.get(level)
+        if buffer is None or buffer.shape != (height, width, channels):
+            buffer = np.empty((height, width, channels), dtype=np.uint8)
+            self._buffers[level] = buffer
+            self.allocations += 1
+        return buffer
+
+    def _downscale(self, frame, target_width, target_height):
+        # 逐级 2:1 INTER_AREA，直到再缩小一半会小于目标尺寸；不需要缩小时原样返回
+        level = 1
+        h, w = frame.shape[:2]
+        while w // 2 >= target_width and h // 2 >= target_height:
+            half = self._get_buffer(h // 2, w // 2, level)
+            # 奇数尺寸裁掉最后一行/列，保持严格 2:1
+            cv2.resize(frame[:h // 2 * 2, :w // 2 * 2], (w // 2, h // 2), dst=half, interpolation=cv2.INTER_AREA)
+            frame = half
+            h, w = frame.shape[:2]
+            level += 1
+        return frame
+
+    @traced("convert")
+    def convert(self, frame, target_width, target_height, full_resolution=False):
+        # 返回的 QImage 直接引用内部缓冲区，只在下一次 convert 之前有效，调用方应立即转换为 QPixmap
+        t0 = time.perf_counter()
+        h, w = frame.shape[:2]
+        scale = min(target_width / w, target_height / h) if target_width > 0 and target_height > 0 else 1.0
+
+        src = frame
+        if not full_resolution and scale < 0.5:
+            src = self._downscale(frame, max(1, int(w * scale)), max(1, int(h * scale)))
+
+        h, w = src.shape[:2]
+        if NATIVE_BGRA:
+            out = self._get_buffer(h, w, channels=4)
+            cv2.cvtColor(src, cv2.COLOR_BGR2BGRA, dst=out)
+            image = QImage(out.data, w, h, out.strides[0], QImage.Format_RGB32)
+        else:
+            out = self._get_buffer(h, w)
+            cv2.cvtColor(src, cv2.COLOR_BGR2RGB, dst=out)
+            image = QImage(out.data, w, h, out.strides[0], QImage.Format_RGB888)
+
+        self.conversions += 1
+        self.total_time += time.perf_counter() - t0
+        return image
+
+    def stats(self):
+        return {
+            "conversions": self.conversions,
+            "allocations": self.allocations,
+            "avg_ms": self.total_time / self.conversions * 1000 if self.conversions else 0.0,
+        }
+
+
+class TileCache:
+    def __init__(self, tile_size=TILE_SIZE, max_tiles=MAX_TILES):
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        # 金字塔：_levels[k] 为原始帧缩小 2^k 倍
+        self._levels = []
+        # (级别, 列, 行) -> QPixmap
+        self._tiles = OrderedDict()
+        self.conversions = 0
+        self.hits = 0
+
+    def set_frame(self, frame):
+        self._levels = [frame] if frame is not None else []
+        self._tiles.clear()
+
+    def level_for(self, scale):
+        # 分辨率不低于显示比例的最小一级：0.5^k >= scale
+        k = 0
+        while k < MAX_TILE_LEVEL and scale <= 0.5 ** (k + 1):
+            k += 1
+        return k
+
+    def _level(self, k):
+        while len(self._levels) <= k:
+            prev = self._levels[-1]
+            h, w = prev.shape[:2]
+            if w < 2 * self.tile_size or h < 2 * self.tile_size:
+                break
+            half = cv2.resize(prev[:h // 2 * 2, :w // 2 * 2], (w // 2, h // 2), interpolation=cv2.INTER_AREA)
+            self._levels.append(half)
+        return min(k, len(self._levels) - 1)
+
+    def _tile(self, k, tx, ty, level):
+        key = (k, tx, ty)
+        pixmap = self._tiles.get(key)
+        if pixmap is not None:
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return pixmap
+        t = self.tile_size
+        pixmap = QPixmap.fromImage(_to_qimage(level[ty * t:(ty + 1) * t, tx * t:(tx + 1) * t]))
+        self._tiles[key] = pixmap
+        self.conversions += 1
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return pixmap
+
+    @traced("tiles")
+    def visible_tiles(self, scale, x0, y0, x1, y1):
+        # 原始分辨率坐标中的可见范围 -> [(该块在原始分辨率中的 QRectF, QPixmap)]
+        if not self._levels:
+            return []
+        k = self._level(self.level_for(scale))
+        level = self._levels[k]
+        full_h, full_w = self._levels[0].shape[:2]
+        h, w = level.shape[:2]
+        fx, fy = full_w / w, full_h / h
+        t = self.tile_size
+        tx0, tx1 = max(int(x0 / fx) // t, 0), min(int(x1 / fx) // t, (w - 1) // t)
+        ty0, ty1 = max(int(y0 / fy) // t, 0), min(int(y1 / fy) // t, (h - 1) // t)
+        tiles = []
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                tw, th = min(t, w - tx * t), min(t, h - ty * t)
+                rect = QRectF(tx * t * fx, ty * t * fy, tw * fx, th * fy)
+                tiles.append((rect, self._tile(k, tx, ty, level)))
+        return tiles
+
+    def stats(self):
+        return {"tiles": len(self._tiles), "conversions": self.conversions, "hits": self.hits}
@@ -0,0 +1,202 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+
+from perf_trace import span
+from seek_index import load_seek_index, seek_capture
+
+# 本模块的作用：
+# 1. 在工作线程中顺序解码视频帧，以解码得到的 BGR 格式放入有上限的 LRU 缓存（显示时再按显示尺寸转换，见 frame_convert）
+# 2. 按浏览方向预读当前帧前后的若干帧，A/D 单步时直接命中缓存，无需 seek + 重新解码
+# 3. get_frame 从不等待解码：未命中时返回 None，工作线程解码出（或读取失败）这一帧后调用 on_frame_ready，
+#    界面收到后再重绘；读取失败的帧在跳转（非单步）或 seek 索引就绪后重新尝试
+# 4. 缓存大小以 MB 配置，命中/未命中次数通过 hits/misses 暴露
+# 5. 后台加载 seek 索引（见 seek_index），随机跳转时先 seek 到最近的关键帧再顺序解码到目标帧，
+#    索引就绪后用校验过的帧数替换容器头中的帧数
+
+DEFAULT_CACHE_MB = 512
+DEFAULT_PREFETCH = 32
+MIN_CACHE_FRAMES = 4
+
+
+class FrameProvider:
+    def __init__(self, video_path, cache_mb=DEFAULT_CACHE_MB, prefetch=DEFAULT_PREFETCH, on_index_ready=None,
+                 on_frame_ready=None):
+        self.video_path = video_path
+        self.on_index_ready = on_index_ready
+        # 未命中的帧解码完成或失败后在工作线程中调用 (video_path, 0-based 帧号)
+        self.on_frame_ready = on_frame_ready
+        self.seek_index = None
+        # VideoCapture 只在工作线程中读取
+        self.cap = cv2.VideoCapture(video_path)
+        self.total_frames = 0
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+        self.capacity = MIN_CACHE_FRAMES
+        self.prefetch = prefetch
+
+        self.hits = 0
+        self.misses = 0
+
+        self._cache = OrderedDict()
+        self._failed = set()
+        # get_frame 未命中、等待通知的帧
+        self._waiting = None
+        self._cond = threading.Condition()
+        self._target = 0
+        self._direction = 1
+        self._pos = 0
+        self._stopped = False
+        self._thread = None
+
+        if not self.cap.isOpened():
+            return
+
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frame_bytes = max(self.width * self.height * 3, 1)
+        self.capacity = max(MIN_CACHE_FRAMES, int(cache_mb * 1024 * 1024 // frame_bytes))
+        # 预读窗口不超过缓存的一半，避免把刚看过的帧挤出去
+        self.prefetch = max(1, min(prefetch, self.capacity // 2))
+
+        self._thread = threading.Thread(target=self._run, name="FrameProvider", daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._load_index, name="SeekIndex", daemon=True).start()
+
+    def is_opened(self):
+        return self._thread is not None and not self._stopped
+
+    def get_frame(self, frame_idx):
+        # 返回 0-based 帧号对应的 BGR 帧（只读共享）；尚未解码或读取失败时返回 None（见 failed）
+        if not 0 <= frame_idx < self.total_frames:
+            return None
+        with self._cond:
+            if abs(frame_idx - self._target) > 1:
+                # 跳转：之前读取失败的帧重新尝试
+                self._failed.clear()
+            if frame_idx > self._target:
+                self._direction = 1
+            elif frame_idx < self._target:
+                self._direction = -1
+            self._target = frame_idx
+            self._cond.notify_all()
+
+            frame = self._cache.get(frame_idx)
+            if frame is not None:
+                self.hits += 1
+                self._cache.move_to_end(frame_idx)
+                self._waiting = None
+                return frame
+            if frame_idx not in self._failed:
+                self.misses += 1
+                self._waiting = frame_idx
+            return None
+
+    def failed(self, frame_idx):
+        with self._cond:
+            return frame_idx in self._failed
+
+    def stats(self):
+        with self._cond:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "cached": len(self._cache),
+                "capacity": self.capacity,
+            }
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is None:
+            self.cap.release()
+            return
+        # 工作线程可能仍在 seek/解码：由它在退出循环时释放 VideoCapture，这里不等太久
+        self._thread.join(timeout=2.0)
+
+    def _load_index(self):
+        try:
+            index = load_seek_index(self.video_path)
+        except Exception as e:
+            print(f"Warning: could not build seek index for {self.video_path}: {e}")
+            return
+        with self._cond:
+            if self._stopped:
+                return
+            self.seek_index = index
+            if index.frame_count > 0:
+                self.total_frames = index.frame_count
+            # 有了索引后 seek 可能成功
+            self._failed.clear()
+            self._cond.notify_all()
+        if self.on_index_ready is not None:
+            self.on_index_ready(self.video_path, index)
+
+    def _next_to_decode(self):
+        target = self._target
+        if 0 <= target < self.total_frames and target not in self._cache and target not in self._failed:
+            return target
+
+        if self._direction >= 0:
+            candidates = range(target + 1, min(target + self.prefetch, self.total_frames - 1) + 1)
+        else:
+            # 向后浏览时从窗口起点顺序解码，只需一次 seek
+            candidates = range(max(target - self.prefetch, 0), target)
+        for idx in candidates:
+            if idx not in self._cache and idx not in self._failed:
+                return idx
+        return None
+
+    def _run(self):
+        try:
+            self._decode_loop()
+        finally:
+            self.cap.release()
+
+    def _decode_loop(self):
+        while True:
+            with self._cond:
+                idx = self._next_to_decode()
+                while idx is None and not self._stopped:
+                    self._cond.wait()
+                    idx = self._next_to_decode()
+                if self._stopped:
+                    return
+
+            frame = self._decode(idx)
+
+            with self._cond:
+                if frame is None:
+                    self._failed.add(idx)
+                else:
+                    self._cache[idx] = frame
+                    while len(self._cache) > self.capacity:
+                        self._cache.popitem(last=False)
+                notify = idx == self._waiting and not self._stopped
+                if notify:
+                    self._waiting = None
+                self._cond.notify_all()
+            if notify and self.on_frame_ready is not None:
+                self.on_frame_ready(self.video_path, idx)
+
+    def _seek(self, frame_idx):
+        self._pos = seek_capture(self.cap, frame_idx, self.seek_index, self._pos)
+        return self._pos == frame_idx
+
+    def _decode(self, frame_idx):
+        if frame_idx != self._pos:
+            with span("seek", frame=frame_idx):
+                if not self._seek(frame_idx):
+                    return None
+        with span("decode"):
+            ret, frame = self.cap.read()
+        if not ret:
+            self._pos = -1
+            return None
+        self._pos = frame_idx + 1
+        return frame
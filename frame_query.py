@@ -0,0 +1,273 @@
+import os
+import ast
+import sys
+import json
+import time
+import bisect
+import argparse
+
+import numpy as np
+
+from annotation_store import load_annotations
+from annotation_stats import compute_camera_stats
+from compare_annotations import DEFAULT_IOU_THRESHOLD, compare_camera
+
+# 本模块的作用：
+# 1. 为每个相机准备按帧的数组（框数量、面积、Old/New 匹配结果），用一个小的查询表达式筛选帧，
+#    结果是有序的帧号数组，按查询字符串缓存
+# 2. “下一个/上一个匹配帧”用 bisect 在有序帧号数组上查找，不再逐帧按键寻找
+# 3. 查询表达式是 Python 表达式的一个安全子集，对整个数组向量化求值：
+#      变量：old, new（框数量）, old_area/new_area（框总面积）, old_min_area/new_min_area,
+#            old_max_area/new_max_area, matched, old_unmatched, new_unmatched, iou（当前帧匹配的平均 IoU）
+#      运算：数字、+ - * /、比较（可连写）、and / or / not、括号
+#      预设：diff, new_only, old_only, disagree, empty, 以及 PRESETS 中的其他名字
+#    例如：old != new、new > 0 and old == 0、old > 5、new > 0 and new_min_area < 400
+# 4. 命令行对 json/ 下的整个数据集在所有相机上运行查询并列出命中的帧
+#
+# 用法：python frame_query.py "<表达式>" [--old ...] [--new ...] [--camera 名称 ...] [--iou 0.5] [--json 输出路径]
+
+PRESETS = {
+    "diff": "old != new",
+    "new_only": "new > 0 and old == 0",
+    "old_only": "old > 0 and new == 0",
+    "disagree": "old_unmatched > 0 or new_unmatched > 0",
+    "empty": "old == 0 and new == 0",
+}
+
+# 需要 Old/New 对比结果的变量
+COMPARISON_VARIABLES = ("matched", "old_unmatched", "new_unmatched", "iou")
+STATS_VARIABLES = {
+    "": "counts",
+    "_area": "total_area",
+    "_min_area": "min_area",
+    "_max_area": "max_area",
+}
+VARIABLES = tuple(prefix + suffix for prefix in ("old", "new") for suffix in STATS_VARIABLES) + COMPARISON_VARIABLES
+
+_BIN_OPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+}
+_CMP_OPS = {
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+}
+
+
+class QueryError(ValueError):
+    pass
+
+
+def parse_query(expression):
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise QueryError(f"查询语法错误: {e.msg}")
+    _check(tree.body)
+    return tree.body
+
+
+def _check(node, presets_seen=()):
+    # 只允许白名单中的语法节点和变量名
+    if isinstance(node, ast.BoolOp):
+        for value in node.values:
+            _check(value, presets_seen)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.USub)):
+        _check(node.operand, presets_seen)
+    elif isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+        _check(node.left, presets_seen)
+        _check(node.right, presets_seen)
+    elif isinstance(node, ast.Compare) and all(type(op) in _CMP_OPS for op in node.ops):
+        _check(node.left, presets_seen)
+        for comparator in node.comparators:
+            _check(comparator, presets_seen)
+    elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        pass
+    elif isinstance(node, ast.Name):
+        if node.id in PRESETS:
+            if node.id in presets_seen:
+                raise QueryError(f"预设循环引用: {node.id}")
+            _check(parse_query(PRESETS[node.id]), presets_seen + (node.id,))
+        elif node.id not in VARIABLES:
+            raise QueryError(f"未知变量: {node.id}")
+    else:
+        raise QueryError(f"不支持的表达式: {ast.dump(node)[:40]}")
+
+
+def query_names(node):
+    # 表达式（展开预设后）用到的变量名
+    names = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name):
+            if child.id in PRESETS:
+                names |= query_names(parse_query(PRESETS[child.id]))
+            else:
+                names.add(child.id)
+    return names
+
+
+def evaluate(node, variables):
+    if isinstance(node, ast.BoolOp):
+        op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        result = _as_mask(evaluate(node.values[0], variables))
+        for value in node.values[1:]:
+            result = op(result, _as_mask(evaluate(value, variables)))
+        return result
+    if isinstance(node, ast.UnaryOp):
+        operand = evaluate(node.operand, variables)
+        return np.logical_not(_as_mask(operand)) if isinstance(node.op, ast.Not) else np.negative(operand)
+    if isinstance(node, ast.BinOp):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return _BIN_OPS[type(node.op)](evaluate(node.left, variables), evaluate(node.right, variables))
+    if isinstance(node, ast.Compare):
+        # a < b < c 等价于 (a < b) and (b < c)
+        left = evaluate(node.left, variables)
+        result = None
+        for op, comparator in zip(node.ops, node.comparators):
+            right = evaluate(comparator, variables)
+            part = _CMP_OPS[type(op)](left, right)
+            result = part if result is None else np.logical_and(result, part)
+            left = right
+        return result
+    if isinstance(node, ast.Constant):
+        return node.value
+    if node.id in PRESETS:
+        return evaluate(parse_query(PRESETS[node.id]), variables)
+    return variables[node.id]
+
+
+def _as_mask(value):
+    return np.asarray(value) != 0
+
+
+def build_variables(stats_old, stats_new, comparison, n_frames):
+    # 所有变量补零/截断到 n_frames；缺少的数据按 0 处理
+    variables = {}
+    for prefix, stats in (("old", stats_old), ("new", stats_new)):
+        for suffix, name in STATS_VARIABLES.items():
+            variables[prefix + suffix] = (stats.padded(name, n_frames) if stats is not None
+                                          else np.zeros(n_frames, dtype=np.int64))
+    if comparison is not None:
+        iou = np.divide(comparison.iou_sum, comparison.matched,
+                        out=np.zeros(len(comparison.matched)), where=comparison.matched > 0)
+        for name, values in (("matched", comparison.matched), ("old_unmatched", comparison.old_unmatched),
+                             ("new_unmatched", comparison.new_unmatched), ("iou", iou)):
+            padded = np.zeros(n_frames, dtype=values.dtype)
+            n = min(n_frames, len(values))
+            padded[:n] = values[:n]
+            variables[name] = padded
+    return variables
+
+
+class FrameQueryIndex:
+    # 单个相机的按帧变量 + 查询结果缓存（查询字符串 -> 有序 1-based 帧号数组）
+
+    def __init__(self, variables, n_frames):
+        self.variables = variables
+        self.n_frames = n_frames
+        self._results = {}
+
+    def has_comparison(self):
+        return "matched" in self.variables
+
+    def frames(self, expression):
+        expression = expression.strip()
+        frames = self._results.get(expression)
+        if frames is None:
+            node = parse_query(expression)
+            missing = query_names(node) - set(self.variables)
+            if missing:
+                raise QueryError(f"缺少 Old/New 对比数据: {', '.join(sorted(missing))}")
+            mask = np.broadcast_to(_as_mask(evaluate(node, self.variables)), (self.n_frames,))
+            frames = np.flatnonzero(mask) + 1
+            self._results[expression] = frames
+        return frames
+
+    def next_frame(self, expression, frame_no):
+        # 严格大于 frame_no 的第一个匹配帧，没有则返回 None
+        frames = self.frames(expression)
+        i = bisect.bisect_right(frames, frame_no)
+        return int(frames[i]) if i < len(frames) else None
+
+    def previous_frame(self, expression, frame_no):
+        frames = self.frames(expression)
+        i = bisect.bisect_left(frames, frame_no)
+        return int(frames[i - 1]) if i > 0 else None
+
+
+def build_index(cam_old, cam_new, with_comparison=True, iou_threshold=DEFAULT_IOU_THRESHOLD, n_frames=None):
+    stats_old = compute_camera_stats(cam_old) if cam_old is not None else None
+    stats_new = compute_camera_stats(cam_new) if cam_new is not None else None
+    if n_frames is None:
+        n_frames = max(stats_old.n_frames if stats_old else 0, stats_new.n_frames if stats_new else 0)
+    comparison = compare_camera(cam_old, cam_new, iou_threshold) if with_comparison else None
+    return FrameQueryIndex(build_variables(stats_old, stats_new, comparison, n_frames), n_frames)
+
+
+def format_ranges(frames, limit=20):
+    # [1, 2, 3, 7] -> "1-3, 7"；超过 limit 段时省略
+    if len(frames) == 0:
+        return ""
+    breaks = np.flatnonzero(np.diff(frames) != 1) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks, [len(frames)]]) - 1
+    parts = [str(frames[s]) if s == e else f"{frames[s]}-{frames[e]}" for s, e in zip(starts, ends)]
+    if len(parts) > limit:
+        parts = parts[:limit] + [f"... (+{len(parts) - limit} 段)"]
+    return ", ".join(parts)
+
+
+def main(argv=None):
+    base_dir = os.getcwd()
+    parser = argparse.ArgumentParser(description="在所有相机上按查询表达式查找帧")
+    parser.add_argument("query", help="查询表达式，例如 \"new > 0 and old == 0\"；预设: " + ", ".join(PRESETS))
+    parser.add_argument("--old", default=os.path.join(base_dir, "json", "annotations_old.json"))
+    parser.add_argument("--new", default=os.path.join(base_dir, "json", "annotations_new.json"))
+    parser.add_argument("--camera", nargs="*", help="只查询这些相机（默认全部）")
+    parser.add_argument("--iou", type=float, default=DEFAULT_IOU_THRESHOLD, help="对比变量使用的匹配 IoU 阈值")
+    parser.add_argument("--json", help="把每个相机的命中帧列表写入 JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        node = parse_query(args.query)
+    except QueryError as e:
+        print(f"Error: {e}")
+        return 1
+    with_comparison = bool(query_names(node) & set(COMPARISON_VARIABLES))
+
+    start_time = time.perf_counter()
+    old_source = load_annotations(args.old)
+    new_source = load_annotations(args.new)
+    cameras = args.camera or sorted(set(old_source) | set(new_source))
+
+    results = {}
+    total = 0
+    for camera_name in cameras:
+        cam_old = old_source.load_camera(camera_name) if camera_name in old_source else None
+        cam_new = new_source.load_camera(camera_name) if camera_name in new_source else None
+        if cam_old is None and cam_new is None:
+            print(f"{camera_name}: no annotations")
+            continue
+        frames = build_index(cam_old, cam_new, with_comparison, args.iou).frames(args.query)
+        results[camera_name] = frames.tolist()
+        total += len(frames)
+        if len(frames):
+            print(f"{camera_name}: {len(frames)} frames: {format_ranges(frames)}")
+
+    elapsed = time.perf_counter() - start_time
+    print(f"{total} matching frames in {len(results)} cameras ({elapsed:.2f}s)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"query": args.query, "cameras": results}, f, indent=1)
+        print(f"Results saved to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import numpy as np
+
+from PyQt5.QtCore import pyqtSignal
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+
+from perf_trace import span, traced
+
+# 本模块的作用：
+# 1. 直方图时间轴控件：静态的 Old 柱状图 / New 折线只在数据或尺寸变化时渲染一次，缓存为背景
+# 2. 当前帧指示线为 animated 艺术家，移动时只恢复背景并 blit 指示线区域，耗时与视频长度无关
+# 3. 帧数远多于像素列时，按像素列分桶：Old 取每桶最大值，New 画每桶 min/max 包络
+# 4. 在时间轴上点击或拖动时发出 frame_selected（0-based 帧号）用于跳转
+
+# 帧数超过像素列数的该倍数时分桶降采样
+DOWNSAMPLE_FACTOR = 2
+
+
+class HistogramTimeline(FigureCanvas):
+    frame_selected = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        self.figure = Figure(figsize=(5, 1.5), dpi=100)
+        super().__init__(self.figure)
+        self.setParent(parent)
+        self.ax = self.figure.add_subplot(111)
+
+        self.total_frames = 0
+        self.counts_old = None
+        self.counts_new = None
+        self.title = ""
+        self.cursor_frame = 1
+        self.cursor_line = None
+        self._background = None
+        self._dragging = False
+        self._last_selected = None
+
+        self.mpl_connect("draw_event", self._on_draw)
+        self.mpl_connect("button_press_event", self._on_press)
+        self.mpl_connect("motion_notify_event", self._on_motion)
+        self.mpl_connect("button_release_event", self._on_release)
+        self._render()
+
+    def set_data(self, counts_old, counts_new, title):
+        self.total_frames = len(counts_old)
+        self.counts_old = np.asarray(counts_old)
+        self.counts_new = np.asarray(counts_new)
+        self.title = title
+        self._render()
+
+    def clear_data(self):
+        self.total_frames = 0
+        self.counts_old = None
+        self.counts_new = None
+        self.title = ""
+        self._render()
+
+    def set_cursor(self, frame_no):
+        # 1-based 帧号；只 blit 指示线
+        self.cursor_frame = frame_no
+        if self.cursor_line is None:
+            return
+        self.cursor_line.set_xdata([frame_no])
+        if self._background is None:
+            return
+        with span("histogram_cursor"):
+            self.restore_region(self._background)
+            self.ax.draw_artist(self.cursor_line)
+            self.blit(self.ax.bbox)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        # 分桶数量跟随像素宽度
+        if self.total_frames > 0:
+            self._render()
+
+    @traced("histogram_render")
+    def _render(self):
+        self.ax.clear()
+        self._background = None
+        self.cursor_line = None
+        self.ax.set_title("Detection Boxes Histogram (Old vs New)")
+        self.ax.set_xlabel("Frame")
+        self.ax.set_ylabel("Count")
+
+        if self.total_frames > 0:
+            self._plot_counts()
+            self.ax.set_title(self.title)
+            self.ax.set_xlabel("Frame Number")
+            self.ax.set_ylabel("Box Count")
+            self.ax.set_xlim(0, self.total_frames + 1)
+            self.ax.legend(loc='upper right')
+            # 当前帧指示线
+            self.cursor_line = self.ax.axvline(x=self.cursor_frame, color='red', linewidth=2,
+                                               linestyle='--', animated=True)
+        try:
+            self.figure.tight_layout()
+        except ValueError:
+            pass
+        self.draw()
+
+    def _plot_counts(self):
+        n = self.total_frames
+        width_px = max(int(self.ax.bbox.width), 1)
+        if n <= width_px * DOWNSAMPLE_FACTOR:
+            edges = np.arange(n + 1) + 0.5
+            self.ax.stairs(self.counts_old, edges, fill=True, color='skyblue', label='Old', alpha=0.6)
+            self.ax.plot(np.arange(1, n + 1), self.counts_new, color='orange', label='New', linewidth=1.5)
+            return
+
+        # 每个像素列一个桶
+        starts = np.unique(np.linspace(0, n, width_px + 1).astype(np.int64)[:-1])
+        edges = np.append(starts, n) + 0.5
+        old_max = np.maximum.reduceat(self.counts_old, starts)
+        new_min = np.minimum.reduceat(self.counts_new, starts)
+        new_max = np.maximum.reduceat(self.counts_new, starts)
+        self.ax.stairs(old_max, edges, fill=True, color='skyblue', label='Old', alpha=0.6)
+        centers = (edges[:-1] + edges[1:]) / 2
+        xs = np.repeat(centers, 2)
+        ys = np.column_stack([new_min, new_max]).ravel()
+        self.ax.plot(xs, ys, color='orange', label='New', linewidth=1.5)
+
+    def _on_draw(self, event):
+        # 完整重绘后缓存不含指示线的背景，再把指示线画上去
+        self._background = self.copy_from_bbox(self.ax.bbox)
+        if self.cursor_line is not None:
+            self.ax.draw_artist(self.cursor_line)
+
+    def _frame_at(self, event):
+        if event.inaxes is not self.ax or event.xdata is None or self.total_frames <= 0:
+            return None
+        return int(np.clip(round(event.xdata), 1, self.total_frames)) - 1
+
+    def _on_press(self, event):
+        if event.button != 1:
+            return
+        frame_idx = self._frame_at(event)
+        if frame_idx is None:
+            return
+        self._dragging = True
+        self._emit_selected(frame_idx)
+
+    def _on_motion(self, event):
+        if not self._dragging:
+            return
+        frame_idx = self._frame_at(event)
+        if frame_idx is not None:
+            self._emit_selected(frame_idx)
+
+    def _on_release(self, event):
+        self._dragging = False
+        self._last_selected = None
+
+    def _emit_selected(self, frame_idx):
+        if frame_idx == self._last_selected:
+            return
+        self._last_selected = frame_idx
+        self.frame_selected.emit(frame_idx)
@@ -1,9 +1,23 @@
 import sys
-import cv2
 import os
-import json
+import time
 import numpy as np
 
+from annotation_store import AnnotationStore, load_annotations
+from annotation_reload import AnnotationFileWatcher, reload_json
+from annotation_stats import StatsCache
+from npy_annotations import load_npy_annotations
+from compare_annotations import ComparisonCache
+from filmstrip import FilmstripView, ThumbnailThread
+from frame_query import FrameQueryIndex, QueryError, build_variables, PRESETS
+from frame_provider import FrameProvider, DEFAULT_CACHE_MB
+from frame_convert import DisplayConverter, TileCache
+from overlay_render import draw_annotations, draw_tracks
+from perf_trace import TRACER, span, traced
+from playback import PlaybackController, PLAYBACK_SPEEDS
+from spatial_heatmap import HeatmapCache, colorize, colorize_ratio
+from track_index import TrackCache
+
 
 # 本项目的作用：
 # 1. 提供一个可视化的工具，用于查看和分析视频中的运动性检测结果
@@ -12,63 +26,330 @@ import numpy as np
 # 4. 显示旧版数据的绿色半透明蒙版和新版数据的黑色矩形框
 # 5. 绘制红色十字和延长虚线，用于指示当前帧的位置
 # 6. 显示直方图，展示旧版和新版数据在每帧中的框数量
+# 7. 可选加载按相机保存的 .npy 检测结果，作为第三层（品红虚线框）叠加显示
+# 8. 分阶段计时（见 perf_trace）：F3 显示/隐藏性能 HUD（各阶段滚动 p50/p95），F4 导出 Chrome trace JSON
+# 9. Old/New JSON 在磁盘上变化时自动在后台重新加载，只换入内容变化的相机（见 annotation_reload）
+# 10. 跨帧轨迹（见 track_index）：绘制当前帧各个框前后若干帧的轨迹，鼠标移到框上显示轨迹 ID，
+#     '[' / ']' 跳到该轨迹的起始/结束帧，'T' 显示/隐藏轨迹
+# 11. 'H' 切换当前相机的空间热力图叠加层（Old / New / New 保留比例，见 spatial_heatmap）
+# 12. 滚轮以鼠标为中心放大/缩小，拖动平移，双击恢复适应窗口；放大时只绘制可见的预缩放小块和可见的框，
+#     切换帧时保持缩放和位置
+# 13. 直方图下方的缩略图胶片条（见 filmstrip）：后台顺序解码一遍生成并缓存到磁盘，悬停预览，点击跳转
 
 # Adjust import order: Import PyQt5 before matplotlib to avoid ImportError
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLabel, QFileDialog, 
-                             QLineEdit, QMessageBox, QScrollArea, QSizePolicy, QTextEdit, QComboBox)
-from PyQt5.QtCore import Qt, QTimer, QPoint, QRect
-from PyQt5.QtGui import QImage, QPixmap, QIntValidator, QPainter, QPen, QColor, QBrush
+                             QLineEdit, QMessageBox, QScrollArea, QSizePolicy, QTextEdit, QComboBox,
+                             QStackedWidget, QDockWidget)
+from PyQt5.QtCore import Qt, QRect, QRectF, QThread, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap, QIntValidator, QPainter, QPen, QColor, QRegion
 
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
+from histogram_timeline import HistogramTimeline
+from camera_grid import CameraGridView, select_cameras
+from perf_hud import PerfHud
+from video_browser import VideoBrowser
 
 class AnnotatedImageLabel(QLabel):
+    # 帧按显示尺寸转换（见 frame_convert），标注坐标按原始分辨率 image_size 换算
+    # 缩放后的帧和标注叠加层只在帧/标注/尺寸/缩放/平移变化时渲染一次，缓存为控件大小的 QPixmap；
+    # 鼠标移动只重绘十字光标和虚线所在的条带区域
+    # 放大（zoom > 1）时画面来自 TileCache 中可见的预缩放小块，view_center 为视图中心的图像坐标
+    # 设置环境变量 QUICKCHECK_DEBUG_PAINT=1 时打印每次 paintEvent 的耗时
+
+    # 十字光标条带的半宽（像素），包含线宽和抗锯齿
+    CROSSHAIR_MARGIN = 6
+
+    # 最大放大比例（屏幕像素 / 原始像素）与滚轮每格的缩放倍数
+    MAX_PIXEL_SCALE = 16.0
+    WHEEL_ZOOM_STEP = 1.25
+
+    # 鼠标位置换算到图像坐标（原始分辨率），离开控件时为 (-1, -1)
+    hover_moved = pyqtSignal(float, float)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setMouseTracking(True)
         self.mouse_pos = None
         self.old_annotations = []
         self.new_annotations = []
+        self.det_annotations = []
+        # 轨迹折线 [(标签, 轨迹 ID, 中心点)] 和高亮的 (标签, 轨迹 ID)
+        self.trajectories = []
+        self.highlight_track = None
+        # 热力图 QImage（每像素对应原始分辨率的 heatmap_cell x heatmap_cell 个像素）
+        self.heatmap = None
+        self.heatmap_cell = 1
         self.parent_ref = parent
+        self._overlay = None
+        self.debug_paint = os.environ.get("QUICKCHECK_DEBUG_PAINT", "") not in ("", "0")
+
+        # 当前 BGR 帧（原始分辨率）及其尺寸 (w, h)
+        self.converter = DisplayConverter()
+        self._frame = None
+        self.image_size = None
+        # 相对“适应窗口”的放大倍数；放大时的视图中心（图像坐标）和拖动起点
+        self.zoom = 1.0
+        self.view_center = None
+        self._drag_pos = None
+        self.tiles = TileCache()
+        # 放大期间换帧时推迟适应窗口的整帧转换，恢复缩放时再转换
+        self._fit_stale = False
+
+    @property
+    def zoomed(self):
+        return self.zoom > 1.0
+
+    def setPixmap(self, pixmap):
+        super().setPixmap(pixmap)
+        self._overlay = None
+
+    def setText(self, text):
+        self._frame = None
+        self.image_size = None
+        super().setText(text)
+
+    def set_frame(self, frame):
+        self._frame = frame
+        self.tiles.set_frame(frame)
+        if self.zoomed:
+            h, w = frame.shape[:2]
+            self.image_size = (w, h)
+            self._fit_stale = True
+            self._overlay = None
+            return
+        self._convert_frame()
+
+    def _convert_frame(self):
+        self._fit_stale = False
+        dpr = self.devicePixelRatioF()
+        h, w = self._frame.shape[:2]
+        image = self.converter.convert(self._frame, int(self.width() * dpr), int(self.height() * dpr))
+        self.image_size = (w, h)
+        with span("pixmap_upload"):
+            self.setPixmap(QPixmap.fromImage(image))
+
+    def set_annotations(self, old_annots, new_annots, det_annots=None):
+        self.old_annotations = old_annots if old_annots is not None else []
+        self.new_annotations = new_annots if new_annots is not None else []
+        self.det_annotations = det_annots if det_annots is not None else []
+        self._overlay = None
+        self.update()
+
+    def set_heatmap(self, image, cell=1):
+        self.heatmap = image
+        self.heatmap_cell = cell
+        self._overlay = None
+        self.update()
+
+    def set_tracks(self, trajectories, highlight=None):
+        self.trajectories = trajectories
+        self.highlight_track = highlight
+        self._overlay = None
+        self.update()
+
+    def resizeEvent(self, event):
+        self._overlay = None
+        self._clamp_view()
+        super().resizeEvent(event)
+        # 显示尺寸变化后按新尺寸重新转换当前帧
+        if self._frame is not None:
+            self._convert_frame()
+
+    def _crosshair_region(self, pos):
+        m = self.CROSSHAIR_MARGIN
+        return QRegion(0, pos.y() - m, self.width(), 2 * m + 1) + QRegion(pos.x() - m, 0, 2 * m + 1, self.height())
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.zoomed:
+            self._drag_pos = event.pos()
+        super().mousePressEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._drag_pos = None
+        super().mouseReleaseEvent(event)
+
+    def mouseDoubleClickEvent(self, event):
+        self.reset_zoom()
+        super().mouseDoubleClickEvent(event)
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        if not steps or self.image_size is None:
+            super().wheelEvent(event)
+            return
+        self.zoom_at(self.WHEEL_ZOOM_STEP ** steps, event.pos())
+        event.accept()
+
+    def _fit_scale(self):
+        w_img, h_img = self.image_size
+        return min(self.width() / w_img, self.height() / h_img)
+
+    def _clamp_view(self):
+        # 画面比控件小的方向居中，否则不让图像边缘进入控件内部
+        if self.view_center is None or self.image_size is None:
+            return
+        w_img, h_img = self.image_size
+        scale = self._fit_scale() * self.zoom
+        half_w, half_h = self.width() / (2 * scale), self.height() / (2 * scale)
+        cx, cy = self.view_center
+        cx = w_img / 2 if 2 * half_w >= w_img else min(max(cx, half_w), w_img - half_w)
+        cy = h_img / 2 if 2 * half_h >= h_img else min(max(cy, half_h), h_img - half_h)
+        self.view_center = (cx, cy)
+
+    def zoom_at(self, factor, pos):
+        # 以控件坐标 pos 下的图像点为中心缩放
+        scale, dx, dy, _, _ = self.image_transform()
+        ix, iy = (pos.x() - dx) / scale, (pos.y() - dy) / scale
+        fit = self._fit_scale()
+        zoom = min(max(self.zoom * factor, 1.0), max(self.MAX_PIXEL_SCALE / fit, 1.0))
+        if zoom == self.zoom:
+            return
+        self.zoom = zoom
+        if zoom <= 1.0:
+            self.reset_zoom()
+            return
+        scale = fit * zoom
+        self.view_center = ((self.width() / 2 - pos.x()) / scale + ix, (self.height() / 2 - pos.y()) / scale + iy)
+        self._clamp_view()
+        self._overlay = None
+        self.update()
 
-    def set_annotations(self, old_annots, new_annots):
-        self.old_annotations = old_annots or []
-        self.new_annotations = new_annots or []
+    def reset_zoom(self):
+        self.zoom = 1.0
+        self.view_center = None
+        self._drag_pos = None
+        if self._fit_stale and self._frame is not None:
+            self._convert_frame()
+        self._overlay = None
         self.update()
 
+    def visible_image_rect(self):
+        # 控件可见范围在图像坐标（原始分辨率）中的 (x0, y0, x1, y1)
+        scale, dx, dy, _, _ = self.image_transform()
+        return -dx / scale, -dy / scale, (self.width() - dx) / scale, (self.height() - dy) / scale
+
     def mouseMoveEvent(self, event):
+        # 拖动平移时整体重绘
+        if self._drag_pos is not None and event.buttons() & Qt.LeftButton:
+            scale = self._fit_scale() * self.zoom
+            delta = event.pos() - self._drag_pos
+            self._drag_pos = event.pos()
+            cx, cy = self.view_center
+            self.view_center = (cx - delta.x() / scale, cy - delta.y() / scale)
+            self._clamp_view()
+            self.mouse_pos = event.pos()
+            self._overlay = None
+            self.update()
+            super().mouseMoveEvent(event)
+            return
+
+        # 只重绘旧位置和新位置的十字条带
+        region = QRegion()
+        if self.mouse_pos is not None:
+            region += self._crosshair_region(self.mouse_pos)
         self.mouse_pos = event.pos()
-        self.update()
+        region += self._crosshair_region(self.mouse_pos)
+        self.update(region)
+        if self.image_size is not None:
+            scale, dx, dy, _, _ = self.image_transform()
+            self.hover_moved.emit((self.mouse_pos.x() - dx) / scale, (self.mouse_pos.y() - dy) / scale)
         super().mouseMoveEvent(event)
 
+    def image_transform(self):
+        # 图像坐标（原始分辨率）-> 控件坐标的缩放比例和偏移量
+        if self.image_size is not None:
+            w_img, h_img = self.image_size
+        else:
+            w_img, h_img = self.pixmap().width(), self.pixmap().height()
+        scale = min(self.width() / w_img, self.height() / h_img)
+        if self.zoomed and self.view_center is not None:
+            # 放大：偏移量为浮点数，由视图中心决定
+            scale *= self.zoom
+            cx, cy = self.view_center
+            return scale, self.width() / 2 - cx * scale, self.height() / 2 - cy * scale, w_img * scale, h_img * scale
+        w_dest = int(w_img * scale)
+        h_dest = int(h_img * scale)
+        dx = int((self.width() - w_dest) / 2)
+        dy = int((self.height() - h_dest) / 2)
+        return scale, dx, dy, w_dest, h_dest
+
+    @traced("overlay_render")
+    def _render_overlay(self):
+        # 帧 + Old/New 标注渲染到控件大小的缓存
+        dpr = self.devicePixelRatioF()
+        overlay = QPixmap(self.size() * dpr)
+        overlay.setDevicePixelRatio(dpr)
+        overlay.fill(self.palette().color(self.backgroundRole()))
+        painter = QPainter(overlay)
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        scale, dx, dy, w_dest, h_dest = self.image_transform()
+        viewport = self.visible_image_rect()
+
+        if self.zoomed and self._frame is not None:
+            # 放大：只绘制可见的小块；边缘取整，相邻小块之间不留缝
+            target_rect = QRectF(dx, dy, w_dest, h_dest)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform, scale < 1.0)
+            for rect, tile in self.tiles.visible_tiles(scale * dpr, *viewport):
+                x0, y0 = round(rect.left() * scale + dx), round(rect.top() * scale + dy)
+                x1, y1 = round(rect.right() * scale + dx), round(rect.bottom() * scale + dy)
+                painter.drawPixmap(QRect(x0, y0, x1 - x0, y1 - y0), tile)
+        else:
+            # 绘制图片（已按显示尺寸预缩小，剩余缩放不足 2 倍）
+            target_rect = QRect(dx, dy, w_dest, h_dest)
+            painter.drawPixmap(target_rect, self.pixmap())
+
+        # 热力图叠加在画面之上、标注之下（格子按原始分辨率对齐，只取可见部分）
+        if self.heatmap is not None:
+            painter.save()
+            painter.setClipRect(target_rect)
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+            cell = self.heatmap_cell
+            source = QRectF(viewport[0] / cell, viewport[1] / cell, (viewport[2] - viewport[0]) / cell,
+                            (viewport[3] - viewport[1]) / cell).intersected(QRectF(self.heatmap.rect()))
+            if not source.isEmpty():
+                target = QRectF(source.x() * cell * scale + dx, source.y() * cell * scale + dy,
+                                source.width() * cell * scale, source.height() * cell * scale)
+                painter.drawImage(target, self.heatmap, source)
+            painter.restore()
+
+        # Old 绿色蒙版 / New 黑框 / NPY 品红虚线框（只画与可见范围相交的框）
+        draw_annotations(painter, self.old_annotations, self.new_annotations, scale, dx, dy,
+                         det_boxes=self.det_annotations, viewport=viewport)
+        # 轨迹折线（Old 深绿 / New 橙色，鼠标所在的轨迹高亮）
+        if self.trajectories:
+            draw_tracks(painter, self.trajectories, scale, dx, dy, highlight=self.highlight_track, viewport=viewport)
+
+        # 放大倍数（相对原始分辨率）
+        if self.zoomed:
+            painter.setPen(QColor(255, 255, 255))
+            painter.drawText(QRect(0, 4, self.width() - 8, 20), Qt.AlignRight | Qt.AlignTop, f"{scale * 100:.0f}%")
+        painter.end()
+        return overlay
+
+    @traced("paint")
     def paintEvent(self, event):
         pixmap = self.pixmap()
         if not pixmap:
             super().paintEvent(event)
             return
-
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-
-        # 计算缩放比例和偏移量
-        w_widget = self.width()
-        h_widget = self.height()
-        w_img = pixmap.width()
-        h_img = pixmap.height()
-
-        if w_img == 0 or h_img == 0:
+        if pixmap.width() == 0 or pixmap.height() == 0:
             return
 
-        scale = min(w_widget / w_img, h_widget / h_img)
-        w_dest = int(w_img * scale)
-        h_dest = int(h_img * scale)
-        dx = int((w_widget - w_dest) / 2)
-        dy = int((h_widget - h_dest) / 2)
+        t0 = time.perf_counter()
+        rebuilt = self._overlay is None or self._overlay.size() != self.size()
+        if rebuilt:
+            self._overlay = self._render_overlay()
 
-        # 绘制图片
-        target_rect = QRect(dx, dy, w_dest, h_dest)
-        painter.drawPixmap(target_rect, pixmap)
+        # 只拷贝需要重绘的区域（源矩形为缓存的物理像素坐标）
+        painter = QPainter(self)
+        dpr = self._overlay.devicePixelRatioF()
+        rects = event.region().rects()
+        for rect in rects:
+            painter.drawPixmap(QRectF(rect), self._overlay,
+                               QRectF(rect.x() * dpr, rect.y() * dpr, rect.width() * dpr, rect.height() * dpr))
+        painter.setRenderHint(QPainter.Antialiasing)
         
         # 绘制十字光标 (保留展示逻辑)
         if self.mouse_pos is not None and 0 <= self.mouse_pos.x() < self.width() and 0 <= self.mouse_pos.y() < self.height():
@@ -85,40 +366,11 @@ class AnnotatedImageLabel(QLabel):
             painter.setPen(pen_dash)
             painter.drawLine(0, my, self.width(), my)
             painter.drawLine(mx, 0, mx, self.height())
-        
-        # 绘制 Old Annotations (绿色蒙版)
-        if self.old_annotations:
-            # 绿色填充，带透明度
-            brush = QBrush(QColor(0, 255, 0, 80)) # R, G, B, Alpha
-            painter.setBrush(brush)
-            painter.setPen(Qt.NoPen)
-            for b in self.old_annotations:
-                if len(b) >= 4:
-                    x1, y1, x2, y2 = b[:4]
-                    # 坐标变换
-                    x1 = int(x1 * scale + dx)
-                    y1 = int(y1 * scale + dy)
-                    x2 = int(x2 * scale + dx)
-                    y2 = int(y2 * scale + dy)
-                    
-                    painter.drawRect(x1, y1, x2 - x1, y2 - y1)
-
-        # 绘制 New Annotations (黑框)
-        if self.new_annotations:
-            pen_box = QPen(Qt.black)
-            pen_box.setWidth(2)
-            painter.setPen(pen_box)
-            painter.setBrush(Qt.NoBrush)
-            for b in self.new_annotations:
-                if len(b) >= 4:
-                    x1, y1, x2, y2 = b[:4]
-                    # 坐标变换
-                    x1 = int(x1 * scale + dx)
-                    y1 = int(y1 * scale + dy)
-                    x2 = int(x2 * scale + dx)
-                    y2 = int(y2 * scale + dy)
-                    
-                    painter.drawRect(x1, y1, x2 - x1, y2 - y1)
+        painter.end()
+
+        if self.debug_paint:
+            print(f"paintEvent {(time.perf_counter() - t0) * 1000:.2f} ms "
+                  f"({'overlay rebuilt' if rebuilt else 'cached'}, {sum(r.width() * r.height() for r in rects)} px)")
     
     def enterEvent(self, event):
         self.setCursor(Qt.BlankCursor)
@@ -126,16 +378,128 @@ class AnnotatedImageLabel(QLabel):
     
     def leaveEvent(self, event):
         self.setCursor(Qt.ArrowCursor)
+        self.hover_moved.emit(-1.0, -1.0)
         super().leaveEvent(event)
 
+class AnnotationIndexThread(QThread):
+    # 后台建立 Old/New 标注的索引（存在 .store 时直接内存映射）
+    progress = pyqtSignal(str)
+    # {标签: 标注源}
+    loaded = pyqtSignal(object)
+
+    def __init__(self, paths, parent=None):
+        super().__init__(parent)
+        # {标签: JSON 路径}，只加载给出的标签
+        self.paths = dict(paths)
+
+    def run(self):
+        sources = {}
+        for label, path in self.paths.items():
+            try:
+                with span("load_annotations", file=label):
+                    source = load_annotations(
+                        path, progress=lambda frac, label=label: self.progress.emit(f"索引 {label} JSON {frac:.0%}"))
+            except Exception as e:
+                print(f"Error loading {label} annotations: {e}")
+                source = AnnotationStore()
+            sources[label] = source
+        self.loaded.emit(sources)
+
+
+class AnnotationReloadThread(QThread):
+    # JSON 在磁盘上变化后，后台重新索引并找出内容变化的相机（见 annotation_reload）
+    reloaded = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, label, path, source, raw_digests, parent=None):
+        super().__init__(parent)
+        self.label = label
+        self.path = path
+        self.source = source
+        self.raw_digests = raw_digests
+
+    def run(self):
+        try:
+            with span("reload_annotations", file=self.label):
+                result = reload_json(self.path, self.source, self.raw_digests)
+        except Exception as e:
+            self.failed.emit(self.label, str(e))
+            return
+        self.reloaded.emit(self.label, result)
+
+
+class NpyLoadThread(QThread):
+    # 后台加载 .npy 检测结果（首次加载时转换为内存映射存储）
+    progress = pyqtSignal(str)
+    loaded = pyqtSignal(str, object)
+
+    def __init__(self, npy_dir, parent=None):
+        super().__init__(parent)
+        self.npy_dir = npy_dir
+
+    def run(self):
+        try:
+            source = load_npy_annotations(
+                self.npy_dir, progress=lambda frac: self.progress.emit(f"转换 NPY 检测结果 {frac:.0%}"))
+        except Exception as e:
+            print(f"Error loading npy detections from {self.npy_dir}: {e}")
+            source = AnnotationStore()
+        self.loaded.emit(self.npy_dir, source)
+
+
+class CameraLoadThread(QThread):
+    # 后台解析单个相机的 Old/New 标注子树，并预计算其统计、跨帧轨迹和 Old/New 对比
+    progress = pyqtSignal(str)
+    loaded = pyqtSignal(str)
+
+    def __init__(self, camera_name, sources, stats_cache, comparison_cache, track_cache, pair, parent=None):
+        super().__init__(parent)
+        self.camera_name = camera_name
+        self.sources = sources
+        self.stats_cache = stats_cache
+        self.comparison_cache = comparison_cache
+        self.track_cache = track_cache
+        self.pair = pair
+
+    def run(self):
+        for label, source in self.sources:
+            if not source:
+                continue
+            self.progress.emit(f"解析 {label} 标注: {self.camera_name} ...")
+            try:
+                source.load_camera(self.camera_name)
+                self.stats_cache.get(source, self.camera_name)
+                # 源 JSON 未变化时直接使用 track_index.py 保存的轨迹索引
+                self.track_cache.get(source, self.camera_name)
+            except Exception as e:
+                print(f"Error loading {label} annotations for {self.camera_name}: {e}")
+        try:
+            self.progress.emit(f"对比 Old/New 标注: {self.camera_name} ...")
+            self.comparison_cache.get(self.pair[0], self.pair[1], self.camera_name)
+        except Exception as e:
+            print(f"Error comparing annotations for {self.camera_name}: {e}")
+        self.loaded.emit(self.camera_name)
+
+
 class VideoLabeler(QMainWindow):
+    # FrameProvider 在后台线程建立 seek 索引后触发（video_path, SeekIndex）
+    seek_index_ready = pyqtSignal(str, object)
+    # FrameProvider 解码出（或读取失败）之前未命中的帧后触发（video_path, 0-based 帧号）
+    frame_ready = pyqtSignal(str, int)
+
+    # 轨迹绘制当前帧前后各多少帧
+    TRACK_TRAIL_FRAMES = 30
+    # 'H' 依次切换的热力图模式
+    HEATMAP_MODES = (None, "Old", "New", "Ratio")
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("QuickLabeling - Viewer Mode")
         self.resize(1600, 1200)
 
         # 状态变量
-        self.video_cap = None
+        self.video_cap = None  # FrameProvider：后台解码 + 帧缓存
+        self.frame_cache_mb = DEFAULT_CACHE_MB
         self.video_path = None
         self.video_folder = None
         self.camera_name = None
@@ -144,40 +508,241 @@ class VideoLabeler(QMainWindow):
         self.current_frame_idx = 0
         
         # 直方图相关
-        self.ax = None
         self.canvas = None
-        self.current_frame_line = None
+        # 缩略图胶片条的后台生成线程（切换视频后旧线程被取消，结束前保留引用）
+        self.thumbnail_threads = []
         
-        # 两个 JSON 标注数据
-        self.annotations_old = {}
-        self.annotations_new = {}
-
-        # 自动加载默认的 JSON 文件
-        self.load_default_annotations()
+        # 两个 JSON 标注数据（按相机懒加载，见 annotation_store）
+        self.annotations_old = AnnotationStore()
+        self.annotations_new = AnnotationStore()
+        self.annotation_thread = None
+        self.json_paths = {"Old": None, "New": None}
+        # 磁盘上的 JSON 变化时自动重新加载：标签 -> 重新加载线程 / 上次各相机原始字节的哈希
+        self.annotation_watcher = AnnotationFileWatcher(self)
+        self.annotation_watcher.changed.connect(self.on_annotation_file_changed)
+        self.reload_threads = {}
+        self.reload_pending = set()
+        self.raw_digests = {}
+        # 第三层：按相机的 .npy 检测结果（见 npy_annotations）
+        self.annotations_det = AnnotationStore()
+        self.npy_thread = None
+        self.camera_threads = []
+        # 每个（标注源, 相机）的预计算统计，标注源被替换时自动失效
+        self.stats_cache = StatsCache()
+        # 每个相机的 Old/New 逐帧 IoU 对比（见 compare_annotations）
+        self.comparison_cache = ComparisonCache()
+        # 每个（标注源, 相机）的跨帧轨迹（见 track_index）；鼠标所在框的 (标签, 轨迹 ID)
+        self.track_cache = TrackCache()
+        self.show_tracks = True
+        self.hovered_track = None
+        # 每个（标注源, 相机）的空间热力图（见 spatial_heatmap）；当前显示的模式，None 为关闭
+        self.heatmap_cache = HeatmapCache()
+        self.heatmap_mode = None
+        # 当前相机的帧查询索引（见 frame_query），依赖的统计/对比对象变化时重建
+        self.frame_index = None
+        self.frame_index_key = None
+        # 网格视图：同一帧号显示多个相机
+        self.grid_mode = False
 
         # 初始化 UI
         self.init_ui()
+        self.seek_index_ready.connect(self.on_seek_index_ready)
+        self.frame_ready.connect(self.on_frame_ready)
+
+        # 实时播放：生产者线程解码，QTimer 按原生 FPS 显示
+        self.playback = PlaybackController(self)
+        self.playback.frame_ready.connect(self.on_playback_frame)
+        self.playback.stats_updated.connect(self.on_playback_stats)
+        self.playback.finished.connect(self.stop_playback)
+
+        # 在后台自动加载默认的 JSON 文件，不阻塞窗口显示
+        self.load_default_annotations()
 
     def load_default_annotations(self):
         # 默认路径
         base_dir = os.getcwd()
-        old_path = os.path.join(base_dir, "json", "annotations_old.json")
-        new_path = os.path.join(base_dir, "json", "annotations_new.json")
+        self.json_paths = {
+            "Old": os.path.join(base_dir, "json", "annotations_old.json"),
+            "New": os.path.join(base_dir, "json", "annotations_new.json"),
+        }
+        self.load_annotation_files(self.json_paths)
 
-        try:
-            if os.path.exists(old_path):
-                with open(old_path, "r", encoding="utf-8") as f:
-                    self.annotations_old = json.load(f)
+        # 项目中存在 npy/ 目录时作为第三层自动加载
+        npy_dir = os.path.join(base_dir, "npy")
+        if os.path.isdir(npy_dir):
+            self.load_npy_folder(npy_dir)
+
+    def load_annotation_files(self, paths):
+        # 存在新鲜的 .store 转换文件时直接内存映射，否则只建立按相机的字节索引
+        self.annotation_thread = AnnotationIndexThread(paths, self)
+        self.annotation_thread.progress.connect(self.label_status.setText)
+        self.annotation_thread.loaded.connect(self.on_annotations_indexed)
+        self.annotation_thread.start()
+
+    def select_npy_folder(self):
+        folder_path = QFileDialog.getExistingDirectory(self, "选择 NPY 检测结果文件夹")
+        if folder_path:
+            self.load_npy_folder(folder_path)
+
+    def load_npy_folder(self, npy_dir):
+        if self.npy_thread is not None:
+            return
+        self.npy_thread = NpyLoadThread(npy_dir, self)
+        self.npy_thread.progress.connect(self.label_status.setText)
+        self.npy_thread.loaded.connect(self.on_npy_loaded)
+        self.npy_thread.start()
+
+    def on_npy_loaded(self, npy_dir, source):
+        self.npy_thread = None
+        self.annotations_det = source
+        self.grid_view.set_sources(self.annotations_old, self.annotations_new, self.annotations_det)
+        self.label_status.setText(f"NPY 检测结果: {len(source)} 个相机")
+        if self.video_cap:
+            self.show_frame(self.current_frame_idx)
+
+    def annotation_source(self, label):
+        return self.annotations_old if label == "Old" else self.annotations_new
+
+    def on_annotations_indexed(self, sources):
+        for label, source in sources.items():
+            previous = self.annotation_source(label)
+            self.stats_cache.invalidate(previous)
+            self.comparison_cache.invalidate(previous)
+            self.track_cache.invalidate(previous)
+            self.heatmap_cache.invalidate(previous)
+            if label == "Old":
+                self.annotations_old = source
             else:
-                print(f"Warning: {old_path} not found.")
-                
-            if os.path.exists(new_path):
-                with open(new_path, "r", encoding="utf-8") as f:
-                    self.annotations_new = json.load(f)
+                self.annotations_new = source
+            # 从这份数据开始监视文件变化；进行中的重新加载针对的是旧数据，完成后会被丢弃
+            self.raw_digests[label] = None
+            self.annotation_watcher.watch(label, self.json_paths[label], source.signature)
+        self.grid_view.set_sources(self.annotations_old, self.annotations_new, self.annotations_det)
+        self.video_browser.set_sources(self.annotations_old, self.annotations_new)
+        self.annotation_thread = None
+        self.frame_index_key = None
+        self.hovered_track = None
+        self.update_annotation_status()
+        if self.camera_name:
+            self.refresh_camera_annotations()
+        # 建立索引期间文件又被改写
+        for label in list(self.reload_pending):
+            self.start_pending_reload(label)
+
+    def on_annotation_file_changed(self, label, path):
+        # 正在建立索引时 watch() 会把签名换回索引前的值，不再检查该文件：记下来，索引完成后重新加载
+        # 重新加载进行中时，上一次完成后再来一次
+        if self.annotation_thread is not None or label in self.reload_threads:
+            self.reload_pending.add(label)
+            return
+        thread = AnnotationReloadThread(label, path, self.annotation_source(label), self.raw_digests.get(label), self)
+        thread.reloaded.connect(self.on_annotations_reloaded)
+        thread.failed.connect(self.on_annotations_reload_failed)
+        self.reload_threads[label] = thread
+        self.label_status.setText(f"{label} JSON 已变化，后台重新加载...")
+        thread.start()
+
+    def on_annotations_reloaded(self, label, result):
+        thread = self.reload_threads.pop(label, None)
+        source = self.annotation_source(label)
+        # 换入之后才开始排队的下一次重新加载，保证它与换入后的数据比较
+        if thread is not None and thread.source is source:
+            if result is not None:
+                self.apply_reload(label, source, result)
             else:
-                print(f"Warning: {new_path} not found.")
-        except Exception as e:
-            print(f"Error loading default annotations: {e}")
+                self.annotation_watcher.set_signature(label, source.signature)
+        self.start_pending_reload(label)
+
+    def start_pending_reload(self, label):
+        if label in self.reload_pending:
+            self.reload_pending.discard(label)
+            self.on_annotation_file_changed(label, self.json_paths[label])
+
+    def apply_reload(self, label, source, result):
+        if result.replacement is not None:
+            self.on_annotations_indexed({label: result.replacement})
+            return
+
+        # 原地换入：未变化的相机对象和它们的统计/对比缓存保持不变
+        source.apply_reload(result.index, result.parsed, result.changed, result.signature)
+        for camera_name in result.changed:
+            self.stats_cache.invalidate(source, camera_name)
+            self.comparison_cache.invalidate(source, camera_name)
+            self.track_cache.invalidate(source, camera_name)
+            self.heatmap_cache.invalidate(source, camera_name)
+        self.raw_digests[label] = result.raw_digests
+        self.annotation_watcher.set_signature(label, result.signature)
+        self.label_status.setText(f"{label} JSON 已重新加载: {len(result.changed)} 个相机有变化")
+        self.video_browser.set_sources(self.annotations_old, self.annotations_new, result.changed)
+
+        # 小图按视频相对路径（可能含子文件夹）索引，标注按视频文件名
+        if self.grid_mode and any(os.path.basename(name) in result.changed for name in self.grid_view.tiles):
+            self.grid_view.show_frame(self.current_frame_idx)
+        if self.camera_name in result.changed:
+            self.frame_index_key = None
+            if self.hovered_track is not None and self.hovered_track[0] == label:
+                self.hovered_track = None
+            self.refresh_camera_annotations()
+
+    def on_annotations_reload_failed(self, label, message):
+        # 保留现有数据；监视器仍记着已加载数据的签名，稍后会重试
+        thread = self.reload_threads.pop(label, None)
+        if thread is not None and thread.source is self.annotation_source(label):
+            print(f"Error reloading {label} annotations: {message}")
+            self.label_status.setText(f"{label} JSON 重新加载失败: {message}")
+            self.annotation_watcher.reload_failed(label)
+        self.start_pending_reload(label)
+
+    def refresh_camera_annotations(self):
+        # 当前相机的标注被替换：后台重新解析/统计，完成后刷新；数据已就绪时直接刷新
+        if not self.request_camera_annotations(force=True):
+            self.on_camera_annotations_loaded(self.camera_name)
+
+    def request_camera_annotations(self, force=False):
+        # 当前相机的标注尚未解析（或轨迹尚未关联）时在后台处理，完成后刷新直方图和当前帧
+        # force=True 时即使已解析也在后台重新计算统计和对比；返回是否启动了后台任务
+        if self.annotation_thread is not None or not self.camera_name:
+            return False
+        # 内存映射的 .store 中相机总是已就绪，但没有保存的轨迹索引时仍需在后台关联轨迹
+        pending = [(label, source) for label, source in (("Old", self.annotations_old), ("New", self.annotations_new))
+                   if source and self.camera_name in source and
+                   (force or source.cached(self.camera_name) is None or
+                    self.track_cache.get(source, self.camera_name, load=False) is None)]
+        if not pending:
+            return False
+
+        thread = CameraLoadThread(self.camera_name, pending, self.stats_cache, self.comparison_cache,
+                                  self.track_cache, (self.annotations_old, self.annotations_new), self)
+        thread.progress.connect(self.label_status.setText)
+        thread.loaded.connect(self.on_camera_annotations_loaded)
+        thread.finished.connect(lambda t=thread: self.camera_threads.remove(t))
+        self.camera_threads.append(thread)
+        thread.start()
+        return True
+
+    def on_camera_annotations_loaded(self, camera_name):
+        if camera_name != self.camera_name:
+            return
+        self.update_histogram()
+        self.update_heatmap()
+        if self.video_cap:
+            self.show_frame(self.current_frame_idx)
+        self.update_annotation_status()
+
+    def update_annotation_status(self):
+        # 更新状态栏显示加载情况
+        status_text = []
+        if self.annotations_old:
+            status_text.append("Old JSON Loaded")
+        else:
+            status_text.append("Old JSON Missing")
+
+        if self.annotations_new:
+            status_text.append("New JSON Loaded")
+        else:
+            status_text.append("New JSON Missing")
+
+        self.label_status.setText(" | ".join(status_text))
 
     def init_ui(self):
         # 主窗口部件
@@ -193,11 +758,29 @@ class VideoLabeler(QMainWindow):
         self.btn_select_folder.clicked.connect(self.select_video_folder)
         control_layout.addWidget(self.btn_select_folder)
 
-        # 视频下拉框
-        self.video_combo = QComboBox()
-        self.video_combo.setMinimumWidth(300)
-        self.video_combo.currentIndexChanged.connect(self.on_video_combo_changed)
-        control_layout.addWidget(self.video_combo)
+        # Old/New 标注 JSON
+        self.btn_load_old = QPushButton("Old JSON (Load Old)")
+        self.btn_load_old.clicked.connect(lambda: self.load_json_file("Old"))
+        control_layout.addWidget(self.btn_load_old)
+        self.btn_load_new = QPushButton("New JSON (Load New)")
+        self.btn_load_new.clicked.connect(lambda: self.load_json_file("New"))
+        control_layout.addWidget(self.btn_load_new)
+
+        # NPY 检测结果文件夹（第三层）
+        self.btn_select_npy = QPushButton("NPY 检测 (Load NPY)")
+        self.btn_select_npy.clicked.connect(self.select_npy_folder)
+        control_layout.addWidget(self.btn_select_npy)
+
+        # 视频列表（左侧停靠窗口）：递归扫描、按名称筛选、按帧数/框数/不一致率排序
+        self.video_browser = VideoBrowser(self)
+        self.video_browser.video_activated.connect(self.on_video_activated)
+        self.video_browser.scan_finished.connect(self.on_video_scan_finished)
+        self.video_dock = QDockWidget("视频列表 (Videos)", self)
+        self.video_dock.setObjectName("video_dock")
+        self.video_dock.setFeatures(QDockWidget.DockWidgetMovable | QDockWidget.DockWidgetFloatable)
+        self.video_dock.setWidget(self.video_browser)
+        self.addDockWidget(Qt.LeftDockWidgetArea, self.video_dock)
+        self.resizeDocks([self.video_dock], [420], Qt.Horizontal)
 
         # 帧数显示和跳转
         control_layout.addStretch()
@@ -217,10 +800,40 @@ class VideoLabeler(QMainWindow):
         self.btn_jump.clicked.connect(self.jump_to_frame_from_input)
         control_layout.addWidget(self.btn_jump)
 
+        # 播放控制
+        self.btn_play = QPushButton("播放 (Space)")
+        self.btn_play.setFocusPolicy(Qt.NoFocus)
+        self.btn_play.clicked.connect(self.toggle_playback)
+        control_layout.addWidget(self.btn_play)
+
+        self.speed_combo = QComboBox()
+        self.speed_combo.setFocusPolicy(Qt.NoFocus)
+        self.speed_combo.addItems([f"{speed:g}x" for speed in PLAYBACK_SPEEDS])
+        self.speed_combo.setCurrentIndex(PLAYBACK_SPEEDS.index(1.0))
+        self.speed_combo.currentIndexChanged.connect(self.on_playback_speed_changed)
+        control_layout.addWidget(self.speed_combo)
+
+        self.label_playback = QLabel("")
+        self.label_playback.setStyleSheet("color: gray;")
+        control_layout.addWidget(self.label_playback)
+
+        # 网格视图开关与相机子集
+        self.btn_grid = QPushButton("网格视图 (Grid)")
+        self.btn_grid.setCheckable(True)
+        self.btn_grid.setFocusPolicy(Qt.NoFocus)
+        self.btn_grid.toggled.connect(self.toggle_grid_mode)
+        control_layout.addWidget(self.btn_grid)
+
+        self.input_grid_cameras = QLineEdit()
+        self.input_grid_cameras.setPlaceholderText("网格相机，如 Camera1-*, Camera2-3（空为全部）")
+        self.input_grid_cameras.setMinimumWidth(220)
+        self.input_grid_cameras.returnPressed.connect(self.refresh_grid_cameras)
+        control_layout.addWidget(self.input_grid_cameras)
+
         control_layout.addStretch()
 
         # 说明标签
-        tips_label = QLabel("快捷键: 'A' 上一帧, 'D' 下一帧")
+        tips_label = QLabel("快捷键: 'A' 上一帧, 'D' 下一帧, 空格 播放/暂停, 'Q'/'E' 上/下一个匹配帧, '['/']' 轨迹起点/终点")
         tips_label.setStyleSheet("color: gray;")
         control_layout.addWidget(tips_label)
 
@@ -232,32 +845,66 @@ class VideoLabeler(QMainWindow):
 
         main_layout.addLayout(control_layout)
 
+        # 1.2 帧查询栏
+        query_layout = QHBoxLayout()
+        query_layout.addWidget(QLabel("查询 (Query):"))
+        self.input_query = QLineEdit()
+        self.input_query.setPlaceholderText("例如: old != new, new > 0 and old == 0, old > 5, disagree; 预设: "
+                                            + ", ".join(PRESETS))
+        self.input_query.returnPressed.connect(self.apply_query)
+        query_layout.addWidget(self.input_query, 1)
+
+        self.btn_prev_match = QPushButton("上一个 (Q)")
+        self.btn_prev_match.setFocusPolicy(Qt.NoFocus)
+        self.btn_prev_match.clicked.connect(lambda: self.jump_to_match(-1))
+        query_layout.addWidget(self.btn_prev_match)
+
+        self.btn_next_match = QPushButton("下一个 (E)")
+        self.btn_next_match.setFocusPolicy(Qt.NoFocus)
+        self.btn_next_match.clicked.connect(lambda: self.jump_to_match(1))
+        query_layout.addWidget(self.btn_next_match)
+
+        self.label_query = QLabel("")
+        self.label_query.setMinimumWidth(240)
+        query_layout.addWidget(self.label_query)
+        main_layout.addLayout(query_layout)
+
         # 1.5 直方图区域
-        fig = Figure(figsize=(5, 1.5), dpi=100)
-        self.canvas = FigureCanvas(fig)
+        # 静态部分渲染一次并缓存，移动指示线时只 blit；点击/拖动跳转
+        self.canvas = HistogramTimeline(self)
         self.canvas.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         self.canvas.setFixedHeight(150)
-        self.ax = fig.add_subplot(111)
-        self.ax.set_title("Detection Boxes Histogram (Old vs New)")
-        self.ax.set_xlabel("Frame")
-        self.ax.set_ylabel("Count")
-        fig.tight_layout()
+        self.canvas.frame_selected.connect(self.on_timeline_frame_selected)
         
         main_layout.addWidget(self.canvas)
 
+        # 1.6 缩略图胶片条：悬停预览，点击跳转
+        self.filmstrip = FilmstripView(self)
+        self.filmstrip.frame_selected.connect(self.on_timeline_frame_selected)
+        main_layout.addWidget(self.filmstrip)
+
         # 2. 图片展示区域
         self.scroll_area = QScrollArea()
         self.scroll_area.setWidgetResizable(True)
         self.scroll_area.setAlignment(Qt.AlignCenter)
         
         self.image_label = AnnotatedImageLabel(self)
+        self.image_label.hover_moved.connect(self.on_image_hover)
         self.image_label.setText("请加载视频文件和 JSON 文件")
         self.image_label.setAlignment(Qt.AlignCenter)
         self.image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
 
         self.scroll_area.setWidget(self.image_label)
         content_layout = QHBoxLayout()
-        content_layout.addWidget(self.scroll_area, 3)
+        # 单视频视图 / 网格视图
+        self.grid_view = CameraGridView(self)
+        self.grid_view.camera_activated.connect(self.on_grid_camera_activated)
+        self.view_stack = QStackedWidget()
+        self.view_stack.addWidget(self.scroll_area)
+        self.view_stack.addWidget(self.grid_view)
+        content_layout.addWidget(self.view_stack, 3)
+        # 性能 HUD（F3），叠加在单视频/网格视图的左上角
+        self.perf_hud = PerfHud(self.view_stack)
         self.help_text = QTextEdit()
         self.help_text.setReadOnly(True)
         self.help_text.setMinimumWidth(320)
@@ -265,137 +912,214 @@ class VideoLabeler(QMainWindow):
             "QuickLabeling Viewer Mode\n\n"
             "工作流程\n"
             "1. 点击“选择文件夹”选择包含AVI视频的文件夹\n"
-            "2. 使用下拉框切换不同的视频\n"
+            "2. 在左侧视频列表中切换视频（可筛选，点击列头排序）\n"
             "3. 程序会自动加载项目中的 Old/New JSON\n"
             "4. 使用 A/D 或输入帧号进行导航\n\n"
             "显示说明\n"
             "- Old 数据：使用运动性检测结果绘制绿色半透明蒙版\n"
             "- New 数据：使用yolo11n微调模型检测结果（与运动性检测结果取交集，只要有一点重叠就会画出）绘制黑色矩形框\n"
+            "- NPY 检测结果（可选）：点击“NPY 检测”选择 Camera{r}-{c}.npy 所在文件夹，绘制品红色虚线框\n"
             "- 鼠标指示：红色十字与延长虚线\n"
-            "- 直方图：显示 Old(蓝色) 和 New(橙色) 的每帧框数量\n\n"
+            "- 缩放：滚轮以鼠标为中心放大/缩小，按住左键拖动平移，双击恢复适应窗口；切换帧时保持缩放\n"
+            "- 直方图：显示 Old(蓝色) 和 New(橙色) 的每帧框数量，点击或拖动可跳转\n"
+            "- 胶片条：直方图下方均匀分布的缩略图，左下/右下为该帧 Old/New 框数量，红框为当前位置；"
+            "悬停预览，点击跳转（首次打开视频时在后台生成并缓存）\n"
+            "- 对比面板：Old/New 按 IoU 贪心匹配的结果（当前相机汇总与当前帧）\n"
+            "- 热力图：按 H 依次显示当前相机所有帧的 Old 密度、New 密度、New/Old 保留比例，再按一次关闭\n"
+            "- 轨迹：相邻帧的框按 IoU/中心点距离连成轨迹，画出前后各 30 帧的中心点折线"
+            "（Old 深绿 / New 橙色），鼠标移到框上高亮该轨迹并显示 ID\n\n"
             "快捷键\n"
             "- A：上一帧\n"
             "- D：下一帧\n"
             "- 回车：在帧号输入框中回车跳转\n"
+            "- 空格：播放/暂停（倍速 0.25x-8x，画面跟不上时自动丢帧）\n"
+            "- Q / E：跳到上一个 / 下一个满足查询的帧\n"
+            "- [ / ]：跳到鼠标所指轨迹的起始 / 结束帧\n"
+            "- T：显示/隐藏轨迹\n"
+            "- H：切换热力图（Old / New / 保留比例 / 关闭）\n"
+            "- 网格视图：A/D 同时切换所有相机，双击小图回到该相机的单视频视图\n"
+            "- F3：显示/隐藏性能 HUD（各阶段耗时 p50/p95）\n"
+            "- F4：导出 Chrome trace JSON（chrome://tracing 或 Perfetto 打开）\n\n"
+            "帧查询\n"
+            "- 变量：old, new（框数量）, old_area, new_area（总面积）, old_min_area, new_min_area, "
+            "old_max_area, new_max_area, matched, old_unmatched, new_unmatched, iou\n"
+            "- 运算：+ - * /、比较、and / or / not、括号\n"
+            "- 预设：diff, new_only, old_only, disagree, empty\n"
         )
-        content_layout.addWidget(self.help_text, 1)
+        # Old vs New 对比面板
+        self.compare_label = QLabel("Old vs New 对比: 无数据")
+        self.compare_label.setWordWrap(True)
+        self.compare_label.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+        self.compare_label.setMinimumWidth(320)
+        # 鼠标所指的轨迹
+        self.track_label = QLabel("轨迹 (Track): 鼠标移到框上查看")
+        self.track_label.setWordWrap(True)
+        self.track_label.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+        side_layout = QVBoxLayout()
+        side_layout.addWidget(self.help_text, 3)
+        side_layout.addWidget(self.compare_label, 1)
+        side_layout.addWidget(self.track_label)
+        content_layout.addLayout(side_layout, 1)
         main_layout.addLayout(content_layout)
 
-    def load_json_file(self, type_name):
-        file_path, _ = QFileDialog.getOpenFileName(self, f"选择 {type_name.upper()} JSON 文件", "", "JSON Files (*.json)")
-        if file_path:
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                
-                if type_name == "old":
-                    self.annotations_old = data
-                    QMessageBox.information(self, "成功", "Old JSON 加载成功！")
-                else:
-                    self.annotations_new = data
-                    QMessageBox.information(self, "成功", "New JSON 加载成功！")
-                
-                self.update_histogram()
-                if self.video_cap:
-                    self.show_frame(self.current_frame_idx)
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"加载 JSON 失败: {e}")
+    def load_json_file(self, label):
+        file_path, _ = QFileDialog.getOpenFileName(self, f"选择 {label} JSON 文件", "", "JSON Files (*.json)")
+        if not file_path:
+            return
+        if self.annotation_thread is not None:
+            self.label_status.setText("标注正在加载，请稍后再试")
+            return
+        # 与默认文件相同：后台建立索引，之后监视该文件的变化
+        self.json_paths[label] = file_path
+        self.load_annotation_files({label: file_path})
 
+    @traced("update_histogram")
     def update_histogram(self):
-        # 清空图表
-        self.ax.clear()
-        
         if self.total_frames <= 0:
-            self.canvas.draw()
+            self.canvas.clear_data()
+            self.filmstrip.set_counts(None, None)
             return
 
-        frames = list(range(1, self.total_frames + 1))
-        
-        # 获取 Old 数量
-        counts_old = [0] * self.total_frames
-        if self.annotations_old and self.camera_name:
-            cam_data = self.annotations_old.get(self.camera_name, {})
-            for f_idx in range(self.total_frames):
-                key = str(f_idx + 1)
-                if key in cam_data:
-                    counts_old[f_idx] = len(cam_data[key])
-        
-        # 获取 New 数量
-        counts_new = [0] * self.total_frames
-        if self.annotations_new and self.camera_name:
-            cam_data = self.annotations_new.get(self.camera_name, {})
-            for f_idx in range(self.total_frames):
-                key = str(f_idx + 1)
-                if key in cam_data:
-                    counts_new[f_idx] = len(cam_data[key])
-
-        # 绘制直方图
-        # Old 用蓝色柱状图
-        self.ax.bar(frames, counts_old, width=1.0, color='skyblue', label='Old', alpha=0.6)
-        # New 用橙色线条或柱状图 (这里用细柱或阶梯线)
-        self.ax.plot(frames, counts_new, color='orange', label='New', linewidth=1.5)
-        
-        self.ax.set_title("Detection Boxes Histogram")
-        self.ax.set_xlabel("Frame Number")
-        self.ax.set_ylabel("Box Count")
-        self.ax.set_xlim(0, self.total_frames + 1)
-        self.ax.legend(loc='upper right')
+        # 每帧框数量来自预计算的统计数组（见 annotation_stats）
+        stats_old = self.get_camera_stats(self.annotations_old)
+        stats_new = self.get_camera_stats(self.annotations_new)
+        counts_old = stats_old.padded("counts", self.total_frames) if stats_old else np.zeros(self.total_frames)
+        counts_new = stats_new.padded("counts", self.total_frames) if stats_new else np.zeros(self.total_frames)
 
-        # 当前帧指示线
-        self.current_frame_line = self.ax.axvline(x=self.current_frame_idx + 1, color='red', linewidth=2, linestyle='--')
-        self.canvas.draw()
+        title = "Detection Boxes Histogram"
+        if stats_old or stats_new:
+            title += " (Old {} boxes / {} frames, New {} boxes / {} frames)".format(
+                stats_old.total_boxes if stats_old else 0, stats_old.frames_with_boxes if stats_old else 0,
+                stats_new.total_boxes if stats_new else 0, stats_new.frames_with_boxes if stats_new else 0)
+
+        # Old 为蓝色柱状图，New 为橙色折线，红色虚线为当前帧
+        self.canvas.cursor_frame = self.current_frame_idx + 1
+        self.canvas.set_data(counts_old, counts_new, title)
+        self.filmstrip.set_counts(counts_old, counts_new)
+
+    def on_timeline_frame_selected(self, frame_idx):
+        if self.video_cap is None:
+            return
+        self.stop_playback()
+        self.show_frame(frame_idx)
+        self.setFocus()
+
+    def get_frame_index(self):
+        # 由当前相机已计算好的统计和对比结果组装，不在 UI 线程中解析标注
+        if not self.camera_name or self.total_frames <= 0:
+            return None
+        stats_old = self.get_camera_stats(self.annotations_old)
+        stats_new = self.get_camera_stats(self.annotations_new)
+        comparison = self.comparison_cache.get(self.annotations_old, self.annotations_new,
+                                               self.camera_name, load=False)
+        if stats_old is None and stats_new is None:
+            return None
+        key = (self.camera_name, self.total_frames, id(stats_old), id(stats_new), id(comparison))
+        if key != self.frame_index_key:
+            variables = build_variables(stats_old, stats_new, comparison, self.total_frames)
+            self.frame_index = FrameQueryIndex(variables, self.total_frames)
+            self.frame_index_key = key
+        return self.frame_index
+
+    def apply_query(self):
+        # 回车：执行查询并跳到当前帧之后的第一个匹配帧
+        if self.run_query() is not None:
+            self.jump_to_match(1)
+        self.setFocus()
+
+    def run_query(self):
+        expression = self.input_query.text().strip()
+        if not expression:
+            self.label_query.setText("")
+            return None
+        index = self.get_frame_index()
+        if index is None:
+            self.label_query.setText("当前视频没有标注数据")
+            return None
+        try:
+            frames = index.frames(expression)
+        except QueryError as e:
+            self.label_query.setText(str(e))
+            return None
+        return frames
+
+    def jump_to_match(self, direction):
+        frames = self.run_query()
+        if frames is None or self.video_cap is None:
+            return
+        index = self.get_frame_index()
+        expression = self.input_query.text()
+        current = self.current_frame_idx + 1
+        if direction > 0:
+            frame_no = index.next_frame(expression, current)
+        else:
+            frame_no = index.previous_frame(expression, current)
+
+        if frame_no is None:
+            self.label_query.setText(f"命中 {len(frames)} 帧，{'之后' if direction > 0 else '之前'}没有更多匹配")
+            return
+        self.stop_playback()
+        self.show_frame(frame_no - 1)
+        position = int(np.searchsorted(frames, frame_no)) + 1
+        self.label_query.setText(f"命中 {len(frames)} 帧，当前第 {position} 个")
+
+    def get_camera_stats(self, annotations):
+        # UI 线程中只使用已解析的相机，未就绪时返回 None
+        return self.stats_cache.get(annotations, self.camera_name, load=False)
 
     def select_video_folder(self):
         folder_path = QFileDialog.getExistingDirectory(self, "选择视频文件夹")
         if folder_path:
             self.video_folder = folder_path
-            
-            # 扫描 .avi 文件
-            try:
-                videos = [f for f in os.listdir(folder_path) if f.lower().endswith('.avi')]
-                videos.sort()
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"无法扫描文件夹: {e}")
-                return
-
-            if not videos:
-                QMessageBox.warning(self, "提示", "该文件夹下没有找到 .avi 文件")
-                self.video_combo.clear()
-                return
+            # 后台递归扫描，找到的视频分批出现在列表中，第一批到达后自动加载第一个
+            self.video_browser.set_folder(folder_path, select_first=True)
+            if self.grid_mode:
+                self.refresh_grid_cameras()
 
-            self.video_combo.blockSignals(True)
-            self.video_combo.clear()
-            self.video_combo.addItems(videos)
-            self.video_combo.blockSignals(False)
-            
-            # 自动加载第一个
-            if self.video_combo.count() > 0:
-                self.video_combo.setCurrentIndex(0)
-                # 手动触发加载
-                self.on_video_combo_changed(0)
+    def on_video_scan_finished(self, folder, total):
+        if folder != self.video_folder:
+            return
+        if total == 0:
+            QMessageBox.warning(self, "提示", "该文件夹下没有找到 .avi 文件")
+        elif self.grid_mode:
+            self.refresh_grid_cameras()
 
-    def on_video_combo_changed(self, index):
-        if index < 0 or not self.video_folder:
+    def on_video_activated(self, video):
+        if not self.video_folder:
             return
-        video_name = self.video_combo.itemText(index)
-        full_path = os.path.join(self.video_folder, video_name)
-        self.load_video_file(full_path)
+        full_path = os.path.join(self.video_folder, video)
+        if full_path != self.video_path:
+            self.load_video_file(full_path)
 
     def load_video_file(self, file_path):
         if file_path:
             self.video_path = file_path
             self.camera_name = os.path.basename(file_path)
-            self.video_cap = cv2.VideoCapture(file_path)
-            if not self.video_cap.isOpened():
+            self.hovered_track = None
+            self.image_label.reset_zoom()
+            self.stop_playback()
+            if self.video_cap is not None:
+                self.video_cap.close()
+            self.video_cap = FrameProvider(file_path, cache_mb=self.frame_cache_mb,
+                                           on_index_ready=self.seek_index_ready.emit,
+                                           on_frame_ready=self.frame_ready.emit)
+            if not self.video_cap.is_opened():
                 QMessageBox.critical(self, "错误", "无法打开视频文件！")
+                self.video_cap = None
                 return
             
-            self.total_frames = int(self.video_cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            # 元数据缓存中已校验过的帧数优先于容器头中的帧数
+            meta = self.video_browser.metadata_for(file_path)
+            if meta is not None and meta.get("verified") and meta["frame_count"] > 0:
+                self.video_cap.total_frames = meta["frame_count"]
+            self.total_frames = self.video_cap.total_frames
             self.label_total_frames.setText(f"/ {self.total_frames}")
             self.current_frame_idx = 0
             
-            # 更新直方图（因为 camera_name 变了）
+            # 更新直方图和热力图（因为 camera_name 变了）
             self.update_histogram()
+            self.update_heatmap()
+            self.start_thumbnails()
 
             # 显示第一帧
             self.show_frame(self.current_frame_idx)
@@ -404,21 +1128,46 @@ class VideoLabeler(QMainWindow):
             self.setFocus()
             
             # 更新状态栏显示加载情况
-            status_text = []
-            if self.annotations_old:
-                status_text.append("Old JSON Loaded")
-            else:
-                status_text.append("Old JSON Missing")
-                
-            if self.annotations_new:
-                status_text.append("New JSON Loaded")
-            else:
-                status_text.append("New JSON Missing")
-            
-            self.label_status.setText(" | ".join(status_text))
+            if self.annotation_thread is None:
+                self.update_annotation_status()
+
+            # 当前相机的标注未解析时在后台解析，完成后自动刷新
+            self.request_camera_annotations()
+
+    def start_thumbnails(self):
+        # 取消上一个视频的生成（不等待），新视频的缩略图有缓存时直接读取
+        for thread in self.thumbnail_threads:
+            thread.cancel()
+        self.filmstrip.set_video(self.video_path, self.total_frames)
+        thread = ThumbnailThread(self.video_path, self.total_frames, self)
+        thread.thumbnail_ready.connect(self.filmstrip.add_thumbnail)
+        thread.done.connect(self.filmstrip.finish)
+        thread.finished.connect(lambda t=thread: self.thumbnail_threads.remove(t))
+        self.thumbnail_threads.append(thread)
+        # 低优先级，不与当前帧的解码争抢
+        thread.start(QThread.LowPriority)
+
+    def on_seek_index_ready(self, video_path, index):
+        # 以索引校验过的帧数为准，保证帧号与标注中 1-based 的帧号一致
+        if video_path != self.video_path or index.frame_count <= 0:
+            return
+        if index.frame_count == self.total_frames:
+            return
+        print(f"Frame count of {self.camera_name} corrected: {self.total_frames} -> {index.frame_count}")
+        self.total_frames = index.frame_count
+        self.label_total_frames.setText(f"/ {self.total_frames}")
+        self.update_histogram()
+        if self.current_frame_idx >= self.total_frames:
+            self.show_frame(self.total_frames - 1)
+
+    def on_frame_ready(self, video_path, frame_idx):
+        # 未命中的帧已解码：仍是当前帧时重绘
+        if video_path == self.video_path and frame_idx == self.current_frame_idx and not self.grid_mode:
+            self.show_frame(frame_idx)
 
+    @traced("show_frame")
     def show_frame(self, frame_idx):
-        if self.video_cap is None or not self.video_cap.isOpened():
+        if self.video_cap is None or not self.video_cap.is_opened():
             return
 
         if frame_idx < 0:
@@ -427,40 +1176,233 @@ class VideoLabeler(QMainWindow):
             frame_idx = self.total_frames - 1
 
         self.current_frame_idx = frame_idx
+
+        # 网格视图：所有小图在线程池中解码，不再解码单视频
+        if self.grid_mode:
+            self.grid_view.show_frame(frame_idx)
+            self.update_frame_input_display()
+            self.canvas.set_cursor(frame_idx + 1)
+            self.filmstrip.set_cursor(frame_idx)
+            self.update_comparison_panel()
+            return
         
-        self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame_idx)
-        ret, frame = self.video_cap.read()
+        # 单步前进/后退时通常直接命中预读缓存；未命中时不等待解码，先保留上一帧，解码完成后由 on_frame_ready 重绘
+        with span("frame_wait"):
+            frame = self.video_cap.get_frame(self.current_frame_idx)
         
-        if ret:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = frame.shape
-            bytes_per_line = ch * w
-            
-            qt_image = QImage(frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            
-            self.image_label.setPixmap(QPixmap.fromImage(qt_image))
-            self.image_label.update()
-            
+        if frame is not None:
+            self.display_frame(frame)
+        elif self.video_cap.failed(self.current_frame_idx):
+            self.image_label.setText(f"无法读取第 {frame_idx + 1} 帧")
+        else:
             self.update_frame_input_display()
+            self.canvas.set_cursor(frame_idx + 1)
+            self.filmstrip.set_cursor(frame_idx)
 
-            # 更新直方图指示器
-            if self.current_frame_line:
-                self.current_frame_line.set_xdata([self.current_frame_idx + 1])
-                self.canvas.draw_idle()
-            
-            # 获取当前帧的 Old 和 New 标注
+        stats = self.video_cap.stats()
+        convert = self.image_label.converter.stats()
+        self.label_total_frames.setToolTip(
+            f"帧缓存 hits {stats['hits']} / misses {stats['misses']} ({stats['cached']}/{stats['capacity']} 帧)\n"
+            f"显示转换 {convert['avg_ms']:.2f} ms/帧, 缓冲区分配 {convert['allocations']} 次 / {convert['conversions']} 帧")
+
+    def display_frame(self, frame):
+        # 显示 current_frame_idx 对应的 BGR 帧（按显示尺寸转换），并同步标注叠加层和直方图指示器
+        self.image_label.set_frame(frame)
+
+        # 获取当前帧的 Old 和 New 标注
+        # 需在 blit 直方图指示线之前设置：blit 会立即刷新窗口中待重绘的区域，否则叠加层会先按旧标注渲染一次
+        with span("annotations"):
             old_boxes = self.get_frame_annotations(self.annotations_old)
             new_boxes = self.get_frame_annotations(self.annotations_new)
-            
-            self.image_label.set_annotations(old_boxes, new_boxes)
-        else:
-            self.image_label.setText(f"无法读取第 {frame_idx + 1} 帧")
+            det_boxes = self.get_frame_annotations(self.annotations_det)
+            self.image_label.set_annotations(old_boxes, new_boxes, det_boxes)
+        self.update_tracks()
+
+        self.update_frame_input_display()
+
+        # 更新直方图指示器（只 blit 指示线）
+        self.canvas.set_cursor(self.current_frame_idx + 1)
+        self.filmstrip.set_cursor(self.current_frame_idx)
+        self.update_comparison_panel()
+
+    def update_comparison_panel(self):
+        # 相机汇总 + 当前帧的匹配情况；对比结果在解析相机时已在后台算好
+        comparison = None
+        if self.camera_name:
+            comparison = self.comparison_cache.get(self.annotations_old, self.annotations_new,
+                                                   self.camera_name, load=False)
+        if comparison is None:
+            self.compare_label.setText("Old vs New 对比: 无数据")
+            return
+
+        s = comparison.summary()
+        f = comparison.frame_summary(self.current_frame_idx + 1)
+        self.compare_label.setText(
+            f"Old vs New 对比 (IoU ≥ {self.comparison_cache.iou_threshold:.2f})\n"
+            f"相机: 匹配 {s['matched']}, Old 未匹配 {s['old_unmatched']}, New 未匹配 {s['new_unmatched']}, "
+            f"平均 IoU {s['mean_iou']:.3f}, 不一致帧 {s['disagreement_frames']}\n"
+            f"当前帧: 匹配 {f['matched']}, Old 未匹配 {f['old_unmatched']}, New 未匹配 {f['new_unmatched']}, "
+            f"平均 IoU {f['mean_iou']:.3f}")
+
+    def camera_tracks(self, label):
+        # UI 线程中只使用已算好/已保存的轨迹，未就绪时返回 None
+        return self.track_cache.get(self.annotation_source(label), self.camera_name, load=False)
+
+    def track_at(self, x, y):
+        # 当前帧中包含图像坐标 (x, y) 的最小框所属的 (标签, 轨迹 ID)
+        frame_no = self.current_frame_idx + 1
+        best = None
+        for label in ("Old", "New"):
+            source = self.annotation_source(label)
+            tracks = self.camera_tracks(label)
+            cam = source.cached(self.camera_name) if source else None
+            if tracks is None or cam is None:
+                continue
+            boxes = np.asarray(cam.frame(frame_no))
+            ids = tracks.frame_tracks(frame_no)
+            if not len(boxes) or len(ids) != len(boxes):
+                continue
+            inside = (boxes[:, 0] <= x) & (x <= boxes[:, 2]) & (boxes[:, 1] <= y) & (y <= boxes[:, 3])
+            if not inside.any():
+                continue
+            area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+            i = np.flatnonzero(inside)[np.argmin(area[inside])]
+            if best is None or area[i] < best[0]:
+                best = (area[i], label, int(ids[i]))
+        return None if best is None else best[1:]
+
+    def on_image_hover(self, x, y):
+        # 鼠标移到框上时选中其轨迹；移到空白处保持上一次的轨迹，便于用 [ / ] 跳转
+        if not self.camera_name or x < 0:
+            return
+        hovered = self.track_at(x, y)
+        if hovered is not None and hovered != self.hovered_track:
+            self.hovered_track = hovered
+            self.update_tracks()
+
+    def update_tracks(self):
+        # 当前帧各个框所在轨迹在前后 TRACK_TRAIL_FRAMES 帧内的中心点折线，以及选中的轨迹
+        frame_no = self.current_frame_idx + 1
+        first, last = frame_no - self.TRACK_TRAIL_FRAMES, frame_no + self.TRACK_TRAIL_FRAMES
+        trajectories = []
+        with span("tracks"):
+            for label in ("Old", "New"):
+                tracks = self.camera_tracks(label) if self.camera_name else None
+                if tracks is None:
+                    continue
+                ids = set(tracks.frame_tracks(frame_no).tolist()) if self.show_tracks else set()
+                if self.show_tracks and self.hovered_track is not None and self.hovered_track[0] == label:
+                    ids.add(self.hovered_track[1])
+                for track_id in sorted(ids):
+                    if track_id >= tracks.n_tracks:
+                        continue
+                    _, boxes = tracks.track(track_id, first, last)
+                    centers = (boxes[:, :2] + boxes[:, 2:4]) / 2.0
+                    trajectories.append((label, track_id, centers))
+        self.image_label.set_tracks(trajectories, self.hovered_track)
+        self.update_track_panel()
+
+    def update_track_panel(self):
+        tracks = self.camera_tracks(self.hovered_track[0]) if self.hovered_track and self.camera_name else None
+        if tracks is None or self.hovered_track[1] >= tracks.n_tracks:
+            self.track_label.setText("轨迹 (Track): 鼠标移到框上查看")
+            return
+        label, track_id = self.hovered_track
+        start, end = tracks.span(track_id)
+        length = int(tracks.track_offsets[track_id + 1] - tracks.track_offsets[track_id])
+        self.track_label.setText(f"轨迹 (Track): {label} #{track_id}, 帧 {start}-{end} ({length} 帧)\n"
+                                 f"'[' 跳到起点, ']' 跳到终点, 'T' 显示/隐藏轨迹")
+
+    def jump_to_track_end(self, end):
+        # end=False 跳到选中轨迹的起始帧，end=True 跳到结束帧
+        tracks = self.camera_tracks(self.hovered_track[0]) if self.hovered_track else None
+        if tracks is None or self.hovered_track[1] >= tracks.n_tracks:
+            self.label_status.setText("请先把鼠标移到一个框上选中轨迹")
+            return
+        self.stop_playback()
+        start_frame, end_frame = tracks.span(self.hovered_track[1])
+        self.show_frame((end_frame if end else start_frame) - 1)
+
+    def toggle_tracks(self):
+        self.show_tracks = not self.show_tracks
+        self.label_status.setText("轨迹: 显示" if self.show_tracks else "轨迹: 隐藏")
+        if self.video_cap:
+            self.update_tracks()
+
+    def camera_heatmap(self, label):
+        # UI 线程中只使用已解析的相机；按视频分辨率划分格子
+        size = (self.video_cap.width, self.video_cap.height) if self.video_cap and self.video_cap.width > 0 else None
+        return self.heatmap_cache.get(self.annotation_source(label), self.camera_name, size, load=False)
+
+    def update_heatmap(self):
+        rgba = None
+        if self.heatmap_mode is not None and self.camera_name:
+            with span("heatmap_overlay"):
+                old = self.camera_heatmap("Old")
+                new = self.camera_heatmap("New")
+                if self.heatmap_mode == "Old" and old is not None:
+                    rgba = colorize(old)
+                elif self.heatmap_mode == "New" and new is not None:
+                    # 与 Old 使用相同的归一化，颜色可以直接比较
+                    rgba = colorize(new, old.max() if old is not None else None)
+                elif self.heatmap_mode == "Ratio" and old is not None and new is not None:
+                    rgba = colorize_ratio(new, old)
+        if rgba is None:
+            self.image_label.set_heatmap(None)
+            return
+        h, w = rgba.shape[:2]
+        image = QImage(rgba.data, w, h, w * 4, QImage.Format_RGBA8888).copy()
+        self.image_label.set_heatmap(image, self.heatmap_cache.cell)
+
+    def cycle_heatmap(self):
+        modes = self.HEATMAP_MODES
+        self.heatmap_mode = modes[(modes.index(self.heatmap_mode) + 1) % len(modes)]
+        names = {None: "关闭", "Old": "Old 密度", "New": "New 密度", "Ratio": "New/Old 保留比例（蓝 低 → 红 高）"}
+        self.label_status.setText(f"热力图: {names[self.heatmap_mode]}")
+        self.update_heatmap()
+
+    def toggle_playback(self):
+        if self.playback.is_playing():
+            self.stop_playback()
+            return
+        # 网格视图只支持逐帧浏览
+        if self.video_cap is None or self.total_frames <= 0 or self.grid_mode:
+            return
+
+        start_idx = self.current_frame_idx + 1
+        if start_idx >= self.total_frames:
+            start_idx = 0
+        self.playback.start(self.video_path, start_idx, self.total_frames, self.video_cap.fps,
+                            self.current_playback_speed(), self.video_cap.seek_index)
+        self.btn_play.setText("暂停 (Space)")
+        self.setFocus()
 
-    def get_frame_annotations(self, annotations_dict):
-        if not self.camera_name or not annotations_dict:
+    def stop_playback(self):
+        if self.playback.is_playing():
+            self.playback.stop()
+        self.btn_play.setText("播放 (Space)")
+
+    def current_playback_speed(self):
+        return PLAYBACK_SPEEDS[self.speed_combo.currentIndex()]
+
+    def on_playback_speed_changed(self, index):
+        self.playback.set_speed(self.current_playback_speed())
+        self.setFocus()
+
+    def on_playback_frame(self, frame_idx, frame):
+        self.current_frame_idx = frame_idx
+        self.display_frame(frame)
+
+    def on_playback_stats(self, achieved_fps, target_fps, dropped):
+        self.label_playback.setText(f"{achieved_fps:.1f}/{target_fps:.1f} fps, 丢帧 {dropped}")
+
+    def get_frame_annotations(self, annotations):
+        if not self.camera_name or not annotations:
+            return []
+        cam = annotations.cached(self.camera_name)
+        if cam is None:
             return []
-        cam = annotations_dict.get(self.camera_name, {})
-        return cam.get(str(self.current_frame_idx + 1), [])
+        return cam.frame(self.current_frame_idx + 1)
 
     def update_frame_input_display(self):
         self.input_frame.setText(str(self.current_frame_idx + 1))
@@ -469,6 +1411,7 @@ class VideoLabeler(QMainWindow):
         if not self.video_cap:
             return
             
+        self.stop_playback()
         text = self.input_frame.text()
         if text.isdigit():
             target_frame = int(text) - 1
@@ -476,17 +1419,118 @@ class VideoLabeler(QMainWindow):
         
         self.setFocus()
 
+    def toggle_grid_mode(self, checked):
+        if checked and (not self.video_folder or self.video_cap is None):
+            QMessageBox.warning(self, "提示", "请先选择视频文件夹")
+            self.btn_grid.setChecked(False)
+            return
+        self.stop_playback()
+        self.grid_mode = checked
+        if checked:
+            self.refresh_grid_cameras()
+            self.view_stack.setCurrentWidget(self.grid_view)
+        else:
+            self.view_stack.setCurrentWidget(self.scroll_area)
+        self.show_frame(self.current_frame_idx)
+        self.setFocus()
+
+    def refresh_grid_cameras(self):
+        if self.video_folder:
+            cameras = select_cameras(self.video_browser.videos(), self.input_grid_cameras.text())
+            if not cameras:
+                self.label_status.setText("网格: 没有匹配的相机")
+            self.grid_view.set_cameras(self.video_folder, cameras)
+            self.grid_view.set_sources(self.annotations_old, self.annotations_new, self.annotations_det)
+            if self.grid_mode:
+                self.grid_view.show_frame(self.current_frame_idx)
+        self.setFocus()
+
+    def on_grid_camera_activated(self, camera_name):
+        # 双击小图：切换到该相机的单视频视图，保持当前帧
+        frame_idx = self.current_frame_idx
+        self.btn_grid.setChecked(False)
+        if os.path.join(self.video_folder, camera_name) != self.video_path and \
+                self.video_browser.select_video(camera_name):
+            self.show_frame(frame_idx)
+
+    def closeEvent(self, event):
+        self.grid_view.close_all()
+        self.video_browser.shutdown()
+        for thread in list(self.thumbnail_threads):
+            thread.cancel()
+            thread.wait()
+        # 后台加载线程不可中断，等它们结束再销毁窗口，否则 QThread 在运行中被销毁
+        background = [self.annotation_thread, self.npy_thread] + list(self.camera_threads) + \
+            list(self.reload_threads.values())
+        for thread in background:
+            if thread is not None:
+                thread.wait()
+        self.stop_playback()
+        if self.video_cap is not None:
+            self.video_cap.close()
+        super().closeEvent(event)
+
+    def export_trace(self):
+        if not TRACER.enabled:
+            self.label_status.setText("性能记录未开启，按 F3 开启 HUD 并开始记录")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "导出 Trace", "quickcheck_trace.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            count = TRACER.export_chrome_trace(path)
+        except OSError as e:
+            QMessageBox.critical(self, "错误", f"无法保存 Trace: {e}")
+            return
+        self.label_status.setText(f"已导出 {count} 条记录到 {path}")
+
     def keyPressEvent(self, event):
+        # F3 / F4：性能 HUD 与 Trace 导出，不需要打开视频
+        if event.key() == Qt.Key_F3:
+            self.perf_hud.set_active(not self.perf_hud.isVisible())
+            return
+        if event.key() == Qt.Key_F4:
+            self.export_trace()
+            return
+
         if not self.video_cap:
             return
 
+        # 空格：播放/暂停
+        if event.key() == Qt.Key_Space:
+            self.toggle_playback()
+
+        # Q / E 键：上一个 / 下一个匹配帧
+        elif event.key() == Qt.Key_Q:
+            self.jump_to_match(-1)
+
+        elif event.key() == Qt.Key_E:
+            self.jump_to_match(1)
+
+        # [ / ] 键：选中轨迹的起始 / 结束帧
+        elif event.key() == Qt.Key_BracketLeft:
+            self.jump_to_track_end(False)
+
+        elif event.key() == Qt.Key_BracketRight:
+            self.jump_to_track_end(True)
+
+        # T 键：显示/隐藏轨迹
+        elif event.key() == Qt.Key_T:
+            self.toggle_tracks()
+
+        # H 键：切换热力图
+        elif event.key() == Qt.Key_H:
+            self.cycle_heatmap()
+
         # A 键：上一帧
-        if event.key() == Qt.Key_A:
+        elif event.key() == Qt.Key_A:
+            self.stop_playback()
             if self.current_frame_idx > 0:
                 self.show_frame(self.current_frame_idx - 1)
         
         # D 键：下一帧
         elif event.key() == Qt.Key_D:
+            self.stop_playback()
             if self.current_frame_idx < self.total_frames - 1:
                 self.show_frame(self.current_frame_idx + 1)
         
@@ -0,0 +1,134 @@
+import os
+import sys
+
+import numpy as np
+
+from annotation_store import (AnnotationStore, CameraAnnotations, EMPTY_BOXES, STORE_SUFFIX,
+                              store_matches, write_store)
+from sidecar_cache import folder_cache_paths
+
+# 本模块的作用：
+# 1. 读取按相机保存的检测结果 Camera{r}-{c}.npy（见 md/npy_data_structure_analysis.md）：
+#    外层按帧（下标 0 为第 1 帧），每帧是 [[x1,y1,x2,y2,...], ...] 的不等长列表，需要 allow_pickle 加载
+# 2. 只在首次（或 .npy 文件变化后）解 pickle 一次，转换为与 annotation_store 相同的列式存储
+#    （offsets int64 + boxes int32），之后直接内存映射，不再经过 JSON，也不再反序列化对象数组
+# 3. 转换结果放在 npy 文件夹旁边的 `<文件夹>.store/`，不可写时放在用户缓存目录；
+#    与文件夹中每个 .npy 的 size/mtime 绑定
+# 4. 相机名使用对应的视频文件名（Camera1-1.npy -> Camera1-1.avi），与 JSON 标注的 key 一致
+#
+# 用法：python npy_annotations.py <npy 文件夹> [...]
+
+VIDEO_EXTENSION = ".avi"
+NPY_STORE_NAME = "npy" + STORE_SUFFIX
+
+
+def camera_name_for(npy_name):
+    return os.path.splitext(npy_name)[0] + VIDEO_EXTENSION
+
+
+def list_npy_files(npy_dir):
+    return sorted(f for f in os.listdir(npy_dir) if f.lower().endswith(".npy"))
+
+
+def npy_folder_signature(npy_dir):
+    signature = {}
+    for name in list_npy_files(npy_dir):
+        st = os.stat(os.path.join(npy_dir, name))
+        signature[name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return {"npy_files": signature}
+
+
+def _frame_boxes(boxes):
+    # 单帧的框 -> (k, 4) float64；内层长度不一致或多于 4 列（如置信度）时只取前 4 个值
+    if boxes is None or len(boxes) == 0:
+        return None
+    try:
+        arr = np.asarray(boxes, dtype=np.float64)
+    except (TypeError, ValueError):
+        arr = None
+    if arr is None or arr.ndim != 2 or arr.shape[1] < 4:
+        valid = [b[:4] for b in boxes if b is not None and len(b) >= 4]
+        if not valid:
+            return None
+        arr = np.asarray(valid, dtype=np.float64)
+    return arr[:, :4]
+
+
+def camera_from_npy(npy_path):
+    data = np.load(npy_path, allow_pickle=True)
+    if data.ndim == 0:
+        # np.save 保存的 Python 列表有时是 0 维对象数组
+        data = data.item()
+    frames = list(data)
+
+    counts = np.zeros(len(frames), dtype=np.int64)
+    parts = []
+    for i, boxes in enumerate(frames):
+        arr = _frame_boxes(boxes)
+        if arr is None:
+            continue
+        counts[i] = len(arr)
+        parts.append(arr)
+
+    offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    boxes = np.rint(np.concatenate(parts)).astype(np.int32) if parts else EMPTY_BOXES
+    return CameraAnnotations(offsets, boxes)
+
+
+def store_candidates(npy_dir):
+    # 文件夹旁边的 .store 优先，其次用户缓存目录
+    npy_dir = os.path.abspath(npy_dir).rstrip("\\/")
+    return [npy_dir + STORE_SUFFIX, folder_cache_paths(npy_dir, NPY_STORE_NAME)[-1]]
+
+
+def convert_npy_folder(npy_dir, store_dir=None, progress=None):
+    # 解 pickle 所有 .npy 并写入列式存储，返回存储目录
+    signature = npy_folder_signature(npy_dir)
+    names = list_npy_files(npy_dir)
+    cameras = {}
+    for i, name in enumerate(names):
+        cameras[camera_name_for(name)] = camera_from_npy(os.path.join(npy_dir, name))
+        if progress is not None:
+            progress((i + 1) / len(names))
+
+    candidates = [store_dir] if store_dir else store_candidates(npy_dir)
+    for candidate in candidates:
+        try:
+            write_store(AnnotationStore(cameras), candidate, source=signature)
+            return candidate
+        except OSError:
+            continue
+    raise OSError(f"could not write converted store for {npy_dir}")
+
+
+def load_npy_annotations(npy_dir, progress=None):
+    # 存在新鲜的转换文件时直接内存映射，否则先转换一次
+    if not os.path.isdir(npy_dir):
+        print(f"Warning: {npy_dir} not found.")
+        return AnnotationStore()
+
+    signature = npy_folder_signature(npy_dir)
+    for candidate in store_candidates(npy_dir):
+        if store_matches(candidate, signature):
+            return AnnotationStore.open(candidate)
+
+    print(f"Converting npy detections in {npy_dir} ...")
+    return AnnotationStore.open(convert_npy_folder(npy_dir, progress=progress))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        argv = [os.path.join(os.getcwd(), "npy")]
+
+    for npy_dir in argv:
+        if not os.path.isdir(npy_dir):
+            print(f"Warning: {npy_dir} not found, skipped.")
+            continue
+        store_dir = convert_npy_folder(npy_dir)
+        print(f"Converted {len(list_npy_files(npy_dir))} npy files in {npy_dir} -> {store_dir}")
+
+
+if __name__ == "__main__":
+    main()
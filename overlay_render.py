@@ -0,0 +1,94 @@
+import numpy as np
+from PyQt5.QtCore import Qt, QPointF
+from PyQt5.QtGui import QPen, QColor, QBrush, QPolygonF
+
+# 本模块的作用：
+# 1. 统一标注的绘制样式：Old 为绿色半透明蒙版，New 为黑色矩形框，
+#    第三层 NPY 检测结果（见 npy_annotations）为品红色虚线框
+# 2. 坐标按 (scale, dx, dy) 从原始分辨率变换到绘制目标，单帧视图和网格视图的小图共用
+# 3. 轨迹（见 track_index）画成框中心点的折线：Old 深绿色，New 橙色，鼠标所在的轨迹加粗高亮
+# 4. 传入 viewport（原始分辨率坐标的可见范围）时先向量化裁掉不可见的框和轨迹，放大查看时只绘制可见部分
+
+OLD_FILL_COLOR = QColor(0, 255, 0, 80) # R, G, B, Alpha
+NEW_PEN_COLOR = Qt.black
+DET_PEN_COLOR = QColor(255, 0, 255)
+OLD_TRACK_COLOR = QColor(0, 140, 0)
+NEW_TRACK_COLOR = QColor(255, 140, 0)
+HIGHLIGHT_TRACK_COLOR = QColor(0, 200, 255)
+
+
+def _to_target(b, scale, dx, dy):
+    x1, y1, x2, y2 = b[:4]
+    # 坐标变换
+    x1 = int(x1 * scale + dx)
+    y1 = int(y1 * scale + dy)
+    x2 = int(x2 * scale + dx)
+    y2 = int(y2 * scale + dy)
+    return x1, y1, x2 - x1, y2 - y1
+
+
+def cull_boxes(boxes, viewport):
+    # viewport: (x0, y0, x1, y1)；返回与之相交的框
+    if viewport is None or not len(boxes):
+        return boxes
+    b = np.asarray(boxes)
+    if b.ndim != 2 or b.shape[1] < 4:
+        return boxes
+    x0, y0, x1, y1 = viewport
+    return b[(b[:, 2] >= x0) & (b[:, 0] <= x1) & (b[:, 3] >= y0) & (b[:, 1] <= y1)]
+
+
+def draw_annotations(painter, old_boxes, new_boxes, scale, dx, dy, pen_width=2, det_boxes=(), viewport=None):
+    old_boxes = cull_boxes(old_boxes, viewport)
+    new_boxes = cull_boxes(new_boxes, viewport)
+    det_boxes = cull_boxes(det_boxes, viewport)
+
+    # 绘制 Old Annotations (绿色蒙版)
+    if len(old_boxes):
+        painter.setBrush(QBrush(OLD_FILL_COLOR))
+        painter.setPen(Qt.NoPen)
+        for b in old_boxes:
+            if len(b) >= 4:
+                painter.drawRect(*_to_target(b, scale, dx, dy))
+
+    # 绘制 New Annotations (黑框)
+    if len(new_boxes):
+        pen_box = QPen(NEW_PEN_COLOR)
+        pen_box.setWidth(pen_width)
+        painter.setPen(pen_box)
+        painter.setBrush(Qt.NoBrush)
+        for b in new_boxes:
+            if len(b) >= 4:
+                painter.drawRect(*_to_target(b, scale, dx, dy))
+
+    # 绘制 NPY 检测结果 (品红虚线框)
+    if len(det_boxes):
+        pen_det = QPen(DET_PEN_COLOR)
+        pen_det.setWidth(pen_width)
+        pen_det.setStyle(Qt.DashLine)
+        painter.setPen(pen_det)
+        painter.setBrush(Qt.NoBrush)
+        for b in det_boxes:
+            if len(b) >= 4:
+                painter.drawRect(*_to_target(b, scale, dx, dy))
+
+
+def draw_tracks(painter, trajectories, scale, dx, dy, highlight=None, pen_width=1, viewport=None):
+    # trajectories: [(标签, 轨迹 ID, 中心点 (N, 2))]，highlight 为 (标签, 轨迹 ID)
+    painter.setBrush(Qt.NoBrush)
+    for label, track_id, points in trajectories:
+        if len(points) < 2:
+            continue
+        if viewport is not None:
+            x0, y0, x1, y1 = viewport
+            lo, hi = points.min(axis=0), points.max(axis=0)
+            if hi[0] < x0 or lo[0] > x1 or hi[1] < y0 or lo[1] > y1:
+                continue
+        if highlight == (label, track_id):
+            pen = QPen(HIGHLIGHT_TRACK_COLOR)
+            pen.setWidth(pen_width + 2)
+        else:
+            pen = QPen(OLD_TRACK_COLOR if label == "Old" else NEW_TRACK_COLOR)
+            pen.setWidth(pen_width)
+        painter.setPen(pen)
+        painter.drawPolyline(QPolygonF([QPointF(x * scale + dx, y * scale + dy) for x, y in points]))
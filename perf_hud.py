@@ -0,0 +1,59 @@
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QFontDatabase
+
+from perf_trace import TRACER
+
+# 本模块的作用：
+# 1. 半透明的性能 HUD，叠加在画面左上角，每 REFRESH_MS 刷新一次各阶段最近若干次耗时的 p50/p95（见 perf_trace）
+# 2. 显示 HUD 时自动开始记录；关闭 HUD 时，若记录是由 HUD 开启的则一并停止
+# 3. 不接收鼠标事件，不影响下方画面的十字光标和点击
+
+REFRESH_MS = 500
+# 单帧流程中的阶段按执行顺序排在前面，其余按首次出现的顺序
+STAGE_ORDER = (
+    "show_frame", "frame_wait", "seek", "decode", "convert", "pixmap_upload", "annotations",
+    "histogram_cursor", "paint", "overlay_render", "update_histogram", "histogram_render",
+    "grid_decode", "load_annotations", "index_json", "parse_camera", "open_store",
+)
+
+
+class PerfHud(QLabel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 170); color: #e8e8e8; padding: 6px;")
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self._owns_tracer = False
+        self.hide()
+
+    def set_active(self, active):
+        if active:
+            if not TRACER.enabled:
+                TRACER.enable()
+                self._owns_tracer = True
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.timer.start(REFRESH_MS)
+        else:
+            self.timer.stop()
+            self.hide()
+            if self._owns_tracer:
+                TRACER.enable(False)
+                self._owns_tracer = False
+
+    def refresh(self):
+        stats = TRACER.stage_stats()
+        names = [name for name in STAGE_ORDER if name in stats] + [name for name in stats if name not in STAGE_ORDER]
+        lines = [f"{'stage':<18}{'n':>5}{'p50 ms':>9}{'p95 ms':>9}"]
+        for name in names:
+            n, p50, p95 = stats[name]
+            lines.append(f"{name:<18}{n:>5}{p50:>9.2f}{p95:>9.2f}")
+        if not names:
+            lines.append("(等待记录...)")
+        self.setText("\n".join(lines))
+        self.adjustSize()
+        self.move(8, 8)
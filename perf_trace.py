@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+from collections import deque
+
+import numpy as np
+
+# 本模块的作用：
+# 1. 轻量的分阶段计时：with span("decode"): ... 记录一次耗时；未启用时 span 返回共享的空上下文，
+#    开销只有一次函数调用和一次属性判断
+# 2. 每个阶段保留最近 ROLLING_WINDOW 次的耗时，用于界面 HUD 显示滚动的 p50/p95
+# 3. 所有记录同时保存为事件（有上限），可导出为 Chrome trace-event JSON（chrome://tracing 或 Perfetto 打开）；
+#    时间戳取 time.perf_counter（系统范围的单调时钟），多进程的事件可直接合并
+# 4. 环境变量 QUICKCHECK_TRACE=1 时启动即启用；值为 .json 路径时退出时自动导出到该文件
+#    不依赖 Qt，界面和批处理脚本共用
+
+TRACE_ENV = "QUICKCHECK_TRACE"
+ROLLING_WINDOW = 200
+MAX_EVENTS = 500000
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        # (名称, 开始时间 s, 耗时 s, pid, tid, 参数)
+        self._events = deque(maxlen=MAX_EVENTS)
+        self._recent = {}
+        self._thread_names = {}
+        # 从其他进程合并来的线程名 (pid, tid) -> 名称
+        self._foreign_names = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start, end, args=None):
+        tid = threading.get_ident()
+        with self._lock:
+            if tid not in self._thread_names:
+                self._thread_names[tid] = threading.current_thread().name
+            self._events.append((name, start, end - start, os.getpid(), tid, args or None))
+            recent = self._recent.get(name)
+            if recent is None:
+                recent = self._recent[name] = deque(maxlen=ROLLING_WINDOW)
+            recent.append(end - start)
+
+    def stage_stats(self):
+        # {阶段: (最近次数, p50 ms, p95 ms)}，按阶段首次出现的顺序
+        with self._lock:
+            recent = {name: np.asarray(values) for name, values in self._recent.items()}
+        stats = {}
+        for name, values in recent.items():
+            if len(values):
+                p50, p95 = np.percentile(values, (50, 95)) * 1000
+                stats[name] = (len(values), float(p50), float(p95))
+        return stats
+
+    def drain_events(self):
+        # 取出并清空事件（工作进程把事件交回主进程时使用）
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            names = dict(self._thread_names)
+        return {"events": events, "thread_names": {(os.getpid(), tid): n for tid, n in names.items()}}
+
+    def add_events(self, drained):
+        # 合并 drain_events 的结果；只进入事件列表，不影响本进程的滚动统计
+        with self._lock:
+            self._events.extend(drained["events"])
+            self._foreign_names.update(drained["thread_names"])
+
+    def reset(self):
+        with self._lock:
+            self._events.clear()
+            self._recent.clear()
+            self._foreign_names.clear()
+
+    def export_chrome_trace(self, path):
+        with self._lock:
+            events = list(self._events)
+            names = {(os.getpid(), tid): n for tid, n in self._thread_names.items()}
+            names.update(self._foreign_names)
+
+        trace = []
+        for (pid, tid), name in names.items():
+            trace.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": name}})
+        for name, start, duration, pid, tid, args in events:
+            event = {"ph": "X", "name": name, "cat": "quickcheck", "pid": pid, "tid": tid,
+                     "ts": round(start * 1e6, 3), "dur": round(duration * 1e6, 3)}
+            if args:
+                event["args"] = args
+            trace.append(event)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        os.replace(path + ".tmp", path)
+        return len(events)
+
+
+TRACER = Tracer()
+
+
+def span(name, **args):
+    return TRACER.span(name, **args)
+
+
+def traced(name):
+    # 装饰器：整个函数记为一个阶段
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                TRACER.record(name, start, time.perf_counter())
+        return wrapper
+    return decorator
+
+
+def _export_at_exit(path):
+    try:
+        count = TRACER.export_chrome_trace(path)
+        print(f"Trace with {count} events saved to {path}")
+    except OSError as e:
+        print(f"Warning: could not save trace to {path}: {e}")
+
+
+def enable_from_env():
+    value = os.environ.get(TRACE_ENV, "")
+    if value in ("", "0"):
+        return
+    TRACER.enable()
+    if value.lower().endswith(".json"):
+        atexit.register(_export_at_exit, value)
+
+
+enable_from_env()
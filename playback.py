@@ -0,0 +1,181 @@
+import time
+import queue
+import threading
+
+import cv2
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+
+from seek_index import seek_capture
+
+# 本模块的作用：
+# 1. 实时播放：解码（生产者线程）与显示（QTimer 驱动的消费者）解耦，中间用有界队列连接
+# 2. 播放时钟按视频原生 FPS × 倍速推进，消费者只显示时钟到达的最新帧，落后的帧直接丢弃，不会越播越慢
+# 3. 生产者解码落后于时钟时只 grab 不转换，尽早丢帧
+# 4. 每秒报告实际 FPS / 目标 FPS / 丢帧数
+
+PLAYBACK_SPEEDS = [0.25, 0.5, 1.0, 2.0, 4.0, 8.0]
+DEFAULT_FPS = 25.0
+QUEUE_SIZE = 16
+
+
+class PlaybackProducer(threading.Thread):
+    def __init__(self, video_path, start_idx, total_frames, expected_index, seek_index=None, queue_size=QUEUE_SIZE):
+        super().__init__(name="PlaybackProducer", daemon=True)
+        self.video_path = video_path
+        self.start_idx = start_idx
+        self.total_frames = total_frames
+        # 返回播放时钟当前应显示的帧号（跨线程读取）
+        self.expected_index = expected_index
+        self.seek_index = seek_index
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.skipped = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            pos = seek_capture(cap, self.start_idx, self.seek_index)
+            idx = self.start_idx
+            while pos >= 0 and idx < self.total_frames and not self._stop_event.is_set():
+                # 已经落后于播放时钟的帧只 grab：grab 仍会解码，但省去 retrieve 的颜色转换和拷贝
+                if idx < self.expected_index():
+                    if not cap.grab():
+                        break
+                    self.skipped += 1
+                    idx += 1
+                    continue
+
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if not self._put((idx, frame)):
+                    return
+                idx += 1
+        finally:
+            cap.release()
+        # 结束标记
+        self._put(None)
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+class PlaybackController(QObject):
+    frame_ready = pyqtSignal(int, object)
+    # 实际 FPS, 目标 FPS, 丢帧数
+    stats_updated = pyqtSignal(float, float, int)
+    finished = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self._on_tick)
+
+        self.producer = None
+        self.fps = DEFAULT_FPS
+        self.speed = 1.0
+        self.total_frames = 0
+        self.dropped = 0
+
+        # 播放时钟：界面线程重设，生产者线程通过 expected_index 读取
+        self._clock_lock = threading.Lock()
+        self._anchor_idx = 0
+        self._anchor_time = 0.0
+        self._last_idx = -1
+        self._pending = None
+        self._eof = False
+        self._shown = 0
+        self._stats_time = 0.0
+
+    def is_playing(self):
+        return self.producer is not None
+
+    def start(self, video_path, start_idx, total_frames, fps, speed=1.0, seek_index=None):
+        self.stop()
+        self.fps = fps if fps and fps > 0 else DEFAULT_FPS
+        self.total_frames = total_frames
+        self.dropped = 0
+        self._pending = None
+        self._eof = False
+        self._last_idx = start_idx - 1
+        self._reset_clock(start_idx, speed)
+
+        self.producer = PlaybackProducer(video_path, start_idx, total_frames, self.expected_index, seek_index)
+        self.producer.start()
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        if self.producer is not None:
+            self.producer.stop()
+            self.producer = None
+
+    def set_speed(self, speed):
+        # 以当前显示的帧为新的时钟起点，避免变速时跳帧
+        if self.is_playing():
+            self._reset_clock(self._last_idx + 1, speed)
+        else:
+            with self._clock_lock:
+                self.speed = speed
+
+    def expected_index(self):
+        with self._clock_lock:
+            return self._anchor_idx + int((time.monotonic() - self._anchor_time) * self.fps * self.speed)
+
+    def _reset_clock(self, start_idx, speed):
+        with self._clock_lock:
+            self.speed = speed
+            self._anchor_idx = start_idx
+            self._anchor_time = time.monotonic()
+        self._shown = 0
+        self._stats_time = self._anchor_time
+        self.timer.setInterval(max(1, int(1000 / (self.fps * self.speed))))
+
+    def _on_tick(self):
+        expected = min(self.expected_index(), self.total_frames - 1)
+
+        # 取出时钟已到达的最新一帧，更早的帧丢弃
+        latest = None
+        while True:
+            item = self._pending
+            self._pending = None
+            if item is None:
+                try:
+                    item = self.producer.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._eof = True
+                    break
+            if item[0] > expected:
+                self._pending = item
+                break
+            if latest is not None:
+                self.dropped += 1
+            latest = item
+
+        if latest is not None:
+            self._last_idx = latest[0]
+            self._shown += 1
+            self.frame_ready.emit(latest[0], latest[1])
+
+        now = time.monotonic()
+        if now - self._stats_time >= 1.0:
+            achieved = self._shown / (now - self._stats_time)
+            self.stats_updated.emit(achieved, self.fps * self.speed, self.dropped + self.producer.skipped)
+            self._shown = 0
+            self._stats_time = now
+
+        if self._eof and self._pending is None:
+            self.stop()
+            self.finished.emit()
@@ -0,0 +1,209 @@
+import os
+import struct
+from bisect import bisect_right
+
+import cv2
+import numpy as np
+
+from sidecar_cache import file_signature, load_sidecar, save_sidecar
+
+# 本模块的作用：
+# 1. 为视频建立 seek 索引：关键帧位置 + 经过校验的总帧数
+# 2. AVI 直接读取容器索引（OpenDML indx/ix## 或 idx1）得到关键帧位置；
+#    首次建立索引时再顺序 grab 一遍统计真实帧数，与容器索引的帧数（假设每个 ##dc 块解码出一帧）核对，
+#    不一致时（例如有空块/丢帧）以 grab 的帧数为准并舍弃关键帧信息；其他格式或无索引时只 grab 一遍
+# 3. 索引保存在 sidecar 缓存中（按 path/size/mtime 失效），之后打开同一视频不再 grab
+# 4. FrameProvider 用它 seek 到目标帧之前最近的关键帧，再顺序解码到目标帧，
+#    避免 CAP_PROP_POS_FRAMES 直接 seek 到非关键帧时的缓慢和不准确
+
+SEEK_INDEX_VERSION = 2
+SEEK_INDEX_SUFFIX = ".seek.json"
+
+AVIIF_KEYFRAME = 0x10
+AVI_INDEX_OF_INDEXES = 0x00
+AVI_INDEX_OF_CHUNKS = 0x01
+AVI_NOT_KEYFRAME = 0x80000000
+
+_IDX1_DTYPE = np.dtype([("ckid", "S4"), ("flags", "<u4"), ("offset", "<u4"), ("size", "<u4")])
+_IX_ENTRY_DTYPE = np.dtype([("offset", "<u4"), ("size", "<u4")])
+
+
+class SeekIndex:
+    def __init__(self, frame_count, keyframes, source):
+        self.frame_count = frame_count
+        self.keyframes = list(keyframes)
+        self.source = source
+
+    def keyframe_before(self, frame_idx):
+        # 不晚于 frame_idx（0-based）的最近关键帧，无关键帧信息时返回 None
+        i = bisect_right(self.keyframes, frame_idx) - 1
+        if i < 0:
+            return None
+        return self.keyframes[i]
+
+    def to_dict(self):
+        # 全部为关键帧（如 MJPEG）时不逐帧保存
+        all_keyframes = self.frame_count > 0 and len(self.keyframes) == self.frame_count
+        return {
+            "version": SEEK_INDEX_VERSION,
+            "frame_count": self.frame_count,
+            "keyframes": "all" if all_keyframes else self.keyframes,
+            "source": self.source,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        keyframes = data["keyframes"]
+        if keyframes == "all":
+            keyframes = range(data["frame_count"])
+        return cls(data["frame_count"], keyframes, data.get("source", "cache"))
+
+
+def seek_capture(cap, frame_idx, index=None, pos=-1):
+    # 将 cap 定位到 frame_idx（下一次 read 返回该帧），pos 为当前解码位置，返回新的位置（失败为 -1）
+    keyframe = index.keyframe_before(frame_idx) if index is not None else None
+    if keyframe is None:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        return frame_idx
+
+    # 当前解码位置已在关键帧与目标帧之间时直接向前解码，否则先跳到关键帧
+    if not keyframe <= pos <= frame_idx:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        pos = keyframe
+    while pos < frame_idx:
+        if not cap.grab():
+            return -1
+        pos += 1
+    return pos
+
+
+def load_seek_index(video_path, build=True):
+    signature = file_signature(video_path)
+    data = load_sidecar(video_path, SEEK_INDEX_SUFFIX, signature)
+    if data and data.get("version") == SEEK_INDEX_VERSION:
+        return SeekIndex.from_dict(data)
+    if not build:
+        return None
+
+    index = build_seek_index(video_path)
+    save_sidecar(video_path, SEEK_INDEX_SUFFIX, index.to_dict(), signature)
+    return index
+
+
+def build_seek_index(video_path):
+    index = None
+    try:
+        index = parse_avi_index(video_path)
+    except (OSError, struct.error, ValueError) as e:
+        print(f"Warning: could not parse AVI index of {video_path}: {e}")
+    scanned = scan_frames(video_path)
+    if index is None:
+        return scanned
+    if index.frame_count != scanned.frame_count:
+        # 容器索引中的块与解码出的帧不一一对应，关键帧位置也不可信
+        print(f"Warning: AVI index of {video_path} lists {index.frame_count} frames, "
+              f"decoding found {scanned.frame_count}")
+        return scanned
+    return index
+
+
+def scan_frames(video_path):
+    # 顺序 grab 一遍统计真实帧数
+    cap = cv2.VideoCapture(video_path)
+    count = 0
+    while cap.grab():
+        count += 1
+    cap.release()
+    return SeekIndex(count, [], "scan")
+
+
+def parse_avi_index(video_path):
+    with open(video_path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        head = f.read(12)
+        if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"AVI ":
+            return None
+        riff_end = min(8 + struct.unpack("<I", head[4:8])[0], file_size)
+
+        stream_no = None
+        super_index = None
+        idx1 = None
+        pos = 12
+        while pos + 8 <= riff_end:
+            f.seek(pos)
+            fourcc, size = struct.unpack("<4sI", f.read(8))
+            if fourcc == b"LIST" and f.read(4) == b"hdrl":
+                stream_no, super_index = _parse_hdrl(f, pos + 12, pos + 8 + size)
+            elif fourcc == b"idx1":
+                idx1 = f.read(size)
+            pos += 8 + size + (size & 1)
+
+        if stream_no is None:
+            return None
+        if super_index:
+            index = _parse_odml_index(f, super_index)
+            if index is not None:
+                return index
+        if idx1:
+            return _parse_idx1(idx1, stream_no)
+    return None
+
+
+def _parse_hdrl(f, start, end):
+    # 找到第一个视频流的序号及其 OpenDML 超级索引（indx）
+    stream = 0
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        fourcc, size = struct.unpack("<4sI", f.read(8))
+        if fourcc == b"LIST" and f.read(4) == b"strl":
+            fcc_type = None
+            indx = None
+            sub = pos + 12
+            while sub + 8 <= pos + 8 + size:
+                f.seek(sub)
+                sub_fourcc, sub_size = struct.unpack("<4sI", f.read(8))
+                if sub_fourcc == b"strh":
+                    fcc_type = f.read(4)
+                elif sub_fourcc == b"indx":
+                    indx = f.read(sub_size)
+                sub += 8 + sub_size + (sub_size & 1)
+            if fcc_type == b"vids":
+                return stream, indx
+            stream += 1
+        pos += 8 + size + (size & 1)
+    return None, None
+
+
+def _parse_idx1(data, stream_no):
+    entries = np.frombuffer(data, dtype=_IDX1_DTYPE, count=len(data) // _IDX1_DTYPE.itemsize)
+    prefix = b"%02d" % stream_no
+    mask = (entries["ckid"] == prefix + b"dc") | (entries["ckid"] == prefix + b"db")
+    if not mask.any():
+        return None
+    flags = entries["flags"][mask]
+    keyframes = np.flatnonzero(flags & AVIIF_KEYFRAME)
+    return SeekIndex(int(mask.sum()), keyframes.tolist(), "avi-idx1")
+
+
+def _parse_odml_index(f, indx):
+    longs_per_entry, _, index_type, n_entries = struct.unpack("<HBBI", indx[:8])
+    if index_type != AVI_INDEX_OF_INDEXES or longs_per_entry != 4:
+        return None
+
+    sizes = []
+    for i in range(n_entries):
+        offset, _, _ = struct.unpack("<QII", indx[24 + 16 * i:24 + 16 * (i + 1)])
+        f.seek(offset + 8)
+        header = f.read(24)
+        std_longs, _, std_type, std_entries = struct.unpack("<HBBI", header[:8])
+        if std_type != AVI_INDEX_OF_CHUNKS or std_longs != 2:
+            return None
+        raw = f.read(std_entries * _IX_ENTRY_DTYPE.itemsize)
+        sizes.append(np.frombuffer(raw, dtype=_IX_ENTRY_DTYPE)["size"])
+
+    if not sizes:
+        return None
+    sizes = np.concatenate(sizes)
+    keyframes = np.flatnonzero((sizes & AVI_NOT_KEYFRAME) == 0)
+    return SeekIndex(len(sizes), keyframes.tolist(), "avi-odml")
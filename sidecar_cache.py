@@ -0,0 +1,74 @@
+import os
+import json
+import hashlib
+
+# 本模块的作用：
+# 1. 为视频等源文件提供旁路缓存（sidecar）文件的路径：默认放在源文件同目录的 .quickcheck/ 下，
+#    目录不可写时回退到用户缓存目录
+# 2. 缓存内容与源文件的 path/size/mtime 绑定，源文件变化后自动失效
+# 3. 也可以为整个文件夹保存一个缓存文件（如视频元数据），由调用方自行校验各条目
+
+CACHE_DIR_NAME = ".quickcheck"
+FALLBACK_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "quickcheck")
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def folder_cache_paths(folder, name):
+    # 候选缓存路径：文件夹内 .quickcheck/ 优先，其次用户缓存目录
+    folder = os.path.abspath(folder)
+    folder_key = hashlib.sha1(folder.encode("utf-8")).hexdigest()[:16]
+    return [
+        os.path.join(folder, CACHE_DIR_NAME, name),
+        os.path.join(FALLBACK_CACHE_DIR, folder_key, name),
+    ]
+
+
+def sidecar_paths(source_path, suffix):
+    folder, name = os.path.split(os.path.abspath(source_path))
+    return folder_cache_paths(folder, name + suffix)
+
+
+def read_cache_file(paths):
+    # 返回第一个可读的缓存内容，都不存在时返回 None
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def write_cache_file(paths, payload):
+    for path in paths:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, path)
+            return path
+        except OSError:
+            continue
+    print(f"Warning: could not write cache {paths[0]}")
+    return None
+
+
+def load_sidecar(source_path, suffix, signature=None):
+    # 返回缓存中的 data；缓存不存在或签名不匹配时返回 None
+    signature = signature or file_signature(source_path)
+    cached = read_cache_file(sidecar_paths(source_path, suffix))
+    if cached and cached.get("signature") == signature:
+        return cached.get("data")
+    return None
+
+
+def save_sidecar(source_path, suffix, data, signature=None):
+    signature = signature or file_signature(source_path)
+    return write_cache_file(sidecar_paths(source_path, suffix), {"signature": signature, "data": data})
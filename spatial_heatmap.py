@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+
+from perf_trace import span
+
+# 本模块的作用：
+# 1. 把一个相机所有帧的框累加成画面上的二维密度图（每个格子被多少个框覆盖过）：
+#    每个框只在差分数组的四个角上 +1/-1（用 bincount 一次完成），再沿两个方向 cumsum，
+#    计算量与框数和格子数成线性关系，不逐框切片赋值
+# 2. 画面按 HEATMAP_CELL 像素一格降采样，坐标超出画面的部分裁掉；画面尺寸未知时用框的最大坐标
+# 3. HeatmapCache 按（标注源, 相机, 画面尺寸）缓存结果，与 StatsCache 相同的失效方式
+# 4. colorize / colorize_ratio 生成 RGBA 叠加图：密度（对数归一化）或 New/Old 的保留比例，
+#    单视频视图的热力图叠加层和 batch_generate_histograms 导出的热力图共用
+
+# 每个格子的边长（像素）
+HEATMAP_CELL = 4
+# 叠加图的最大不透明度
+HEATMAP_ALPHA = 170
+
+
+def boxes_extent(cam):
+    # 框的最大右下角坐标，作为未知画面尺寸时的范围
+    boxes = np.asarray(cam.all_boxes())
+    if not len(boxes):
+        return 1, 1
+    return max(int(boxes[:, 2].max()), 1), max(int(boxes[:, 3].max()), 1)
+
+
+def heatmap_shape(width, height, cell=HEATMAP_CELL):
+    return -(-height // cell), -(-width // cell)
+
+
+def accumulate_boxes(boxes, width, height, cell=HEATMAP_CELL):
+    # boxes: (N, 4) x1, y1, x2, y2（像素）-> (ceil(h/cell), ceil(w/cell)) int64 覆盖计数
+    rows, cols = heatmap_shape(width, height, cell)
+    boxes = np.asarray(boxes)
+    if not len(boxes):
+        return np.zeros((rows, cols), dtype=np.int64)
+    boxes = boxes[:, :4].astype(np.int64)
+    # 框覆盖到的格子范围 [x1, x2) x [y1, y2)，至少一格
+    x1 = np.clip(boxes[:, 0] // cell, 0, cols)
+    y1 = np.clip(boxes[:, 1] // cell, 0, rows)
+    x2 = np.clip(-(-boxes[:, 2] // cell), 0, cols)
+    y2 = np.clip(-(-boxes[:, 3] // cell), 0, rows)
+    x2 = np.where((x2 <= x1) & (x1 < cols), x1 + 1, x2)
+    y2 = np.where((y2 <= y1) & (y1 < rows), y1 + 1, y2)
+    keep = (x2 > x1) & (y2 > y1)
+    x1, y1, x2, y2 = x1[keep], y1[keep], x2[keep], y2[keep]
+
+    # 差分数组多一行一列，四个角的 +1/-1 分两次 bincount 累加
+    stride = cols + 1
+    size = (rows + 1) * stride
+    plus = np.bincount(np.concatenate([y1 * stride + x1, y2 * stride + x2]), minlength=size)
+    minus = np.bincount(np.concatenate([y1 * stride + x2, y2 * stride + x1]), minlength=size)
+    diff = (plus - minus).reshape(rows + 1, stride)
+    return diff.cumsum(axis=0).cumsum(axis=1)[:rows, :cols]
+
+
+def compute_heatmap(cam, width=None, height=None, cell=HEATMAP_CELL):
+    with span("heatmap"):
+        if not width or not height:
+            width, height = boxes_extent(cam)
+        return accumulate_boxes(cam.all_boxes(), width, height, cell)
+
+
+class HeatmapCache:
+    def __init__(self, cell=HEATMAP_CELL):
+        self.cell = cell
+        # (id(source), camera_name, (width, height)) -> (source, 密度图)
+        self._entries = {}
+
+    def get(self, source, camera_name, size=None, load=True):
+        # load=False 时只使用已解析的相机（UI 线程中不触发 JSON 解析），未就绪返回 None
+        if not source or not camera_name:
+            return None
+        key = (id(source), camera_name, tuple(size) if size else None)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is source:
+            return entry[1]
+
+        cam = source.load_camera(camera_name) if load else source.cached(camera_name)
+        if cam is None:
+            return None
+        width, height = size if size else (None, None)
+        heatmap = compute_heatmap(cam, width, height, self.cell)
+        self._entries[key] = (source, heatmap)
+        return heatmap
+
+    def invalidate(self, source=None, camera_name=None):
+        for key, (entry_source, _) in list(self._entries.items()):
+            if source is not None and entry_source is not source:
+                continue
+            if camera_name is not None and key[1] != camera_name:
+                continue
+            del self._entries[key]
+
+
+def _normalize(density, vmax=None):
+    # 对数归一化到 [0, 1]，稀疏区域也能看出来
+    vmax = float(density.max()) if vmax is None else float(vmax)
+    if vmax <= 0:
+        return np.zeros(density.shape, dtype=np.float32)
+    return (np.log1p(density.astype(np.float32)) / np.log1p(vmax)).clip(0, 1)
+
+
+def _to_rgba(values, opacity):
+    # values: [0, 1] -> JET 颜色；opacity: [0, 1] -> alpha
+    color = cv2.applyColorMap((values * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    rgba = np.empty(values.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = color[..., ::-1]
+    rgba[..., 3] = (opacity * HEATMAP_ALPHA).astype(np.uint8)
+    return rgba
+
+
+def colorize(density, vmax=None):
+    # 密度图 -> RGBA，没有框的格子完全透明
+    values = _normalize(density, vmax)
+    return _to_rgba(values, np.where(density > 0, 0.35 + 0.65 * values, 0))
+
+
+def survival_ratio(new_density, old_density):
+    # New/Old 覆盖次数之比（Old 有框处），其余为 NaN
+    ratio = np.full(old_density.shape, np.nan, dtype=np.float32)
+    shape = tuple(min(a, b) for a, b in zip(new_density.shape, old_density.shape))
+    old = old_density[:shape[0], :shape[1]]
+    new = new_density[:shape[0], :shape[1]]
+    mask = old > 0
+    ratio[:shape[0], :shape[1]][mask] = np.minimum(new[mask] / old[mask], 1.0)
+    return ratio
+
+
+def colorize_ratio(new_density, old_density):
+    # New/Old 保留比例 -> RGBA（蓝 = New 几乎全部滤掉，红 = 基本保留），不透明度随 Old 密度变化
+    ratio = survival_ratio(new_density, old_density)
+    valid = ~np.isnan(ratio)
+    opacity = np.where(valid, 0.35 + 0.65 * _normalize(old_density), 0)
+    return _to_rgba(np.nan_to_num(ratio), opacity)
@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from annotation_store import open_store, prepare_store, source_signature
+from compare_annotations import batched_iou
+from perf_trace import span
+
+# 本模块的作用：
+# 1. 把每个相机相邻两帧的框连成轨迹（标注本身没有目标 ID）：
+#    对所有相邻帧对批量计算 IoU 和中心点距离（按框大小归一化），IoU 达到阈值的配对优先，
+#    其次是中心点距离足够近的配对，每对帧内按得分贪心一对一匹配；不跨越空帧
+# 2. 由“下一个框”的链接用指针倍增求出每个框所属轨迹的起点，得到轨迹 ID（按起始帧排序）
+# 3. 轨迹索引保存为 JSON 旁边的 `<name>.tracks/` 目录（与 .store 相同的列式布局，mmap 加载）：
+#    - frame_offsets.npy：每个相机的帧偏移（与 CameraAnnotations.offsets 对应，从 0 开始）
+#    - box_track.npy：int32，每个框所属的轨迹 ID（按相机内的框顺序）
+#    - track_offsets.npy / track_frames.npy / track_boxes.npy：按（轨迹, 帧号）排序的帧号和框
+#    - meta.json：版本、源 JSON 签名、关联参数、相机名 -> 各数组中的位置
+# 4. TrackCache 按（标注源, 相机）缓存轨迹：源 JSON 未变化时直接使用保存的索引，否则在后台线程中现算
+#
+# 用法：python track_index.py [json/annotations_old.json json/annotations_new.json] [--iou 0.3]
+#       [--max-distance 0.5] [-j 进程数]
+
+TRACKS_VERSION = 1
+TRACKS_SUFFIX = ".tracks"
+
+DEFAULT_IOU_THRESHOLD = 0.3
+# 中心点距离 / 两框平均边长（面积平方根）的上限
+DEFAULT_MAX_DISTANCE = 0.5
+# 每块 IoU 矩阵的元素数上限（帧对数 x 框数 x 框数），限制内存占用
+CHUNK_ELEMENTS = 1 << 20
+
+# 工作进程中的只读标注源（由 _init_worker 打开）
+_worker_source = None
+
+
+class CameraTracks:
+    # box_track[i]：相机第 i 个框（与 CameraAnnotations.all_boxes() 顺序一致）所属的轨迹
+    # 轨迹 t 的帧号/框为 track_frames/track_boxes[track_offsets[t]:track_offsets[t+1]]，帧号递增
+
+    def __init__(self, frame_offsets, box_track, track_offsets, track_frames, track_boxes):
+        self.frame_offsets = frame_offsets
+        self.box_track = box_track
+        self.track_offsets = track_offsets
+        self.track_frames = track_frames
+        self.track_boxes = track_boxes
+        self.n_tracks = max(len(track_offsets) - 1, 0)
+
+    def frame_tracks(self, frame_no):
+        # 第 frame_no 帧（1-based）各个框的轨迹 ID，顺序与 CameraAnnotations.frame() 相同
+        if frame_no < 1 or frame_no >= len(self.frame_offsets):
+            return self.box_track[:0]
+        return self.box_track[self.frame_offsets[frame_no - 1]:self.frame_offsets[frame_no]]
+
+    def span(self, track_id):
+        # (起始帧号, 结束帧号)
+        start, end = self.track_offsets[track_id], self.track_offsets[track_id + 1]
+        return int(self.track_frames[start]), int(self.track_frames[end - 1])
+
+    def track(self, track_id, first_frame=None, last_frame=None):
+        # 轨迹在 [first_frame, last_frame] 内的 (帧号, 框)
+        start, end = int(self.track_offsets[track_id]), int(self.track_offsets[track_id + 1])
+        frames = self.track_frames[start:end]
+        lo = np.searchsorted(frames, first_frame, "left") if first_frame is not None else 0
+        hi = np.searchsorted(frames, last_frame, "right") if last_frame is not None else len(frames)
+        return frames[lo:hi], self.track_boxes[start + lo:start + hi]
+
+
+def _padded_frames(boxes, offsets, counts, start, end, max_boxes):
+    # 第 start..end-1 帧（0-based）的框补齐成 (帧数, max_boxes, 4) + 有效掩码
+    n = end - start
+    padded = np.zeros((n, max_boxes, 4))
+    valid = np.zeros((n, max_boxes), dtype=bool)
+    c = counts[start:end]
+    total = int(c.sum())
+    if total:
+        frame_idx = np.repeat(np.arange(n), c)
+        slot = np.arange(total) - np.repeat(np.cumsum(c) - c, c)
+        padded[frame_idx, slot] = boxes[offsets[start]:offsets[end]]
+        valid[frame_idx, slot] = True
+    return padded, valid
+
+
+def link_scores(a, b, a_valid, b_valid, iou_threshold, max_distance):
+    # a, b: (F, M, 4) 相邻两帧 -> (F, M, M) 得分：IoU 达标为 1 + IoU，只有距离达标为 (0, 1]，其余 -1
+    iou = batched_iou(a, b)
+    ca = (a[..., :2] + a[..., 2:]) / 2
+    cb = (b[..., :2] + b[..., 2:]) / 2
+    dist = np.hypot(ca[:, :, None, 0] - cb[:, None, :, 0], ca[:, :, None, 1] - cb[:, None, :, 1])
+    size_a = np.sqrt(np.clip(a[..., 2] - a[..., 0], 1, None) * np.clip(a[..., 3] - a[..., 1], 1, None))
+    size_b = np.sqrt(np.clip(b[..., 2] - b[..., 0], 1, None) * np.clip(b[..., 3] - b[..., 1], 1, None))
+    dist /= (size_a[:, :, None] + size_b[:, None, :]) / 2
+
+    score = np.where(iou >= iou_threshold, 1.0 + iou, 1.0 - dist / max_distance if max_distance > 0 else -1.0)
+    score[score <= 0] = -1.0
+    score[~(a_valid[:, :, None] & b_valid[:, None, :])] = -1.0
+    return score
+
+
+def greedy_pairs(score):
+    # 每帧内按得分从大到小一对一匹配（得分 > 0），返回 (帧下标, 行, 列)
+    n_frames, m, n = score.shape
+    out_frames, out_rows, out_cols = [], [], []
+    active = np.arange(n_frames)
+    for _ in range(min(m, n)):
+        if not len(active):
+            break
+        sub = score[active].reshape(len(active), -1)
+        flat = sub.argmax(axis=1)
+        best = sub[np.arange(len(active)), flat]
+        accept = best > 0
+        if not accept.any():
+            break
+        hit = active[accept]
+        rows, cols = np.divmod(flat[accept], n)
+        out_frames.append(hit)
+        out_rows.append(rows)
+        out_cols.append(cols)
+        score[hit, rows, :] = -1.0
+        score[hit, :, cols] = -1.0
+        active = hit
+    if not out_frames:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return np.concatenate(out_frames), np.concatenate(out_rows), np.concatenate(out_cols)
+
+
+def link_boxes(cam, iou_threshold=DEFAULT_IOU_THRESHOLD, max_distance=DEFAULT_MAX_DISTANCE):
+    # 返回 succ：每个框在下一帧中链接到的框下标（相机内），没有为 -1
+    offsets = np.asarray(cam.offsets, dtype=np.int64)
+    offsets = offsets - offsets[0] if len(offsets) else offsets
+    counts = np.diff(offsets)
+    boxes = np.asarray(cam.all_boxes(), dtype=np.float64)
+    succ = np.full(len(boxes), -1, dtype=np.int64)
+    n_frames = len(counts)
+    if n_frames < 2 or not len(boxes):
+        return succ
+
+    # 只处理两帧都有框的帧对；连续的这类帧对按块批量计算
+    pair = (counts[:-1] > 0) & (counts[1:] > 0)
+    pair_frames = np.flatnonzero(pair)
+    if not len(pair_frames):
+        return succ
+    max_boxes = int(counts.max())
+    chunk = max(1, CHUNK_ELEMENTS // (max_boxes * max_boxes))
+    for i in range(0, len(pair_frames), chunk):
+        frames = pair_frames[i:i + chunk]
+        start, end = int(frames[0]), int(frames[-1]) + 2
+        m = int(counts[start:end].max())
+        padded, valid = _padded_frames(boxes, offsets, counts, start, end, m)
+        local = frames - start
+        score = link_scores(padded[local], padded[local + 1], valid[local], valid[local + 1],
+                            iou_threshold, max_distance)
+        hit, rows, cols = greedy_pairs(score)
+        t = frames[hit]
+        succ[offsets[t] + rows] = offsets[t + 1] + cols
+    return succ
+
+
+def build_camera_tracks(cam, iou_threshold=DEFAULT_IOU_THRESHOLD, max_distance=DEFAULT_MAX_DISTANCE):
+    with span("build_tracks"):
+        offsets = np.asarray(cam.offsets, dtype=np.int64)
+        offsets = offsets - offsets[0] if len(offsets) else np.zeros(1, dtype=np.int64)
+        n_boxes = int(offsets[-1])
+        succ = link_boxes(cam, iou_threshold, max_distance)
+
+        # 每个框的前驱；没有前驱的框是轨迹起点。指针倍增求每个框所在轨迹的起点
+        pred = np.full(n_boxes, -1, dtype=np.int64)
+        linked = np.flatnonzero(succ >= 0)
+        pred[succ[linked]] = linked
+        head = np.where(pred < 0, np.arange(n_boxes), pred)
+        while True:
+            next_head = head[head]
+            if np.array_equal(next_head, head):
+                break
+            head = next_head
+        # 框按帧号顺序存放，起点下标递增即轨迹按起始帧排序
+        starts = np.flatnonzero(pred < 0)
+        box_track = np.searchsorted(starts, head).astype(np.int32)
+
+        box_frame = np.repeat(np.arange(1, len(offsets), dtype=np.int32), np.diff(offsets))
+        order = np.argsort(box_track, kind="stable")
+        track_offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(box_track, minlength=len(starts)), out=track_offsets[1:])
+        track_boxes = np.asarray(cam.all_boxes(), dtype=np.int32)[order]
+        return CameraTracks(offsets, box_track, track_offsets, box_frame[order], track_boxes)
+
+
+def tracks_path_for(path):
+    # JSON 或其 .store 目录 -> 同名的 .tracks 目录
+    return os.path.splitext(os.path.normpath(path))[0] + TRACKS_SUFFIX
+
+
+def _params(iou_threshold, max_distance):
+    return {"iou": float(iou_threshold), "max_distance": float(max_distance)}
+
+
+def track_index_matches(tracks_dir, source, params):
+    meta_path = os.path.join(tracks_dir, "meta.json")
+    if not source or not os.path.exists(meta_path):
+        return False
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get("version") == TRACKS_VERSION and meta.get("source") == source and meta.get("params") == params
+
+
+def write_track_index(tracks, tracks_dir, source, params):
+    # tracks: {相机: CameraTracks}；先写数组，最后写 meta.json
+    os.makedirs(tracks_dir, exist_ok=True)
+    meta_path = os.path.join(tracks_dir, "meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    parts = {name: [] for name in ("frame_offsets", "box_track", "track_offsets", "track_frames", "track_boxes")}
+    cameras_meta = []
+    frame_base = box_base = track_base = 0
+    for name, t in tracks.items():
+        for key in parts:
+            parts[key].append(np.asarray(getattr(t, key)))
+        n_frames = len(t.frame_offsets) - 1
+        n_boxes = len(t.box_track)
+        cameras_meta.append([name, frame_base, n_frames, box_base, n_boxes, track_base, t.n_tracks])
+        frame_base += n_frames + 1
+        box_base += n_boxes
+        track_base += t.n_tracks + 1
+
+    dtypes = {"frame_offsets": np.int64, "box_track": np.int32, "track_offsets": np.int64,
+              "track_frames": np.int32, "track_boxes": np.int32}
+    for key, arrays in parts.items():
+        if arrays:
+            array = np.concatenate(arrays).astype(dtypes[key], copy=False)
+        else:
+            array = np.zeros((0, 4) if key == "track_boxes" else 0, dtype=dtypes[key])
+        tmp_path = os.path.join(tracks_dir, key + ".npy.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(tracks_dir, key + ".npy"))
+
+    meta = {"version": TRACKS_VERSION, "source": source, "params": params, "cameras": cameras_meta}
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _load_array(path):
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        return np.load(path)
+
+
+def open_track_index(tracks_dir):
+    with span("open_tracks"):
+        with open(os.path.join(tracks_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {key: _load_array(os.path.join(tracks_dir, key + ".npy"))
+                  for key in ("frame_offsets", "box_track", "track_offsets", "track_frames", "track_boxes")}
+        tracks = {}
+        for name, frame_base, n_frames, box_base, n_boxes, track_base, n_tracks in meta["cameras"]:
+            tracks[name] = CameraTracks(
+                arrays["frame_offsets"][frame_base:frame_base + n_frames + 1],
+                arrays["box_track"][box_base:box_base + n_boxes],
+                arrays["track_offsets"][track_base:track_base + n_tracks + 1],
+                arrays["track_frames"][box_base:box_base + n_boxes],
+                arrays["track_boxes"][box_base:box_base + n_boxes])
+        return tracks
+
+
+class TrackCache:
+    def __init__(self, iou_threshold=DEFAULT_IOU_THRESHOLD, max_distance=DEFAULT_MAX_DISTANCE):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        # (id(source), camera_name) -> (source, CameraTracks)
+        self._entries = {}
+        # id(source) -> (source, 源签名, {相机: CameraTracks})，保存的索引与源签名一致时才使用
+        self._indexes = {}
+
+    def get(self, source, camera_name, load=True):
+        # load=False 时只返回已有结果（保存的索引或已算好的），不在 UI 线程中解析/关联
+        if not source or not camera_name:
+            return None
+        key = (id(source), camera_name)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is source:
+            return entry[1]
+
+        tracks = self._saved_tracks(source).get(camera_name)
+        if tracks is None:
+            if not load:
+                return None
+            cam = source.load_camera(camera_name)
+            if cam is None:
+                return None
+            tracks = build_camera_tracks(cam, self.iou_threshold, self.max_distance)
+        self._entries[key] = (source, tracks)
+        return tracks
+
+    def _saved_tracks(self, source):
+        signature = getattr(source, "signature", None)
+        entry = self._indexes.get(id(source))
+        if entry is not None and entry[0] is source and entry[1] == signature:
+            return entry[2]
+        tracks = {}
+        path = getattr(source, "path", None)
+        if path and signature:
+            tracks_dir = tracks_path_for(path)
+            if track_index_matches(tracks_dir, signature, _params(self.iou_threshold, self.max_distance)):
+                try:
+                    tracks = open_track_index(tracks_dir)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Warning: could not open track index {tracks_dir}: {e}")
+        self._indexes[id(source)] = (source, signature, tracks)
+        return tracks
+
+    def invalidate(self, source=None, camera_name=None):
+        for key, (entry_source, _) in list(self._entries.items()):
+            if source is not None and entry_source is not source:
+                continue
+            if camera_name is not None and key[1] != camera_name:
+                continue
+            del self._entries[key]
+        if camera_name is None:
+            for key, (entry_source, _, _) in list(self._indexes.items()):
+                if source is None or entry_source is source:
+                    del self._indexes[key]
+
+
+def _init_worker(store_dir):
+    global _worker_source
+    _worker_source = open_store(store_dir)
+
+
+def _build_task(task):
+    camera_name, iou_threshold, max_distance = task
+    return camera_name, build_camera_tracks(_worker_source[camera_name], iou_threshold, max_distance)
+
+
+def build_track_index(json_path, iou_threshold=DEFAULT_IOU_THRESHOLD, max_distance=DEFAULT_MAX_DISTANCE,
+                      workers=1):
+    # 为一个标注 JSON 建立 .tracks 索引，返回 (目录, 相机数, 轨迹数)
+    source = source_signature(json_path)
+    params = _params(iou_threshold, max_distance)
+    tracks_dir = tracks_path_for(json_path)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 工作进程内存映射 .store；没有新鲜的转换文件时先转换
+        store_dir = prepare_store(json_path, "tracks", temp_dir)
+        names = list(open_store(store_dir))
+        tasks = [(name, iou_threshold, max_distance) for name in names]
+        tracks = {}
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(store_dir,)) as executor:
+                for name, camera_tracks in executor.map(_build_task, tasks):
+                    tracks[name] = camera_tracks
+        else:
+            _init_worker(store_dir)
+            for task in tasks:
+                name, camera_tracks = _build_task(task)
+                tracks[name] = camera_tracks
+        write_track_index(tracks, tracks_dir, source, params)
+    return tracks_dir, len(tracks), sum(t.n_tracks for t in tracks.values())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="为 Old/New 标注建立跨帧轨迹索引")
+    parser.add_argument("json_files", nargs="*", help="标注 JSON（默认 json/annotations_old.json 和 annotations_new.json）")
+    parser.add_argument("--iou", type=float, default=DEFAULT_IOU_THRESHOLD, help="相邻帧配对的 IoU 阈值")
+    parser.add_argument("--max-distance", type=float, default=DEFAULT_MAX_DISTANCE,
+                        help="IoU 不足时允许配对的最大中心点距离（相对框边长），0 表示只按 IoU")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    json_files = args.json_files
+    if not json_files:
+        base_dir = os.getcwd()
+        json_files = [os.path.join(base_dir, "json", "annotations_old.json"),
+                      os.path.join(base_dir, "json", "annotations_new.json")]
+
+    for json_path in json_files:
+        if not os.path.exists(json_path):
+            print(f"Warning: {json_path} not found, skipped.")
+            continue
+        start = time.perf_counter()
+        tracks_dir, n_cameras, n_tracks = build_track_index(json_path, args.iou, args.max_distance, args.workers)
+        print(f"Built {n_tracks} tracks for {n_cameras} cameras: {json_path} -> {tracks_dir} "
+              f"({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
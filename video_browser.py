@@ -0,0 +1,582 @@
+import os
+import time
+import threading
+from collections import deque
+
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QLabel, QTableView,
+                             QHeaderView, QAbstractItemView)
+from PyQt5.QtCore import (Qt, QThread, QTimer, QAbstractTableModel, QModelIndex, QSortFilterProxyModel,
+                          pyqtSignal)
+
+from annotation_store import STORE_SUFFIX
+from compare_annotations import compare_camera
+from video_metadata import scan_metadata, describe
+
+# 本模块的作用：
+# 1. 后台递归扫描视频文件夹（os.scandir，跳过隐藏目录和 .store 目录），按批把相对路径交给列表，
+#    大目录不需要等扫描结束就能浏览
+# 2. VideoListModel + QTableView：只为可见行取数据，几千个视频也能流畅滚动；
+#    上方输入框按名称筛选（包含 * ? 时按通配符匹配）
+# 3. 帧数、Old/New 总框数、不一致率（有框帧中 Old/New 未完全匹配的比例，见 compare_annotations）
+#    在某行第一次被显示（或按该列排序）时才排队计算，由一个后台线程按可见行优先的顺序处理，结果缓存在模型中；
+#    帧数来自元数据缓存（见 video_metadata），标注列按视频文件名查找相机
+# 4. 点击列头按该列排序，未算出的行无论升序降序都排在最后，算出后自动归位，可直接找到不一致最多的视频
+
+VIDEO_EXTENSIONS = (".avi",)
+# 扫描结果每攒够这么多个或每隔这么久交给界面一次
+SCAN_BATCH = 256
+SCAN_EMIT_INTERVAL = 0.2
+# 后台线程每次处理的视频数（标注列 / 帧数列）
+BOX_CHUNK = 8
+FRAME_CHUNK = 64
+
+COLUMNS = ("视频", "帧数", "Old 框", "New 框", "不一致率")
+COL_NAME, COL_FRAMES, COL_OLD, COL_NEW, COL_DISAGREE = range(len(COLUMNS))
+# 排序使用的数据角色：数值列未算出或没有值时为 None（VideoFilterProxy 总是把它排在最后）
+SORT_ROLE = Qt.UserRole
+# 后台计算的两组列
+GROUP_FRAMES = "frames"
+GROUP_BOXES = "boxes"
+
+_PENDING = object()
+# 计算失败（如标注文件正在被改写），清除请求标记，下次显示时重新请求
+_FAILED = object()
+
+
+def scan_video_files(folder, on_batch, is_cancelled=lambda: False):
+    # 深度优先按名称顺序扫描，on_batch(相对路径列表)，路径用 "/" 分隔；返回视频总数
+    total = 0
+    batch = []
+    last_emit = time.perf_counter()
+    stack = [""]
+    while stack and not is_cancelled():
+        rel_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(folder, rel_dir)) as it:
+                entries = sorted(it, key=lambda entry: entry.name.lower())
+        except OSError as e:
+            print(f"Warning: cannot scan {os.path.join(folder, rel_dir)}: {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if not entry.name.endswith(STORE_SUFFIX):
+                    subdirs.append(rel)
+            elif entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                batch.append(rel)
+                # 单个目录中有大量视频时也分批交出，每批插入列表的耗时有上限
+                if len(batch) >= SCAN_BATCH:
+                    on_batch(batch)
+                    total += len(batch)
+                    batch = []
+                    last_emit = time.perf_counter()
+        stack.extend(reversed(subdirs))
+
+        now = time.perf_counter()
+        if batch and now - last_emit >= SCAN_EMIT_INTERVAL:
+            on_batch(batch)
+            total += len(batch)
+            batch = []
+            last_emit = now
+    if batch and not is_cancelled():
+        on_batch(batch)
+        total += len(batch)
+    return total
+
+
+def box_columns(old_source, new_source, camera_name):
+    # (Old 总框数, New 总框数, 不一致率)，两边都没有该相机时返回 None
+    cams = [source.peek_camera(camera_name) if source and camera_name in source else None
+            for source in (old_source, new_source)]
+    if cams[0] is None and cams[1] is None:
+        return None
+    comparison = compare_camera(cams[0], cams[1])
+    annotated = int(((comparison.old_counts > 0) | (comparison.new_counts > 0)).sum())
+    ratio = len(comparison.disagreement_frames) / annotated if annotated else 0.0
+    return comparison.total_old, comparison.total_new, ratio
+
+
+class VideoScanThread(QThread):
+    # (文件夹, 相对路径列表) / (文件夹, 总数)
+    found = pyqtSignal(str, object)
+    done = pyqtSignal(str, int)
+
+    def __init__(self, folder, parent=None):
+        super().__init__(parent)
+        self.folder = folder
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        total = scan_video_files(self.folder, lambda batch: self.found.emit(self.folder, batch),
+                                 lambda: self._cancelled)
+        if not self._cancelled:
+            self.done.emit(self.folder, total)
+
+
+class ColumnWorker(QThread):
+    # (文件夹代号, 标注代号, {(视频, 组): 值})
+    computed = pyqtSignal(int, int, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._queued = set()
+        self._stopped = False
+        self.folder = None
+        self.generation = 0
+        self.sources = (None, None)
+        self.annotation_generation = 0
+
+    def set_folder(self, folder):
+        with self._cond:
+            self.folder = folder
+            self.generation += 1
+            self._queue.clear()
+            self._queued.clear()
+            return self.generation
+
+    def set_sources(self, old_source, new_source):
+        # 标注变化：已排队的标注列按新数据计算，进行中的旧结果会被模型丢弃
+        with self._cond:
+            self.sources = (old_source, new_source)
+            self.annotation_generation += 1
+            return self.annotation_generation
+
+    def request(self, items, urgent=False):
+        # urgent：放到队首（可见行），已在队列中的也提前
+        with self._cond:
+            if urgent:
+                for item in reversed(items):
+                    if item in self._queued:
+                        self._queue.remove(item)
+                    self._queue.appendleft(item)
+                    self._queued.add(item)
+            else:
+                for item in items:
+                    if item not in self._queued:
+                        self._queue.append(item)
+                        self._queued.add(item)
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self.wait()
+
+    def _take_chunk(self):
+        chunk = []
+        n_boxes = 0
+        while self._queue and n_boxes < BOX_CHUNK and len(chunk) < FRAME_CHUNK:
+            item = self._queue.popleft()
+            self._queued.discard(item)
+            chunk.append(item)
+            if item[1] == GROUP_BOXES:
+                n_boxes += 1
+        return chunk
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                chunk = self._take_chunk()
+                folder = self.folder
+                generation = self.generation
+                old_source, new_source = self.sources
+                annotation_generation = self.annotation_generation
+
+            results = {}
+            frames = [video for video, group in chunk if group == GROUP_FRAMES]
+            if frames:
+                try:
+                    metadata = scan_metadata(folder, frames)
+                except Exception as e:
+                    print(f"Error reading video metadata: {e}")
+                    metadata = None
+                for video in frames:
+                    # 打不开的视频记为 None
+                    results[(video, GROUP_FRAMES)] = metadata.get(video) if metadata is not None else _FAILED
+            for video, group in chunk:
+                if group != GROUP_BOXES:
+                    continue
+                try:
+                    results[(video, GROUP_BOXES)] = box_columns(old_source, new_source, os.path.basename(video))
+                except Exception as e:
+                    print(f"Error computing annotation columns for {video}: {e}")
+                    results[(video, GROUP_BOXES)] = _FAILED
+            self.computed.emit(generation, annotation_generation, results)
+
+
+class VideoListModel(QAbstractTableModel):
+    def __init__(self, worker, parent=None):
+        super().__init__(parent)
+        self.worker = worker
+        self.folder = None
+        self.generation = 0
+        self.annotation_generation = 0
+        self.videos = []
+        self.rows = {}
+        # 视频 -> 元数据（打不开为 None）/ 标注列（两边都没有标注为 None）
+        self.metadata = {}
+        self.boxes = {}
+        self.requested = set()
+        self.annotations_ready = False
+        # data() 中产生的请求攒到事件循环空闲时一起发出
+        self._pending = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.timeout.connect(self._flush_requests)
+        self.worker.computed.connect(self.on_computed)
+
+    def set_folder(self, folder):
+        self.beginResetModel()
+        self.folder = folder
+        self.generation = self.worker.set_folder(folder)
+        self.videos = []
+        self.rows = {}
+        self.metadata = {}
+        self.boxes = {}
+        self.requested = set()
+        self._pending = []
+        self.endResetModel()
+
+    def add_videos(self, videos):
+        videos = [video for video in videos if video not in self.rows]
+        if not videos:
+            return
+        start = len(self.videos)
+        self.beginInsertRows(QModelIndex(), start, start + len(videos) - 1)
+        for i, video in enumerate(videos):
+            self.rows[video] = start + i
+        self.videos.extend(videos)
+        self.endInsertRows()
+
+    def set_sources(self, old_source, new_source, camera_names=None):
+        # camera_names 为 None 时所有视频的标注列都重新计算，否则只重算这些相机
+        self.annotations_ready = bool(old_source or new_source)
+        self.annotation_generation = self.worker.set_sources(old_source, new_source)
+        for video in list(self.boxes):
+            if camera_names is None or os.path.basename(video) in camera_names:
+                del self.boxes[video]
+        self.requested = {item for item in self.requested if item[1] != GROUP_BOXES}
+        if self.videos:
+            self.dataChanged.emit(self.index(0, COL_OLD), self.index(len(self.videos) - 1, COL_DISAGREE))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.videos)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        video = self.videos[index.row()]
+        column = index.column()
+        if column == COL_NAME:
+            if role in (Qt.DisplayRole, SORT_ROLE):
+                return video
+            if role == Qt.ToolTipRole:
+                meta = self.metadata.get(video)
+                return f"{video}\n{describe(meta)}" if meta else video
+            return None
+
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role not in (Qt.DisplayRole, SORT_ROLE):
+            return None
+        value = self._value(video, column)
+        if role == SORT_ROLE:
+            return None if value is _PENDING or value is None else float(value)
+        if value is _PENDING:
+            return "…"
+        if value is None:
+            return "-"
+        return f"{value:.1%}" if column == COL_DISAGREE else str(value)
+
+    def _value(self, video, column):
+        if column == COL_FRAMES:
+            if video not in self.metadata:
+                self._request(video, GROUP_FRAMES)
+                return _PENDING
+            meta = self.metadata[video]
+            return meta["frame_count"] if meta else None
+
+        if not self.annotations_ready:
+            return None
+        if video not in self.boxes:
+            self._request(video, GROUP_BOXES)
+            return _PENDING
+        values = self.boxes[video]
+        return values[column - COL_OLD] if values else None
+
+    def _request(self, video, group):
+        item = (video, group)
+        if item in self.requested:
+            return
+        self.requested.add(item)
+        self._pending.append(item)
+        self._flush_timer.start(0)
+
+    def _flush_requests(self):
+        pending, self._pending = self._pending, []
+        if pending:
+            self.worker.request(pending)
+
+    def prioritize(self, videos):
+        # 可见行中仍在排队的项提前处理
+        items = [item for video in videos for item in ((video, GROUP_FRAMES), (video, GROUP_BOXES))
+                 if item in self.requested]
+        if items:
+            self.worker.request(items, urgent=True)
+
+    def on_computed(self, generation, annotation_generation, results):
+        if generation != self.generation:
+            return
+        rows = []
+        for (video, group), value in results.items():
+            if group == GROUP_BOXES and annotation_generation != self.annotation_generation:
+                continue
+            if (video, group) not in self.requested:
+                continue
+            self.requested.discard((video, group))
+            if value is _FAILED:
+                continue
+            if group == GROUP_FRAMES:
+                self.metadata[video] = value
+            else:
+                self.boxes[video] = value
+            rows.append(self.rows[video])
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), COL_FRAMES), self.index(max(rows), COL_DISAGREE))
+
+
+class VideoFilterProxy(QSortFilterProxyModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSortRole(SORT_ROLE)
+        self.setFilterKeyColumn(COL_NAME)
+        self.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.setDynamicSortFilter(True)
+
+    def lessThan(self, left, right):
+        # 没有值的行排在最后：降序时视图会反转比较结果，所以按当前排序方向返回
+        model = self.sourceModel()
+        a = model.data(left, SORT_ROLE)
+        b = model.data(right, SORT_ROLE)
+        if a is None or b is None:
+            if a is None and b is None:
+                return False
+            return (a is None) == (self.sortOrder() == Qt.DescendingOrder)
+        return a < b
+
+    def set_filter_text(self, text):
+        text = text.strip()
+        if any(ch in text for ch in "*?"):
+            self.setFilterWildcard(text)
+        else:
+            self.setFilterFixedString(text)
+
+
+class VideoBrowser(QWidget):
+    # 用户选中的视频（相对路径）
+    video_activated = pyqtSignal(str)
+    # 扫描结束（文件夹, 视频总数）
+    scan_finished = pyqtSignal(str, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.folder = None
+        self.scan_thread = None
+        # 第一批扫描结果到达后选中第一行
+        self._select_first = False
+        # 扫描结果先进入缓冲，每次事件循环最多插入 SCAN_BATCH 行（排序模型插入的耗时与行数成正比）
+        self._incoming = deque()
+        self._scan_total = None
+        self._insert_timer = QTimer(self)
+        self._insert_timer.setSingleShot(True)
+        self._insert_timer.timeout.connect(self._insert_pending)
+        self.worker = ColumnWorker(self)
+        self.worker.start()
+        self.model = VideoListModel(self.worker, self)
+        self.proxy = VideoFilterProxy(self)
+        self.proxy.setSourceModel(self.model)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        filter_layout = QHBoxLayout()
+        self.input_filter = QLineEdit()
+        self.input_filter.setPlaceholderText("筛选 (Filter)，如 Camera1 或 */Camera1-*")
+        self.input_filter.textChanged.connect(self.on_filter_changed)
+        filter_layout.addWidget(self.input_filter)
+        self.label_count = QLabel("")
+        filter_layout.addWidget(self.label_count)
+        layout.addLayout(filter_layout)
+
+        self.view = QTableView()
+        self.view.setModel(self.proxy)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setWordWrap(False)
+        self.view.verticalHeader().hide()
+        # 固定行高：不需要为每行测量内容
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.view.verticalHeader().setDefaultSectionSize(self.view.fontMetrics().height() + 6)
+        header = self.view.horizontalHeader()
+        # 数值列固定宽度：ResizeToContents 会为所有行取数据，使按需计算失效
+        header.setSectionResizeMode(COL_NAME, QHeaderView.Stretch)
+        for column in range(COL_FRAMES, len(COLUMNS)):
+            header.setSectionResizeMode(column, QHeaderView.Interactive)
+            header.resizeSection(column, header.fontMetrics().horizontalAdvance("0000000") + 16)
+        self.view.setSortingEnabled(True)
+        self.view.sortByColumn(COL_NAME, Qt.AscendingOrder)
+        self.view.selectionModel().currentRowChanged.connect(self.on_current_row_changed)
+        layout.addWidget(self.view)
+
+        # 滚动/筛选/排序后，可见行中排队的列提前计算
+        self._visible_timer = QTimer(self)
+        self._visible_timer.setSingleShot(True)
+        self._visible_timer.timeout.connect(self.prioritize_visible)
+        self.view.verticalScrollBar().valueChanged.connect(lambda _: self._visible_timer.start(50))
+        self.proxy.layoutChanged.connect(lambda: self._visible_timer.start(50))
+        self.model.rowsInserted.connect(self.update_count)
+        self.proxy.rowsInserted.connect(self.update_count)
+        self.proxy.rowsRemoved.connect(self.update_count)
+        self.proxy.modelReset.connect(self.update_count)
+
+    def set_folder(self, folder, select_first=False):
+        if self.scan_thread is not None:
+            self.scan_thread.cancel()
+        self.folder = folder
+        self._select_first = select_first
+        self._incoming.clear()
+        self._scan_total = None
+        self.model.set_folder(folder)
+        self.scan_thread = VideoScanThread(folder, self)
+        self.scan_thread.found.connect(self.on_videos_found)
+        self.scan_thread.done.connect(self.on_scan_done)
+        self.scan_thread.start()
+        self.update_count()
+
+    def on_videos_found(self, folder, videos):
+        if folder != self.folder:
+            return
+        self._incoming.extend(videos)
+        if not self._insert_timer.isActive():
+            self._insert_timer.start(0)
+
+    def _insert_pending(self):
+        n = min(SCAN_BATCH, len(self._incoming))
+        self.model.add_videos([self._incoming.popleft() for _ in range(n)])
+        if self._select_first and self.proxy.rowCount() > 0:
+            self._select_first = False
+            self.select_first()
+        if self._incoming:
+            self._insert_timer.start(0)
+        elif self._scan_total is not None:
+            self._finish_scan()
+
+    def on_scan_done(self, folder, total):
+        if folder != self.folder:
+            return
+        self.scan_thread = None
+        self._scan_total = total
+        if not self._incoming:
+            self._finish_scan()
+
+    def _finish_scan(self):
+        total, self._scan_total = self._scan_total, None
+        self.update_count()
+        self.scan_finished.emit(self.folder, total)
+
+    def set_sources(self, old_source, new_source, camera_names=None):
+        self.model.set_sources(old_source, new_source, camera_names)
+
+    def videos(self):
+        return list(self.model.videos)
+
+    def metadata_for(self, video_path):
+        if not self.folder:
+            return None
+        video = os.path.relpath(video_path, self.folder).replace(os.sep, "/")
+        return self.model.metadata.get(video)
+
+    def select_video(self, video):
+        # 选中并激活某个视频（被筛选掉时返回 False）
+        row = self.model.rows.get(video)
+        if row is None:
+            return False
+        index = self.proxy.mapFromSource(self.model.index(row, COL_NAME))
+        if not index.isValid():
+            return False
+        self.view.setCurrentIndex(index)
+        self.view.scrollTo(index)
+        return True
+
+    def select_first(self):
+        if self.proxy.rowCount() > 0:
+            self.view.setCurrentIndex(self.proxy.index(0, COL_NAME))
+
+    def current_video(self):
+        index = self.view.currentIndex()
+        if not index.isValid():
+            return None
+        return self.model.videos[self.proxy.mapToSource(index).row()]
+
+    def on_current_row_changed(self, current, previous):
+        if current.isValid():
+            self.video_activated.emit(self.model.videos[self.proxy.mapToSource(current).row()])
+
+    def on_filter_changed(self, text):
+        self.proxy.set_filter_text(text)
+        current = self.view.currentIndex()
+        if current.isValid():
+            self.view.scrollTo(current)
+        self._visible_timer.start(50)
+
+    def prioritize_visible(self):
+        viewport = self.view.viewport()
+        first = self.view.rowAt(0)
+        if first < 0:
+            return
+        last = self.view.rowAt(viewport.height() - 1)
+        if last < 0:
+            last = self.proxy.rowCount() - 1
+        videos = [self.model.videos[self.proxy.mapToSource(self.proxy.index(row, COL_NAME)).row()]
+                  for row in range(first, last + 1)]
+        self.model.prioritize(videos)
+
+    def update_count(self, *args):
+        total = len(self.model.videos)
+        shown = self.proxy.rowCount()
+        text = f"{shown}/{total}" if shown != total else f"{total}"
+        if self.scan_thread is not None:
+            text += " 扫描中..."
+        self.label_count.setText(text)
+
+    def shutdown(self):
+        if self.scan_thread is not None:
+            self.scan_thread.cancel()
+            self.scan_thread.wait()
+        self.worker.stop()
@@ -0,0 +1,126 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from seek_index import load_seek_index
+from sidecar_cache import folder_cache_paths, read_cache_file, write_cache_file
+
+# 本模块的作用：
+# 1. 缓存视频元数据（帧数、FPS、分辨率、编码、时长），按文件名保存在视频文件夹的
+#    .quickcheck/metadata.json 中，每条记录与视频的 size/mtime 绑定
+# 2. 首次扫描时用线程池并行打开缺失/过期的视频（VideoCapture 打开时释放 GIL），之后的扫描只需 stat
+# 3. 容器头里的帧数看起来不对（<= 0 或小于标注中的最大帧号）时，用 seek 索引校验并修正
+
+METADATA_VERSION = 1
+METADATA_FILE = "metadata.json"
+DEFAULT_WORKERS = 8
+
+_cache_lock = threading.Lock()
+
+
+def _fourcc_to_str(value):
+    value = int(value)
+    return "".join(chr((value >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00 ")
+
+
+def probe_video(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return None
+    try:
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        return {
+            "frame_count": frame_count,
+            "fps": fps,
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "codec": _fourcc_to_str(cap.get(cv2.CAP_PROP_FOURCC)),
+            "duration": frame_count / fps if fps > 0 else 0.0,
+            "verified": False,
+        }
+    finally:
+        cap.release()
+
+
+def _file_key(video_path):
+    st = os.stat(video_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def load_metadata_cache(folder):
+    cached = read_cache_file(folder_cache_paths(folder, METADATA_FILE))
+    if not cached or cached.get("version") != METADATA_VERSION:
+        return {}
+    return cached.get("videos", {})
+
+
+def save_metadata_cache(folder, videos):
+    write_cache_file(folder_cache_paths(folder, METADATA_FILE), {"version": METADATA_VERSION, "videos": videos})
+
+
+def scan_metadata(folder, video_files, workers=DEFAULT_WORKERS):
+    # 返回 {文件名: 元数据}；打不开的视频不在结果中
+    with _cache_lock:
+        cached = load_metadata_cache(folder)
+
+    result = {}
+    entries = dict(cached)
+    missing = []
+    for name in video_files:
+        path = os.path.join(folder, name)
+        try:
+            key = _file_key(path)
+        except OSError:
+            continue
+        entry = cached.get(name)
+        if entry is not None and entry.get("file") == key:
+            result[name] = entry["meta"]
+        else:
+            missing.append((name, key))
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            probed = executor.map(lambda item: probe_video(os.path.join(folder, item[0])), missing)
+            for (name, key), meta in zip(missing, probed):
+                if meta is None:
+                    continue
+                result[name] = meta
+                entries[name] = {"file": key, "meta": meta}
+        with _cache_lock:
+            save_metadata_cache(folder, entries)
+    return result
+
+
+def verify_frame_count(folder, name, meta, max_annotation_frame=0):
+    # 帧数看起来不对时用 seek 索引校验，返回（可能被修正的）元数据
+    if meta.get("verified") or (meta["frame_count"] > 0 and max_annotation_frame <= meta["frame_count"]):
+        return meta
+
+    video_path = os.path.join(folder, name)
+    index = load_seek_index(video_path)
+    if index.frame_count != meta["frame_count"]:
+        print(f"Warning: frame count of {name} corrected: {meta['frame_count']} -> {index.frame_count}")
+    meta = dict(meta, frame_count=index.frame_count, verified=True)
+    if meta["fps"] > 0:
+        meta["duration"] = meta["frame_count"] / meta["fps"]
+    if max_annotation_frame > meta["frame_count"]:
+        print(f"Warning: annotations of {name} reach frame {max_annotation_frame}, "
+              f"but the video has {meta['frame_count']} frames")
+
+    with _cache_lock:
+        entries = load_metadata_cache(folder)
+        try:
+            entries[name] = {"file": _file_key(video_path), "meta": meta}
+        except OSError:
+            return meta
+        save_metadata_cache(folder, entries)
+    return meta
+
+
+def describe(meta):
+    # 下拉框提示文字
+    return (f"{meta['frame_count']} 帧, {meta['fps']:.2f} fps, {meta['width']}x{meta['height']}, "
+            f"{meta['codec'] or '?'}, {meta['duration']:.1f}s")